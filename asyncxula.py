@@ -0,0 +1,107 @@
+# asyncio front end for the XuLA class.
+# Each board gets its own single-thread executor, so any number of coroutines
+# can share a board while its USB traffic stays serialized.
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from xula import XuLA, STAT_REG
+
+class AsyncXuLA:
+    """
+    Async wrapper around a XuLA board.
+
+        x = await AsyncXuLA.open()
+        await x.load(BitFile("design.bit"))
+        stat = await x.status()
+
+    Register reads (status(), rdreg()) queued by concurrent coroutines are
+    merged into one rdregs() call, so they share a single CFG_IN/CFG_OUT
+    round trip.
+    """
+    def __init__(self, xula, executor = None):
+        self.x = xula
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "xula")
+        self.executor = executor
+        self.pending = []       # (reg, future) waiting for the next register batch
+        self.flusher = None     # task draining self.pending
+        self.batches = 0        # number of merged register reads issued
+
+    @classmethod
+    async def open(cls, *args, **kw):
+        """Connect to a board from the executor thread that will own it."""
+        executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "xula")
+        loop = asyncio.get_running_loop()
+        x = await loop.run_in_executor(executor, functools.partial(XuLA, *args, **kw))
+        return cls(x, executor)
+
+    async def run(self, fn, *args, **kw):
+        """Run a blocking XuLA call on the board's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kw))
+
+    async def close(self):
+        if self.flusher is not None:
+            await self.flusher
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+        return False
+
+    async def load(self, bs, verify = False, mask = None):
+        return await self.run(self.x.load, bs, verify, mask)
+
+    async def write_flash(self, bs, loAddr, doStart):
+        return await self.run(self.x.write_flash, bs, loAddr, doStart)
+
+    async def read_flash(self, filename, loAddr, hiAddr, doStart):
+        return await self.run(self.x.read_flash, filename, loAddr, hiAddr, doStart)
+
+    async def hostio(self, id, payload, resplen, recv = False):
+        return await self.run(self.x.hostio, id, payload, resplen, recv)
+
+    async def idcode(self):
+        return await self.run(self.x.idcode)
+
+    async def usercode(self):
+        return await self.run(self.x.usercode)
+
+    async def rdreg(self, reg):
+        """Read a configuration register, batched with other pending reads."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.pending.append((reg, fut))
+        if self.flusher is None:
+            self.flusher = loop.create_task(self.flush())
+        return await fut
+
+    async def status(self):
+        """Return the STAT register value."""
+        return await self.rdreg(STAT_REG)
+
+    async def flush(self):
+        # let the other coroutines scheduled in this loop iteration queue up first
+        await asyncio.sleep(0)
+        try:
+            while self.pending:
+                batch = self.pending
+                self.pending = []
+                try:
+                    values = await self.run(self.x.rdregs, [reg for (reg, fut) in batch])
+                except Exception as X:
+                    for (reg, fut) in batch:
+                        if not fut.done():
+                            fut.set_exception(X)
+                    continue
+                self.batches += 1
+                for ((reg, fut), v) in zip(batch, values):
+                    if not fut.done():
+                        fut.set_result(v)
+        finally:
+            self.flusher = None
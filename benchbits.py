@@ -0,0 +1,51 @@
+# Benchmark the bit conversions in bitops.py on megabyte-sized payloads.
+# Compares the pure-Python loops xula.py used to run with the stdlib and
+# (when installed) NumPy backends.
+
+import sys
+import time
+import random
+
+import bitops
+
+def legacy_pack(bits):
+    w256 = [(b << (i & 7)) for (i, b) in enumerate(bits)]
+    return bytes([sum(w256[i:i+8]) for i in range(0, len(w256), 8)])
+
+def legacy_reverse(data):
+    return bytes([bitops.reverse_bits(c) for c in data])
+
+def legacy_unpack(data):
+    r = []
+    for b in data:
+        for j in range(8):
+            r.append((b >> (7 - j)) & 1)
+    return bytes(r)
+
+def timeit(fn, *args):
+    t = time.time()
+    fn(*args)
+    return time.time() - t
+
+def main(nbytes):
+    data = random.Random(0).randbytes(nbytes)
+    bits = bitops.unpackbits(data)
+    rows = [
+        ("reverse", legacy_reverse, (data,), bitops.reverse, (data,)),
+        ("pack", legacy_pack, (bits,), bitops.packbits, (bits,)),
+        ("unpack", legacy_unpack, (data,), bitops.unpackbits, (data, None, "big")),
+    ]
+    backends = ["stdlib"] + (["numpy"] if bitops.numpy is not None else [])
+    print(f"payload {nbytes} bytes, backends: {', '.join(backends)}")
+    print("%-8s %10s" % ("op", "legacy") + "".join(" %10s %8s" % (b, "speedup") for b in backends))
+    for (name, old, oldargs, new, newargs) in rows:
+        t0 = timeit(old, *oldargs)
+        line = "%-8s %9.3fs" % (name, t0)
+        for b in backends:
+            bitops.set_backend(b)
+            t = timeit(new, *newargs)
+            line += " %9.3fs %7.0fx" % (t, t0 / t if t > 0 else float("inf"))
+        print(line)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1 << 20)
@@ -0,0 +1,80 @@
+# Bit packing, unpacking and reversal used by the JTAG transfers.
+# Uses NumPy when it is installed and falls back to the standard library
+# otherwise; both backends return the same bytes.
+#
+# Bit lists are bytes objects holding one 0/1 value per byte. bitorder is
+# 'little' when the first bit goes to bit 0 of the first byte (the order the
+# XuLA firmware shifts bits) and 'big' when it goes to bit 7 (the order of
+# .bit files).
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+lookup = [ 0x00, 0x08, 0x04, 0x0c, 0x02, 0x0a, 0x06, 0x0e,
+           0x01, 0x09, 0x05, 0x0d, 0x03, 0x0b, 0x07, 0x0f ]
+
+def reverse_bits(x):
+    return (lookup[x % 16] << 4) | lookup[x // 16]
+
+# bytes.translate() table that reverses the bit order of every byte
+REVERSE_TABLE = bytes(reverse_bits(i) for i in range(256))
+
+# tables between 0/1 bytes and the ASCII digits used by int()/format()
+_TO_ASCII = bytes(0x30 + (i & 1) for i in range(256))
+_FROM_ASCII = bytes((i - 0x30) & 1 for i in range(256))
+
+backend = "numpy" if numpy is not None else "stdlib"
+
+def set_backend(name):
+    """Select 'numpy' or 'stdlib'; returns the backend in use."""
+    global backend
+    if name == "numpy" and numpy is None:
+        raise ImportError("NumPy is not installed")
+    assert name in ("numpy", "stdlib")
+    backend = name
+    return backend
+
+def reverse(data):
+    """Reverse the bit order of every byte in data."""
+    # bytes.translate is already a C lookup table loop and beats a NumPy
+    # fancy-index lookup, so both backends use it.
+    return bytes(data).translate(REVERSE_TABLE)
+
+def packbits(bits, bitorder = "little"):
+    """Pack a sequence of 0/1 values into bytes, padding the last byte with zeros."""
+    if backend == "numpy":
+        if not isinstance(bits, (bytes, bytearray, memoryview)):
+            bits = bytes(bits)
+        a = numpy.frombuffer(bits, dtype = numpy.uint8)
+        return numpy.packbits(a, bitorder = bitorder).tobytes()
+    bits = bytes(bits)
+    n = len(bits)
+    if n == 0:
+        return b""
+    nbytes = (n + 7) // 8
+    digits = bits.translate(_TO_ASCII)
+    if bitorder == "little":
+        return int(digits[::-1], 2).to_bytes(nbytes, "little")
+    return (int(digits, 2) << (8 * nbytes - n)).to_bytes(nbytes, "big")
+
+def unpackbits(data, n = None, bitorder = "little"):
+    """Unpack the first n bits of data (all of them by default) into a bytes of 0/1 values."""
+    if n is None:
+        n = 8 * len(data)
+    if backend == "numpy":
+        a = numpy.frombuffer(bytes(data), dtype = numpy.uint8)
+        return numpy.unpackbits(a, count = n, bitorder = bitorder).tobytes()
+    if n == 0:
+        return b""
+    nbits = 8 * len(data)
+    if bitorder == "little":
+        digits = format(int.from_bytes(data, "little"), "0%db" % nbits)[::-1]
+    else:
+        digits = format(int.from_bytes(data, "big"), "0%db" % nbits)
+    return digits[:n].encode().translate(_FROM_ASCII)
+
+def int_to_bits(val, n):
+    """Bits of an integer, LSB first, as a bytes of 0/1 values."""
+    return unpackbits(val.to_bytes((n + 7) // 8, "little"), n, "little")
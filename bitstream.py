@@ -3,7 +3,16 @@
 
 import struct
 import array
+import bisect
 import os
+import mmap
+import gzip
+import hashlib
+import lzma
+import queue
+import threading
+
+from bitops import unpackbits, int_to_bits
 
 class Bitstream:
     """
@@ -14,10 +23,7 @@ class Bitstream:
         self.val = val
 
     def __iter__(self):
-        def getbits():
-            for i in range(self.n):
-                yield (self.val >> i) & 1
-        return getbits()
+        return iter(int_to_bits(self.val & ((1 << self.n) - 1), self.n))
 
     def __len__(self):
         return self.n
@@ -30,14 +36,8 @@ class BitstreamHex:
         self.s = s
 
     def __iter__(self):
-        def getbits():
-            for hd in self.s:
-                b = int(hd, 16)
-                yield (b >> 3) & 1
-                yield (b >> 2) & 1
-                yield (b >> 1) & 1
-                yield (b >> 0) & 1
-        return getbits()
+        s = self.s + "0" * (len(self.s) % 2)
+        return iter(unpackbits(bytes.fromhex(s), len(self), "big"))
 
     def __len__(self):
         return len(self.s) * 4
@@ -50,17 +50,7 @@ class BitstreamString:
         self.s = array.array('B', s)
 
     def __iter__(self):
-        def getbits():
-            for b in self.s:
-                yield (b >> 7) & 1
-                yield (b >> 6) & 1
-                yield (b >> 5) & 1
-                yield (b >> 4) & 1
-                yield (b >> 3) & 1
-                yield (b >> 2) & 1
-                yield (b >> 1) & 1
-                yield (b >> 0) & 1
-        return getbits()
+        return iter(unpackbits(self.s.tobytes(), bitorder = "big"))
 
     def __len__(self):
         return len(self.s) * 8
@@ -68,9 +58,723 @@ class BitstreamString:
     def tobytes(self):
         return self.s.tobytes()
 
+class PaddedBitstream:
+    """
+    Bitstream wrapped with pre and post fill bits, used to pad a scan
+    with the BYPASS bits of the other devices on the chain.
+    """
+    def __init__(self, bs, pre, post, fill = 0):
+        self.bs = bs
+        self.pre = pre
+        self.post = post
+        self.fill = fill
+
+    def __iter__(self):
+        def getbits():
+            for i in range(self.pre):
+                yield self.fill
+            for b in self.bs:
+                yield b
+            for i in range(self.post):
+                yield self.fill
+        return getbits()
+
+    def __len__(self):
+        return self.pre + len(self.bs) + self.post
+
+    def tobytes(self):
+        n = len(self)
+        nbytes = (n + 7) // 8
+        inner = self.bs.tobytes()
+        ninner = len(self.bs)
+        v = int.from_bytes(inner, 'big') >> (8 * len(inner) - ninner)
+        if self.fill:
+            v |= ((1 << self.pre) - 1) << ninner
+            v = (v << self.post) | ((1 << self.post) - 1)
+        else:
+            v <<= self.post
+        return (v << (8 * nbytes - n)).to_bytes(nbytes, 'big')
+
+def padbits(bs, pre, post, fill = 0):
+    """Return bs with pre leading and post trailing fill bits."""
+    if pre == 0 and post == 0:
+        return bs
+    if isinstance(bs, Bitstream):
+        ones = lambda k: ((1 << k) - 1) if fill else 0
+        return Bitstream(pre + bs.n + post,
+                         ones(pre) | (bs.val << pre) | (ones(post) << (pre + bs.n)))
+    return PaddedBitstream(bs, pre, post, fill)
+
+# Spartan-3A configuration registers, see ug332 Table 5-13.
+
+CRC_REG       = 0x00
+FAR_MAJ_REG   = 0x01
+FAR_MIN_REG   = 0x02
+FDRI_REG      = 0x03
+FDRO_REG      = 0x04
+CMD_REG       = 0x05
+CTL_REG       = 0x06
+MASK_REG      = 0x07
+STAT_REG      = 0x08
+LOUT_REG      = 0x09
+COR1_REG      = 0x0a
+COR2_REG      = 0x0b
+PWRDN_REG     = 0x0c
+FLR_REG       = 0x0d
+IDCODE_REG    = 0x0e
+CWDT_REG      = 0x0f
+HC_OPT_REG    = 0x10
+CSBO_REG      = 0x12
+GENERAL1_REG  = 0x13
+GENERAL2_REG  = 0x14
+MODE_REG      = 0x15
+PU_GWE_REG    = 0x16
+PU_GTS_REG    = 0x17
+MFWR_REG      = 0x18
+CCLK_FREQ_REG = 0x19
+SEU_OPT_REG   = 0x1a
+EXP_SIGN_REG  = 0x1b
+RDBK_SIGN_REG = 0x1c
+
+# Commands written to the CMD register.
+
+CMD_NULL     = 0x00
+CMD_WCFG     = 0x01
+CMD_MFW      = 0x02
+CMD_LFRM     = 0x03
+CMD_RCFG     = 0x04
+CMD_START    = 0x05
+CMD_RCAP     = 0x06
+CMD_RCRC     = 0x07
+CMD_AGHIGH   = 0x08
+CMD_SWITCH   = 0x09
+CMD_GRESTORE = 0x0a
+CMD_SHUTDOWN = 0x0b
+CMD_GCAPTURE = 0x0c
+CMD_DESYNC   = 0x0d
+CMD_REBOOT   = 0x0e
+
+# Startup clock selection, COR1 bits 1:0 (ug332 Table 5-14). Bitstreams
+# loaded through JTAG need the JTAG clock; flash images need CCLK.
+
+COR1_SSCLKSRC = 0x0003
+SSCLK_CCLK    = 0
+SSCLK_USERCLK = 1
+SSCLK_JTAGCLK = 2
+
+SSCLK_NAMES = { SSCLK_CCLK: "CCLK", SSCLK_USERCLK: "UserClk", SSCLK_JTAGCLK: "JtagClk", 3: "JtagClk" }
+
+SYNC_WORD = 0xaa99
+NOOP_WORD = 0x2000
+
+OP_READ  = 1
+OP_WRITE = 2
+
+# Register names, as used by the decoded register dumps.
+
+REGISTER_NAMES = {
+    CRC_REG: "CRC", FAR_MAJ_REG: "FAR_MAJ", FAR_MIN_REG: "FAR_MIN", FDRI_REG: "FDRI",
+    FDRO_REG: "FDRO", CMD_REG: "CMD", CTL_REG: "CTL", MASK_REG: "MASK", STAT_REG: "STAT",
+    LOUT_REG: "LOUT", COR1_REG: "COR1", COR2_REG: "COR2", PWRDN_REG: "PWRDN",
+    FLR_REG: "FLR", IDCODE_REG: "IDCODE", CWDT_REG: "CWDT", HC_OPT_REG: "HC_OPT",
+    CSBO_REG: "CSBO", GENERAL1_REG: "GENERAL1", GENERAL2_REG: "GENERAL2",
+    MODE_REG: "MODE", PU_GWE_REG: "PU_GWE", PU_GTS_REG: "PU_GTS", MFWR_REG: "MFWR",
+    CCLK_FREQ_REG: "CCLK_FREQ", SEU_OPT_REG: "SEU_OPT", EXP_SIGN_REG: "EXP_SIGN",
+    RDBK_SIGN_REG: "RDBK_SIGN",
+}
+
+def packet_header(op, reg, cnt):
+    """Type 1 packet header for a Configuration Control Logic operation (ug332 page 323)."""
+    assert op in (OP_READ, OP_WRITE)
+    assert 0 <= reg < 64
+    assert 0 <= cnt < 32
+    return (1 << 13) | (op << 11) | (reg << 5) | cnt
+
+class ConfigPackets:
+    """
+    Builder for a configuration packet stream, packed straight into
+    big-endian bytes as it is built:
+
+        p = ConfigPackets().sync().read(STAT_REG).noop(2)
+        x.cfgin(p)
+
+    Reads and writes of 32 words or more use a type 2 packet.
+    """
+    def __init__(self):
+        self.buf = bytearray()
+
+    def __len__(self):
+        return len(self.buf)
+
+    def words(self, *words):
+        self.buf += struct.pack(">%dH" % len(words), *words)
+        return self
+
+    def sync(self):
+        return self.words(SYNC_WORD, NOOP_WORD)
+
+    def noop(self, n = 1):
+        return self.words(*([NOOP_WORD] * n))
+
+    def header(self, op, reg, cnt):
+        if cnt < 32:
+            return self.words(packet_header(op, reg, cnt))
+        return self.words(packet_header(op, reg, 0), (2 << 13) | (op << 11), cnt >> 16, cnt & 0xffff)
+
+    def read(self, reg, cnt = 1):
+        return self.header(OP_READ, reg, cnt)
+
+    def write(self, reg, *values):
+        self.header(OP_WRITE, reg, len(values))
+        return self.words(*values)
+
+    def command(self, cmd):
+        return self.write(CMD_REG, cmd)
+
+    def far(self, far):
+        """Write FAR_MAJ and FAR_MIN with one packet."""
+        return self.write(FAR_MAJ_REG, (far >> 16) & 0xffff, far & 0xffff)
+
+    def frames(self, *parts):
+        """Write the frame data in parts (big-endian bytes) to FDRI with one packet."""
+        self.header(OP_WRITE, FDRI_REG, sum(len(d) for d in parts) // 2)
+        for d in parts:
+            self.buf += d
+        return self
+
+    def tobytes(self):
+        return bytes(self.buf)
+
+def config_packets(data):
+    """
+    Walk the configuration packet stream in data (bytes holding big-endian
+    16-bit words) and yield (op, reg, offset, count) for each packet after
+    the sync word. offset and count are in 16-bit words from the start of data.
+    """
+    nwords = len(data) // 2
+    # only the packet headers are decoded, so read the words in place
+    # rather than byteswapping a copy of the whole stream
+    mv = memoryview(data)
+    word = lambda i: (mv[2 * i] << 8) | mv[2 * i + 1]
+    i = 0
+    while i < nwords and word(i) != SYNC_WORD:
+        i += 1
+    i += 1
+    if i < nwords and word(i) == 0x5566:
+        # second half of the 32-bit sync word used by some bitgen versions
+        i += 1
+    reg = None
+    while i < nwords:
+        h = word(i)
+        ty = h >> 13
+        op = (h >> 11) & 3
+        i += 1
+        if ty == 1:
+            reg = (h >> 5) & 0x3f
+            cnt = h & 0x1f
+        elif ty == 2:
+            if i + 2 > nwords:
+                break
+            cnt = (word(i) << 16) | word(i + 1)
+            i += 2
+        else:
+            # anything else is padding or an unsupported packet: stop here
+            break
+        if op and reg is not None:
+            yield (op, reg, i, cnt)
+        if op == OP_WRITE:
+            i += cnt
+
+class ConfigImage:
+    """
+    Configuration frames and register writes decoded from the data
+    section of a .bit file.
+
+    A bitstream may write frame data more than once, each time after its
+    own FAR write (the block RAM contents usually follow the CLB frames
+    that way). Every FDRI write is kept in fdri; the frames are numbered
+    across all of them in file order, leaving out the pad frame that ends
+    each write.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.regs = {}          # last value written to each register
+        self.frameWords = None  # frame length in 16-bit words
+        self.fdri = []          # (far, byte offset, word count) of each FDRI write
+        for (op, reg, offset, cnt) in config_packets(data):
+            if op != OP_WRITE:
+                continue
+            if reg == FDRI_REG:
+                if cnt:
+                    far = (self.regs.get(FAR_MAJ_REG, 0) << 16) | self.regs.get(FAR_MIN_REG, 0)
+                    self.fdri.append((far, offset * 2, cnt))
+            elif reg == FAR_MAJ_REG and cnt == 2:
+                # FAR_MAJ and FAR_MIN written by one packet
+                self.regs[FAR_MAJ_REG] = int.from_bytes(data[offset * 2:offset * 2 + 2], 'big')
+                self.regs[FAR_MIN_REG] = int.from_bytes(data[offset * 2 + 2:offset * 2 + 4], 'big')
+            elif 0 < cnt <= 2:
+                # IDCODE is the only 32-bit register, everything else is one word
+                self.regs[reg] = int.from_bytes(data[offset * 2:(offset + cnt) * 2], 'big')
+        if FLR_REG in self.regs:
+            self.frameWords = self.regs[FLR_REG] + 1
+        self.blocks = []        # (first frame, frame count, far, byte offset) of each FDRI write
+        self.starts = []        # first frame of each FDRI write
+        first = 0
+        for (far, offset, words) in self.fdri if self.frameWords else []:
+            count = words // self.frameWords - 1
+            if count <= 0:
+                continue        # nothing but a pad frame
+            self.blocks.append((first, count, far, offset))
+            self.starts.append(first)
+            first += count
+
+    def __len__(self):
+        """Number of frames in all FDRI writes, not counting their pad frames."""
+        return sum(count for (first, count, far, offset) in self.blocks)
+
+    def layout(self):
+        """(far, frame count) of each FDRI write; images with the same layout write the same frames."""
+        return [(far, count) for (first, count, far, offset) in self.blocks]
+
+    def frameBytes(self):
+        return 2 * self.frameWords
+
+    def block(self, i):
+        """(first frame, frame count, far, byte offset) of the FDRI write holding frame i."""
+        return self.blocks[bisect.bisect_right(self.starts, i) - 1]
+
+    def frames(self, first, count = 1):
+        """Frames first to first + count - 1, which must be in the same FDRI write."""
+        (start, n, far, offset) = self.block(first)
+        assert start <= first and first + count <= start + n, "frames span two FDRI writes"
+        size = self.frameBytes()
+        offset += (first - start) * size
+        return memoryview(self.data)[offset:offset + count * size]
+
+    def frame(self, i):
+        return self.frames(i)
+
+def diff_frames(old, new, mask = None):
+    """
+    Return the indexes of the frames that differ between two ConfigImages
+    with the same layout; bits set in the mask image are ignored.
+    """
+    assert old.frameWords == new.frameWords and old.layout() == new.layout()
+    changed = []
+    for i in range(len(new)):
+        a = old.frame(i)
+        b = new.frame(i)
+        if a == b:
+            continue
+        if mask is not None:
+            diff = int.from_bytes(a, "big") ^ int.from_bytes(b, "big")
+            if diff & ~int.from_bytes(mask.frame(i), "big") == 0:
+                continue
+        changed.append(i)
+    return changed
+
+def frame_runs(frames, gap = 1, starts = ()):
+    """
+    Group sorted frame indexes into (start, count) runs. Runs separated by
+    at most gap unchanged frames are merged, since every run costs a pad
+    frame and a few packet headers on top of its data. A run never crosses
+    one of starts, the first frames of the FDRI writes (ConfigImage.starts),
+    since FAR does not step from one write to the next.
+    """
+    runs = []
+    for i in frames:
+        if (runs and i - (runs[-1][0] + runs[-1][1]) <= gap and
+                not any(runs[-1][0] < s <= i for s in starts)):
+            runs[-1][1] = i - runs[-1][0] + 1
+        else:
+            runs.append([i, 1])
+    return [tuple(r) for r in runs]
+
+class FrameMap:
+    """
+    Frame address (FAR_MAJ << 16 | FAR_MIN) of every configuration frame,
+    in the order the frames appear in the FDRI data of a full bitstream.
+    """
+    def __init__(self, fars):
+        self.fars = list(fars)
+
+    def __len__(self):
+        return len(self.fars)
+
+    def far(self, i):
+        return self.fars[i]
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            for far in self.fars:
+                f.write("%08x\n" % far)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(int(l, 16) for l in f if l.strip())
+
+# Configuration CRC. The Spartan-3A runs a CRC-16 (x^16 + x^15 + x^2 + 1)
+# over every register write: the 16 data bits then the register address,
+# LSB first. Writing the CRC register checks the accumulated value and
+# CMD RCRC clears it. The width of the address field is not documented, so
+# bram_crc_bits() picks the one that reproduces the CRC stored in the file.
+
+CRC_POLY = 0xa001   # x^16 + x^15 + x^2 + 1, bit reversed
+
+def _crc_table(nbits):
+    table = []
+    for v in range(1 << nbits):
+        c = v
+        for k in range(nbits):
+            c = (c >> 1) ^ (CRC_POLY if c & 1 else 0)
+        table.append(c)
+    return table
+
+CRC_TABLE8 = _crc_table(8)
+_crc_tables = {}
+
+def config_crcs(data, abits):
+    """
+    Return (offset, stored, computed) for every write to the CRC register
+    in the configuration data, with offset the word offset of the stored
+    value and computed the CRC of the preceding writes, using abits of
+    register address.
+    """
+    if abits not in _crc_tables:
+        _crc_tables[abits] = _crc_table(abits)
+    ta = _crc_tables[abits]
+    t8 = CRC_TABLE8
+    amask = (1 << abits) - 1
+    mv = memoryview(data)
+    crcs = []
+    crc = 0
+    for (op, reg, offset, cnt) in config_packets(data):
+        if op != OP_WRITE:
+            continue
+        if reg == CRC_REG:
+            if cnt == 1:
+                stored = (mv[2 * offset] << 8) | mv[2 * offset + 1]
+                crcs.append((offset, stored, crc))
+            crc = 0
+            continue
+        a = reg & amask
+        for i in range(2 * offset, 2 * (offset + cnt), 2):
+            crc = (crc >> 8) ^ t8[(crc ^ mv[i + 1]) & 0xff]
+            crc = (crc >> 8) ^ t8[(crc ^ mv[i]) & 0xff]
+            crc = (crc >> abits) ^ ta[(crc ^ a) & amask]
+        if reg == CMD_REG and cnt == 1 and mv[2 * offset + 1] == CMD_RCRC:
+            crc = 0
+    return crcs
+
+def bram_crc_bits(data):
+    """
+    Return the register address width for which the CRC writes in data
+    check out, or None if data holds no CRC write or none of the widths
+    reproduces it (for instance a bitstream made with CRC:Disable).
+    """
+    for abits in (5, 6):
+        crcs = config_crcs(data, abits)
+        if crcs and all(s == c for (o, s, c) in crcs):
+            return abits
+    return None
+
+class BramMap:
+    """
+    Location of the block RAM contents in the frame data, read from the
+    logic allocation file that bitgen -l writes next to the .bit file:
+
+        Bit 1234567 0x00c20000 1234 Block=RAMB16_X0Y0 Ram=B:BIT17
+
+    The first number is the bit offset counted from the first frame data
+    bit (MSB of the first FDRI word). bits[block][n] is the offset of bit n
+    of the RAM, parity[block][n] the offset of parity bit n.
+    """
+    def __init__(self):
+        self.bits = {}
+        self.parity = {}
+
+    @classmethod
+    def load(cls, filename):
+        m = cls()
+        with open(filename) as f:
+            for l in f:
+                fields = l.split()
+                if len(fields) < 2 or fields[0] != "Bit":
+                    continue
+                attrs = dict(a.split("=", 1) for a in fields[2:] if "=" in a)
+                if "Block" not in attrs or "Ram" not in attrs:
+                    continue
+                ram = attrs["Ram"].split(":")[-1]
+                if ram.startswith("PARBIT"):
+                    d = m.parity.setdefault(attrs["Block"], {})
+                    d[int(ram[6:])] = int(fields[1])
+                elif ram.startswith("BIT"):
+                    d = m.bits.setdefault(attrs["Block"], {})
+                    d[int(ram[3:])] = int(fields[1])
+        return m
+
+    def blocks(self):
+        return sorted(self.bits)
+
+def bram_edits(img, brammap, contents, parity = None):
+    """
+    Work out the changes patch_bram() makes to ConfigImage img: returns
+    {byte offset in img.data: (bits to set, bits to clear, frame index)}.
+    Raises ValueError for a bit offset outside the frame data.
+    """
+    fbits = 16 * img.frameWords
+    spans = []      # (first bit, bits, byte offset, first frame) of each FDRI write
+    (bit, frame) = (0, 0)
+    for (far, offset, words) in img.fdri:
+        spans.append((bit, 16 * words, offset, frame))
+        bit += 16 * words
+        frame += max(words // img.frameWords - 1, 0)
+    starts = [sp[0] for sp in spans]
+    edits = {}
+    for (locations, values) in ((brammap.bits, contents), (brammap.parity, parity or {})):
+        for block, value in values.items():
+            for n, offset in locations[block].items():
+                if n // 8 >= len(value):
+                    continue
+                (first, bits, base, frame) = spans[max(bisect.bisect_right(starts, offset) - 1, 0)]
+                k = offset - first
+                # the pad frame ending each FDRI write holds no RAM bits
+                if not 0 <= k < bits - fbits:
+                    raise ValueError(f"bit {n} of {block} is at offset {offset}, outside the frame data")
+                i = base + k // 8
+                b = 0x80 >> (k % 8)
+                (on, off, f) = edits.get(i, (0, 0, frame + k // fbits))
+                if (value[n // 8] >> (n % 8)) & 1:
+                    edits[i] = (on | b, off & ~b, f)
+                else:
+                    edits[i] = (on & ~b, off | b, f)
+    return edits
+
+def patch_bram(filename, brammap, contents, parity = None):
+    """
+    Rewrite the initial contents of block RAMs in .bit file filename in
+    place. contents maps a block name of brammap to its new data, bit n of
+    the RAM being bit n % 8 of byte n // 8 (the INIT_xx bit order); parity
+    does the same for the parity bits. Blocks and bits missing from
+    contents are left alone. The bit offsets of brammap run through the
+    frame data of the FDRI writes in file order, pad frames included.
+
+    The file is patched through mmap and its CRC writes are recomputed.
+    Raises ValueError, before anything is written, for a compressed file,
+    a bit offset outside the frame data or a CRC that cannot be reproduced
+    (the device would reject the patched file). Returns the indexes of the
+    frames that changed; load the file again with BitFile to send it to
+    the device.
+    """
+    bf = BitFile(filename)
+    start, length, compression = bf.dataOffset, bf.fieldLength, bf.compression
+    bf.bit.close()
+    if compression:
+        raise ValueError(f"{filename} is {compression} compressed, decompress it to patch it")
+    with open(filename, "r+b") as f:
+        mm = mmap.mmap(f.fileno(), 0)
+        data = memoryview(mm)[start:start + length]
+        try:
+            img = ConfigImage(data)
+            if not img.fdri or not img.frameWords:
+                raise ValueError(f"{filename} holds no frame data")
+            abits = bram_crc_bits(data)
+            if abits is None and config_crcs(data, 5):
+                raise ValueError(f"{filename}: the CRC in the file cannot be reproduced, not patched")
+            frames = set()
+            for (i, (on, off, frame)) in bram_edits(img, brammap, contents, parity).items():
+                v = (data[i] | on) & ~off
+                if v != data[i]:
+                    data[i] = v
+                    frames.add(frame)
+            if frames and abits is not None:
+                for (offset, stored, crc) in config_crcs(data, abits):
+                    struct.pack_into(">H", data, 2 * offset, crc)
+        finally:
+            # mmap cannot be closed while a view of it is alive
+            img = None
+            data.release()
+            mm.close()
+    return sorted(frames)
+
+class InvalidBitstream(Exception):
+    def __init__(self, msg):
+        self.message = msg
+    def __str__(self):
+        return self.message
+
+def check_packets(name, data, idcode = None, target = "jtag", partial = False):
+    """
+    Check the configuration packets in data, the data section of .bit file
+    name, as described for validate_bitfile(). With partial set data is
+    only the start of the data section, so the length and CRC are not
+    checked. Raises InvalidBitstream, returns a list of warnings.
+    """
+    assert target in ("jtag", "flash")
+    warnings = []
+    nwords = len(data) // 2
+    packets = list(config_packets(data))
+    if not packets:
+        raise InvalidBitstream(f"{name}: no sync word")
+    if not partial:
+        for (op, reg, offset, cnt) in packets:
+            if op == OP_WRITE and offset + cnt > nwords:
+                raise InvalidBitstream(f"{name}: truncated in a write to {REGISTER_NAMES.get(reg, hex(reg))}")
+    img = ConfigImage(data)
+    if not img.fdri:
+        raise InvalidBitstream(f"{name}: no frame data")
+    if not img.frameWords or any(words % img.frameWords for (far, offset, words) in img.fdri):
+        raise InvalidBitstream(f"{name}: frame data is not a whole number of frames")
+    if IDCODE_REG not in img.regs:
+        warnings.append("no IDCODE packet")
+    elif idcode is not None and (img.regs[IDCODE_REG] ^ idcode) & 0x0fffffff:
+        raise InvalidBitstream("%s: built for IDCODE 0x%08x, device is 0x%08x" % (
+            name, img.regs[IDCODE_REG], idcode))
+    if COR1_REG not in img.regs:
+        warnings.append("no COR1 packet, startup clock unknown")
+    else:
+        clk = SSCLK_NAMES[img.regs[COR1_REG] & COR1_SSCLKSRC]
+        need = "JtagClk" if target == "jtag" else "CCLK"
+        if clk == "UserClk":
+            warnings.append("startup clock is UserClk, startup waits for the user clock to run")
+        elif clk != need:
+            raise InvalidBitstream("%s: startup clock is %s, %s needs %s" % (
+                name, clk, "JTAG load" if target == "jtag" else "flash boot", need))
+    if not partial:
+        if not any(op == OP_WRITE and reg == CRC_REG for (op, reg, offset, cnt) in packets):
+            warnings.append("no CRC packet")
+        elif bram_crc_bits(data) is None:
+            raise InvalidBitstream(f"{name}: CRC does not match the computed one")
+    return warnings
+
+# Bytes of a compressed .bit file decompressed to check the packets ahead
+# of the frame data.
+
+VALIDATE_HEAD = 4096
+
+def validate_bitfile(filename, idcode = None, target = "jtag"):
+    """
+    Check .bit file filename before it is sent anywhere: the header and
+    the data length, the sync word, the FDRI frame data, the IDCODE packet
+    against idcode (version nibble ignored, not checked when None) and the
+    startup clock against target, "jtag" for XuLA.load() or "flash" for a
+    flash image. The startup clock of the other target is an error on
+    both; UserClk only gets a warning on both, as startup then depends on
+    a clock the file cannot tell about. A CRC write that does not match
+    the data is an error. The file is read through mmap and only the
+    packet headers and the CRC are computed over the data. Of a compressed
+    file only the start of the data is checked; a short file is caught
+    while it streams.
+
+    Raises InvalidBitstream on the first error. Returns a list of warnings
+    for what could not be checked.
+    """
+    try:
+        bf = BitFile(filename)
+    except (AssertionError, TypeError, EOFError, OSError, struct.error):
+        raise InvalidBitstream(f"{filename}: bad .bit header")
+    start, length = bf.dataOffset, bf.fieldLength
+    bf.bit.close()
+    if bf.compression:
+        with bf.stream() as f:
+            head = f.read(min(length, VALIDATE_HEAD))
+        warnings = check_packets(filename, head, idcode, target, partial = True)
+        return warnings + [f"{bf.compression} compressed, length and CRC not checked"]
+    size = os.path.getsize(filename)
+    if start + length > size:
+        raise InvalidBitstream(f"{filename}: truncated, {size - start} of {length} data bytes present")
+    with open(filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            data = memoryview(mm)[start:start + length]
+            try:
+                return check_packets(filename, data, idcode, target)
+            finally:
+                data.release()
+        finally:
+            mm.close()
+
+# .bit files and flash images may be gzip, xz or zstd compressed; they are
+# decompressed as they are read, zstd only when zstandard is installed.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def open_source(filename):
+    """
+    Open filename for binary reading, decompressing it on the fly if it
+    starts with the gzip, xz or zstd magic number.
+    Returns (file object, compression name or None).
+    """
+    with open(filename, "rb") as f:
+        magic = f.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.open(filename, "rb"), "gzip"
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return lzma.open(filename, "rb"), "xz"
+    if magic.startswith(b"\x28\xb5\x2f\xfd"):
+        if zstandard is None:
+            raise ImportError(f"zstandard is not installed, cannot read {filename}")
+        return zstandard.open(filename, "rb"), "zstd"
+    return open(filename, "rb"), None
+
+def read_chunks(f, n, chunksize = 1 << 16, depth = 8):
+    """
+    Yield n bytes read from file f in chunks of up to chunksize bytes. A
+    background thread reads (and decompresses) ahead into a queue of at
+    most depth chunks, so file I/O overlaps with what the consumer does
+    with each chunk. f is closed when done. Raises InvalidBitstream if f
+    ends before n bytes.
+    """
+    q = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+    def reader():
+        try:
+            left = n
+            while left and not stop.is_set():
+                c = f.read(min(chunksize, left))
+                if not c:
+                    raise InvalidBitstream(f"data ends after {n - left} of {n} bytes")
+                left -= len(c)
+                put(c)
+            put(None)
+        except Exception as X:
+            put(X)
+        finally:
+            f.close()
+
+    thread = threading.Thread(target = reader, name = "read_chunks", daemon = True)
+    thread.start()
+    try:
+        while True:
+            c = q.get()
+            if c is None:
+                return
+            if isinstance(c, Exception):
+                raise c
+            yield c
+    finally:
+        stop.set()
+        thread.join()
+
 class BitFile:
+    verbose = False
+
     def __init__(self, bitfilename):
-        self.bit = open(bitfilename, "rb")
+        self.filename = bitfilename
+        self.bit, self.compression = open_source(bitfilename)
 
         def getH(fi):
             return struct.unpack(">H", self.bit.read(2))[0]
@@ -80,27 +784,78 @@ class BitFile:
         self.bit.seek(getH(self.bit), os.SEEK_CUR)
         assert getH(self.bit) == 1
 
-        # Search for the data section in the .self.bit file...
+        # Search for the data section in the .self.bit file, keeping the
+        # header fields (a design;options, b part, c date, d time) on the way
+        self.fields = {}
         while True:
             ty = ord(self.bit.read(1))
             if ty == 0x65:
                 break
             length = getH(self.bit)
-            self.bit.seek(length, os.SEEK_CUR)
+            self.fields[chr(ty)] = self.bit.read(length).rstrip(b"\0").decode("latin-1")
         self.fieldLength = getI(self.bit)
-        print(f"bitfile {bitfilename} loaded, {self.fieldLength} bytes")
+        self.dataOffset = self.bit.tell()
+        self._image = None
+        if self.verbose:
+            print(f"bitfile {bitfilename} loaded, {self.fieldLength} bytes" +
+                  (f" ({self.compression})" if self.compression else ""))
 
     def __len__(self):
         return self.fieldLength * 8
 
     def __iter__(self):
-        def getbits():
-            for i in range(self.fieldLength):
-                b = ord(self.bit.read(1))
-                # print "File %02x" % b
-                for j in range(8):
-                    yield (b >> (7-j)) & 1
-        return getbits()
+        return iter(unpackbits(self.tobytes(), bitorder = "big"))
 
     def tobytes(self):
-        return self.bit.read(self.fieldLength)
+        if self.compression:
+            with self.stream() as f:
+                data = f.read(self.fieldLength)
+        else:
+            self.bit.seek(self.dataOffset)
+            data = self.bit.read(self.fieldLength)
+        if len(data) < self.fieldLength:
+            raise InvalidBitstream(f"{self.filename}: truncated, {len(data)} of {self.fieldLength} data bytes present")
+        return data
+
+    def stream(self):
+        """Open a new file object positioned at the start of the data section."""
+        f = open_source(self.filename)[0]
+        f.seek(self.dataOffset)
+        return f
+
+    def chunks(self, chunksize = 1 << 16, depth = 8):
+        """
+        Yield the data section in chunks, read and decompressed ahead on a
+        background thread (see read_chunks()).
+        """
+        return read_chunks(self.stream(), self.fieldLength, chunksize, depth)
+
+    @property
+    def usercode(self):
+        """UserID bitgen stored in the design field, as USERCODE reads it back; None if absent."""
+        for option in self.fields.get("a", "").split(";")[1:]:
+            (name, _, value) = option.partition("=")
+            if name.strip().lower() == "userid":
+                return int(value, 16) & 0xffffffff
+        return None
+
+    def digest(self):
+        """SHA-1 of the data section, which unlike the header does not change with the build time."""
+        h = hashlib.sha1()
+        for chunk in self.chunks():
+            h.update(chunk)
+        return h.hexdigest()
+
+    def validate(self, idcode = None, target = "jtag"):
+        """Check the file with validate_bitfile(); returns its warnings."""
+        warnings = validate_bitfile(self.filename, idcode, target)
+        if self.verbose:
+            for w in warnings:
+                print(f"bitfile {self.filename}: {w}")
+        return warnings
+
+    def image(self):
+        """Return the ConfigImage decoded from the data section (cached)."""
+        if self._image is None:
+            self._image = ConfigImage(self.tobytes())
+        return self._image
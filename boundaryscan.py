@@ -0,0 +1,237 @@
+# Boundary-scan access to the pins of the FPGA through SAMPLE and EXTEST,
+# driven by the BSDL description of the part (xc3s200a_vq100.bsd etc. from
+# the Xilinx BSDL library). Works without a design loaded in the FPGA.
+
+import re
+import time
+
+from bitops import numpy
+from bitstream import Bitstream
+from xula import TDO_CMD, USB_PACKET_SIZE
+
+class Cell:
+    """One cell of the boundary register, as listed in BOUNDARY_REGISTER."""
+    def __init__(self, num, cell, port, function, safe, ccell = None, disval = None):
+        self.num = num
+        self.cell = cell
+        self.port = port            # "*" for internal and control cells
+        self.function = function    # input, output2, output3, control, bidir, internal, ...
+        self.safe = safe            # 0, 1 or None for X
+        self.ccell = ccell          # control cell of an output3/bidir cell
+        self.disval = disval        # control cell value that turns the output off
+
+    def __repr__(self):
+        return "<Cell %d %s %s %s>" % (self.num, self.cell, self.port, self.function)
+
+def bsdl_strings(text, attribute):
+    """Return the concatenated string value of a BSDL attribute, or None."""
+    m = re.search(r"attribute\s+%s\s+of\s+\w+\s*:\s*\w+\s+is\s+(.*?);" % attribute,
+                  text, re.IGNORECASE | re.DOTALL)
+    if m is None:
+        return None
+    return "".join(re.findall(r'"([^"]*)"', m.group(1)))
+
+class Bsdl:
+    """
+    The parts of a BSDL file needed for boundary scan: instruction length
+    and opcodes, the boundary register cells and the pin map.
+
+        b = Bsdl.load("xc3s200a_vq100.bsd")
+        b.inputs["IO_L01P_0"]   # boundary register bit sampling that port
+        b.pins["IO_L01P_0"]     # package pin
+    """
+    def __init__(self, text):
+        # strip VHDL comments
+        text = re.sub(r"--[^\n]*", "", text)
+        m = re.search(r"entity\s+(\w+)\s+is", text, re.IGNORECASE)
+        self.entity = m.group(1) if m else None
+        m = re.search(r"attribute\s+INSTRUCTION_LENGTH\s+of\s+\w+\s*:\s*\w+\s+is\s+(\d+)", text, re.IGNORECASE)
+        self.irlength = int(m.group(1)) if m else None
+        m = re.search(r"attribute\s+BOUNDARY_LENGTH\s+of\s+\w+\s*:\s*\w+\s+is\s+(\d+)", text, re.IGNORECASE)
+        self.length = int(m.group(1)) if m else None
+
+        self.opcodes = {}
+        for (name, codes) in re.findall(r"(\w+)\s*\(([01xX,\s]+)\)", bsdl_strings(text, "INSTRUCTION_OPCODE") or ""):
+            self.opcodes[name.upper()] = codes.split(",")[0].strip()
+
+        self.cells = []
+        for c in re.findall(r"(\d+)\s*\(([^)]*)\)", bsdl_strings(text, "BOUNDARY_REGISTER") or ""):
+            f = [s.strip() for s in c[1].split(",")]
+            if len(f) < 4:
+                continue
+            value = lambda s: int(s) if s in ("0", "1") else None
+            cell = Cell(int(c[0]), f[0], f[1], f[2].lower(), value(f[3]))
+            if len(f) >= 6:
+                cell.ccell = int(f[4])
+                cell.disval = value(f[5])
+            self.cells.append(cell)
+        self.cells.sort(key = lambda cell: cell.num)
+        if self.length is None:
+            self.length = len(self.cells)
+
+        self.inputs = {}    # port -> cell sampling it
+        self.outputs = {}   # port -> (cell driving it, control cell, disable value)
+        for cell in self.cells:
+            if cell.port == "*":
+                continue
+            if cell.function in ("input", "bidir", "observe_only", "clock"):
+                self.inputs[cell.port] = cell.num
+            if cell.function in ("output2", "output3", "bidir"):
+                self.outputs[cell.port] = (cell.num, cell.ccell, cell.disval)
+
+        self.pins = {}      # port -> package pin (or list of pins)
+        for (port, pins) in re.findall(r"(\w+)\s*:\s*(\([^)]*\)|\w+)", bsdl_strings(text, "PIN_MAP_STRING") or ""):
+            pins = [p.strip() for p in pins.strip("()").split(",")]
+            self.pins[port] = pins[0] if len(pins) == 1 else pins
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(f.read())
+
+    def instruction(self, name):
+        """Return instruction name as a Bitstream for the instruction register."""
+        return Bitstream(self.irlength, int(self.opcodes[name].replace("x", "0").replace("X", "0"), 2))
+
+    def safe(self):
+        """Boundary register value with every cell at its safe value and every output off."""
+        v = 0
+        for cell in self.cells:
+            if cell.safe:
+                v |= 1 << cell.num
+        for (num, ccell, disval) in self.outputs.values():
+            if ccell is not None:
+                v = (v & ~(1 << ccell)) | ((disval or 0) << ccell)
+        return v
+
+    def drive(self, pins, base = None):
+        """
+        Boundary register value driving pins, a dict of port to 0 or 1, or
+        None to turn the output off. Other cells keep their value in base
+        (safe() by default).
+        """
+        v = self.safe() if base is None else base
+        for (port, level) in pins.items():
+            (num, ccell, disval) = self.outputs[port]
+            if ccell is not None:
+                enable = (disval or 0) ^ (level is not None)
+                v = (v & ~(1 << ccell)) | (enable << ccell)
+            if level is not None:
+                v = (v & ~(1 << num)) | ((1 if level else 0) << num)
+        return v
+
+class BoundaryScan:
+    """
+    Sample or drive the pins of the selected device on the XuLA chain.
+
+        bs = BoundaryScan(x, Bsdl.load("xc3s200a_vq100.bsd"))
+        for (t, s) in bs.stream(batch = 256):
+            print(t[-1], bs.pin(s, "IO_L01P_0")[-1])
+
+    Snapshots are the boundary register as captured, (length + 7) // 8
+    bytes each, bit n being cell n. With NumPy installed a batch comes out
+    as an array of timestamps and a 2-D uint8 array with one row per
+    snapshot; otherwise as lists of floats and bytes.
+    """
+    def __init__(self, xula, bsdl, asarray = None):
+        self.x = xula
+        self.bsdl = bsdl
+        self.length = bsdl.length
+        self.nbytes = (self.length + 7) // 8
+        self.asarray = numpy is not None if asarray is None else asarray
+        if self.asarray and numpy is None:
+            raise ImportError("NumPy is not installed")
+
+    def instruction(self, name):
+        return self.bsdl.instruction(name)
+
+    def sample(self):
+        """Capture one snapshot with SAMPLE, returned as an int."""
+        return self.x.LoadBSIRthenBSDR(self.instruction("SAMPLE"), Bitstream(self.length, 0), receive = True)
+
+    def snapshots(self, count):
+        """
+        Capture count SAMPLE snapshots back to back: the DR scans go out in
+        one USB write for as many snapshots as fit in one USB packet, and
+        those snapshots are read back before the next write. The firmware
+        stops taking OUT packets while its IN endpoint is full, so queueing
+        more would stall the write. Returns (timestamps, snapshots) as
+        described for the class.
+        """
+        x = self.x
+        (irpre, irpost, drpre, drpost) = x.padding()
+        n = self.length + drpre
+        nb = (n + 7) // 8
+        x.LoadBSIRthenBSDR(self.instruction("SAMPLE"), None)
+        raw = bytearray(count * nb)
+        view = memoryview(raw)
+        times = []
+        per = max(1, USB_PACKET_SIZE // nb)
+        for first in range(0, count, per):
+            last = min(first + per, count)
+            with x.batched():
+                for k in range(first, last):
+                    x.go_states(1, 0, 0)  # Run-Test/Idle -> Select-DR-Scan -> Capture-DR -> Shift-DR
+                    x.sync()
+                    x.sendheader(TDO_CMD, n)
+                    x.debug_tms(1)         # Exit1-DR
+                    x.go_states(1, 0)      # -> Update-DR -> Run-Test/Idle
+                for k in range(first, last):
+                    x.recvinto(view[k * nb:(k + 1) * nb], 2000)
+                    times.append(time.time())
+        if drpre:
+            raw = b"".join((int.from_bytes(view[k * nb:(k + 1) * nb], "little") >> drpre).to_bytes(self.nbytes, "little")
+                           for k in range(count))
+            view = memoryview(raw)
+            nb = self.nbytes
+        if self.asarray:
+            a = numpy.frombuffer(raw, dtype = numpy.uint8).reshape(count, nb)[:, :self.nbytes]
+            return (numpy.array(times), a)
+        return (times, [bytes(view[k * nb:k * nb + self.nbytes]) for k in range(count)])
+
+    def stream(self, batch = 64, count = None):
+        """Yield (timestamps, snapshots) batches until count snapshots (forever if None)."""
+        done = 0
+        while count is None or done < count:
+            k = batch if count is None else min(batch, count - done)
+            yield self.snapshots(k)
+            done += k
+
+    def pin(self, snapshots, port):
+        """Levels of port in a batch of snapshots."""
+        bit = self.bsdl.inputs[port]
+        if self.asarray:
+            return (snapshots[:, bit // 8] >> (bit % 8)) & 1
+        return [(s[bit // 8] >> (bit % 8)) & 1 for s in snapshots]
+
+    def pins(self, snapshot):
+        """Decode one snapshot (bytes, array row or int) into a dict of port to level."""
+        if not isinstance(snapshot, int):
+            snapshot = int.from_bytes(bytes(snapshot), "little")
+        return { port: (snapshot >> bit) & 1 for (port, bit) in self.bsdl.inputs.items() }
+
+    def extest(self, vectors):
+        """
+        Drive the pins with EXTEST, one vector at a time. Each vector is a
+        dict of port to 0, 1 or None (output off); a pin keeps its state
+        until a later vector names it, and pins never named stay off. The
+        register is preloaded through SAMPLE/PRELOAD
+        before EXTEST takes over the pins. Returns the snapshot (int)
+        captured while each vector was applied, so the level of the pins
+        after the previous vector.
+        """
+        x = self.x
+        values = []
+        v = self.bsdl.safe()
+        for vec in vectors:
+            v = self.bsdl.drive(vec, v)
+            values.append(v)
+        if not values:
+            return []
+        x.LoadBSIRthenBSDR(self.instruction("SAMPLE"), Bitstream(self.length, values[0]))
+        ext = self.instruction("EXTEST")
+        return [x.LoadBSIRthenBSDR(ext, Bitstream(self.length, v), receive = True) for v in values]
+
+    def release(self):
+        """Leave EXTEST: reset the TAP so the pins go back to the design."""
+        self.x.tlr()
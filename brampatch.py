@@ -0,0 +1,48 @@
+# Python script to change the initial block RAM contents of a .bit file
+# without running the vendor flow again, and optionally load the result.
+
+import sys
+import time
+
+from bitstream import BitFile, BramMap, patch_bram
+
+def main(bitfilename, llfilename, specs, load = False):
+    t = time.time()
+    m = BramMap.load(llfilename)
+    contents = {}
+    parity = {}
+    for spec in specs:
+        block, files = spec.split("=", 1)
+        if block not in m.bits:
+            raise Exception(f"{block} not found in {llfilename}")
+        files = files.split(",")
+        contents[block] = open(files[0], "rb").read()
+        if len(files) > 1:
+            parity[block] = open(files[1], "rb").read()
+    frames = patch_bram(bitfilename, m, contents, parity)
+    print(f"{len(frames)} frames patched in {bitfilename}, took {time.time() - t:.3f}s")
+    if load:
+        from xula import XuLA, XC3S200A_IDCODE
+        x = XuLA()
+        x.querychain()
+        x.select(XC3S200A_IDCODE)
+        t = time.time()
+        x.load(BitFile(bitfilename))
+        print(f"load complete, took {time.time() - t:.3f}s USERCODE = {hex(x.usercode())}")
+
+if __name__ == "__main__":
+    print("XuLA block RAM patcher")
+    args = sys.argv[1:]
+    load = "--load" in args
+    if load:
+        args.remove("--load")
+    if len(args) < 3 or not all("=" in a for a in args[2:]):
+        print(f"usage: python {sys.argv[0]} [--load] <bitfile> <llfile> <block>=<datafile>[,<parityfile>] ...")
+        sys.exit(1)
+
+    try:
+        main(args[0], args[1], args[2:], load)
+        sys.exit(0)
+    except Exception as X:
+        print(X)
+        sys.exit(1)
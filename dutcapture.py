@@ -0,0 +1,153 @@
+# Continuous capture of the DUT outputs through the HostIo DUT interface.
+# A background thread drains the DUT module in large batched reads into a
+# preallocated ring buffer and hands the filled slots to the consumer.
+
+import queue
+import threading
+import time
+
+from bitops import numpy, unpackbits, packbits
+
+class DutCapture:
+    """
+    Stream samples of the DUT outputs of HostIo module id.
+
+        with DutCapture(x, 255) as cap:
+            for chunk in cap:
+                log(chunk)
+
+    Each read fetches batch samples in one TDO transfer. The ring holds
+    ringsize samples split in slots of batch samples. A slot goes back to
+    the capture thread only once its chunk has been copied out, so when
+    the consumer falls behind and no slot is free, new batches are counted
+    in dropped instead of overwriting data not yet delivered. Chunks are
+    NumPy arrays (one element per sample for 8, 16 and 32 bit samples,
+    one row per sample otherwise) when NumPy is installed, or bytes with
+    (width + 7) // 8 little-endian bytes per sample.
+
+    The capture thread owns the board while it runs; other threads using
+    it must hold lock.
+    """
+    def __init__(self, xula, id, width = None, batch = 4096, ringsize = 1 << 20,
+                 asarray = None, lock = None):
+        self.x = xula
+        self.id = id
+        if width is None:
+            # dutquery() returns the number of DUT inputs in the low byte
+            # and the number of DUT outputs in the high byte
+            width = (xula.dutquery(id) >> 8) & 0xff
+        self.width = width
+        self.sbytes = (width + 7) // 8
+        self.batch = batch
+        self.slots = max(2, ringsize // batch)
+        self.ring = bytearray(self.slots * batch * self.sbytes)
+        self.free = queue.Queue()   # slots the capture thread may fill
+        self.full = queue.Queue()   # filled slots waiting for the consumer
+        for i in range(self.slots):
+            self.free.put(i)
+        self.asarray = numpy is not None if asarray is None else asarray
+        if self.asarray and numpy is None:
+            raise ImportError("NumPy is not installed")
+        self.lock = threading.Lock() if lock is None else lock
+        self.samples = 0        # samples read from the DUT
+        self.dropped = 0        # samples discarded because the ring was full
+        self.reads = 0          # number of batched reads
+        self.error = None       # exception that stopped the capture thread
+        self.t = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    @property
+    def elapsed(self):
+        return time.time() - self.t if self.t is not None else 0.0
+
+    @property
+    def rate(self):
+        """Samples per second read from the DUT."""
+        t = self.elapsed
+        return self.samples / t if t > 0 else 0.0
+
+    @property
+    def throughput(self):
+        """Bytes per second delivered to the ring."""
+        return self.rate * self.sbytes
+
+    def start(self):
+        self.stopped.clear()
+        self.t = time.time()
+        self.thread = threading.Thread(target = self.run, name = "dutcapture", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def samplebytes(self, raw):
+        """Repack raw LSB-first bits into whole bytes per sample."""
+        n = self.batch
+        w = self.width
+        if w % 8 == 0:
+            return raw
+        bits = unpackbits(raw, n * w)
+        pad = bytes(8 * self.sbytes - w)
+        return packbits(b"".join(bits[i * w:(i + 1) * w] + pad for i in range(n)))
+
+    def run(self):
+        size = self.batch * self.sbytes
+        try:
+            while not self.stopped.is_set():
+                with self.lock:
+                    raw = self.x.dutreadbytes(self.id, self.batch, self.width)
+                self.reads += 1
+                self.samples += self.batch
+                try:
+                    slot = self.free.get_nowait()
+                except queue.Empty:
+                    self.dropped += self.batch
+                    continue
+                self.ring[slot * size:(slot + 1) * size] = self.samplebytes(raw)
+                self.full.put(slot)
+        except Exception as X:
+            self.error = X
+        finally:
+            self.stopped.set()
+
+    def chunk(self, slot):
+        size = self.batch * self.sbytes
+        data = bytes(self.ring[slot * size:(slot + 1) * size])
+        self.free.put(slot)
+        if not self.asarray:
+            return data
+        dtypes = { 1: numpy.uint8, 2: numpy.dtype("<u2"), 4: numpy.dtype("<u4") }
+        if self.sbytes in dtypes:
+            return numpy.frombuffer(data, dtype = dtypes[self.sbytes])
+        return numpy.frombuffer(data, dtype = numpy.uint8).reshape(self.batch, self.sbytes)
+
+    def get(self, timeout = None):
+        """Return the next chunk, or None if nothing arrived within timeout."""
+        try:
+            slot = self.full.get(timeout = timeout)
+        except queue.Empty:
+            return None
+        return self.chunk(slot)
+
+    def __iter__(self):
+        """Yield chunks until the capture stops and the ring is drained."""
+        while True:
+            c = self.get(timeout = 0.1)
+            if c is not None:
+                yield c
+            elif self.stopped.is_set() and self.full.empty():
+                if self.error is not None:
+                    raise self.error
+                return
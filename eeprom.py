@@ -0,0 +1,100 @@
+# Python script to back up, restore or change the PIC EEPROM of every XuLA
+# board on the USB bus.
+
+import os
+import sys
+import time
+
+from xula import XuLA, EepromError, elapsed, find_xulas, EEPROM_SIZE
+from transport import device_location
+
+def backup(x, filename):
+    x.backup_eeprom(filename)
+    print(f"  EEPROM saved into {filename}")
+
+def restore(x, filename):
+    if not x.restore_eeprom(filename):
+        raise EepromError(f"EEPROM verify failed after restoring {filename}")
+    print(f"  EEPROM restored from {filename}")
+
+def settings(x, values):
+    for addr, val in values:
+        x.write_eeprom(addr, bytes([val]))
+    r = x.read_eeprom()
+    for addr, val in values:
+        if r[addr] != val:
+            raise EepromError(f"EEPROM verify failed at {hex(addr)}")
+    print(f"  {len(values)} EEPROM locations set")
+
+def eeprom_filename(directory, device):
+    """Backup file of the board plugged into the USB port of device."""
+    port = device_location(device)[0]
+    return os.path.join(directory, "xula-%s.eep" % port.replace(os.sep, "_"))
+
+def main(cmd, args):
+    devices = find_xulas()
+    if not devices:
+        print("No XuLA device found on USB bus")
+        sys.exit(1)
+
+    if cmd in ("backup", "restore"):
+        directory = args[0]
+        if cmd == "backup":
+            os.makedirs(directory, exist_ok = True)
+    else:
+        values = [(convert(args[i]), convert(args[i + 1])) for i in range(0, len(args), 2)]
+        for addr, val in values:
+            if not (0 <= addr < EEPROM_SIZE and 0 <= val <= 0xff):
+                raise ValueError
+
+    # backups are kept by USB port, as the enumeration order can change between runs
+    filenames = [eeprom_filename(args[0], device) if cmd != "set" else None for device in devices]
+    if cmd != "set":
+        ports = [device_location(device)[0] for device in devices]
+        if "" in ports or len(set(ports)) != len(ports):
+            raise EepromError("Cannot tell the boards apart by USB port, nothing done")
+    if cmd == "restore":
+        missing = [f for f in filenames if not os.path.exists(f)]
+        if missing:
+            raise EepromError(f"Missing backup file(s) {', '.join(missing)}, nothing restored")
+
+    t = time.time()
+    for i, device in enumerate(devices):
+        x = XuLA(device)
+        print(f"XuLA {i} ({device_location(device)[0]}): {x.description}")
+        filename = filenames[i]
+        if cmd == "backup":
+            backup(x, filename)
+        elif cmd == "restore":
+            restore(x, filename)
+        else:
+            settings(x, values)
+    t = time.time() - t
+    print(f"{len(devices)} board(s) done, took {elapsed(t)}")
+
+def convert(x):
+    if x.startswith('0x') or x.startswith('0X'):
+        return int(x, 16)
+    return int(x)
+
+if __name__ == "__main__":
+    print("XuLA EEPROM backup/restore")
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("backup", "restore", "set") or \
+       (args[0] == "set" and len(args) % 2 == 0) or (args[0] != "set" and len(args) != 2):
+        print(f"usage: python {sys.argv[0]} backup <dir>")
+        print(f"       python {sys.argv[0]} restore <dir>")
+        print(f"       python {sys.argv[0]} set <addr> <byte> [<addr> <byte> ...]")
+        sys.exit(1)
+
+    try:
+        main(args[0], args[1:])
+        sys.exit(0)
+
+    except ValueError:
+        print('Invalid EEPROM address or value')
+        sys.exit(1)
+
+    except Exception as X:
+        print(X)
+        sys.exit(1)
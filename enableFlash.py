@@ -1,14 +1,12 @@
 import sys
 import time
 
-from xula import XuLA, elapsed, UnknownDevice
+from xula import XuLA, elapsed, XC3S200A_IDCODE
 
 def main(enableFlash):
     x = XuLA()
-    chain = x.querychain()
-    if chain != [0x02218093]:
-       print(f"Expected single XC3S200A, but chain is {hex(chain[0])}")
-       raise UnknownDevice("Invalid device: " + hex(chain[0]))
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
 
     print("OK, found DEVICEID for XC3S200A")
     t = time.time()
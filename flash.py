@@ -3,21 +3,23 @@
 import sys
 import time
 
-from xula import XuLA, elapsed, UnknownDevice
+from xula import XuLA, elapsed, XC3S200A_IDCODE
 from bitstream import BitFile
+from progress import TqdmProgress
 
 def main(bitfilename):
     x = XuLA()
-    chain = x.querychain()
-    if chain != [0x02218093]:
-       print(f"Expected single XC3S200A, but chain is {chain}")
-       raise UnknownDevice("Invalid device: " + hex(chain[0]))
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
 
     print("OK, found DEVICEID for XC3S200A")
     t = time.time()
-    x.write_flash(BitFile(bitfilename), 0, True)
+    bs = BitFile(bitfilename)
+    print(f"bitfile {bitfilename} loaded, {bs.fieldLength} bytes")
+    x.write_flash(bs, 0, True, TqdmProgress(colour='yellow'))
     t = time.time() - t
     print(f"download complete, took {elapsed(t)}")
+    print(f"  {x.flashstats}")
 
 if __name__ == "__main__":
     print("XuLA Flash downloader")
@@ -0,0 +1,152 @@
+# Python script to list every XuLA board on the USB bus: firmware, FPGA,
+# loaded design, flash enable flag and flash geometry, as JSON or CSV.
+# The boards are queried in parallel and nothing is loaded into the FPGAs.
+
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from xula import (XuLA, FlashSession, elapsed, find_xulas, XC3S200A_IDCODE, STAT_REG, STAT_DONE,
+                  FLASH_ENABLE_FLAG_ADDR, ENABLE_FLASH)
+from bitstream import BitFile
+from transport import device_location
+
+INVENTORY_FIELDS = ["port", "address", "product", "firmware", "description", "chain",
+                    "idcode", "usercode", "done", "flash_enabled",
+                    "flash_data_width", "flash_addr_width", "flash_block_size", "scanned", "error"]
+
+FLASH_FIELDS = ["flash_data_width", "flash_addr_width", "flash_block_size"]
+
+INVENTORY_CACHE = "xula_inventory.json"
+
+# the flash interface circuit FlashSession loads; its UserID tells it apart
+FLASH_INTERFACE = "fintf_jtag.bit"
+
+def flash_interface_usercode(filename = FLASH_INTERFACE):
+    """UserID of the flash interface .bit file, or None if it is missing or has none."""
+    if not os.path.exists(filename):
+        return None
+    usercode = BitFile(filename).usercode
+    return None if usercode in (None, 0xffffffff) else usercode
+
+def inventory(device, cached = None, fintf = None):
+    """
+    Query one board and return a dict of INVENTORY_FIELDS. The firmware
+    INFO, the EEPROM flag, and IDCODE, USERCODE and STAT through JTAG are
+    read every time. The flash geometry needs the USER1 circuit and the
+    flash released by the uC, so it is read only when USERCODE is fintf,
+    the UserID of the flash interface, and DONE is set; it is taken from
+    cached (the row of an earlier scan) when the board still has the same
+    USB address and USERCODE there. Otherwise it is None.
+    Errors are returned in the error field.
+    """
+    (port, address) = device_location(device)
+    r = dict.fromkeys(INVENTORY_FIELDS)
+    r.update(port = port, address = address, scanned = time.time())
+    try:
+        x = XuLA(device)
+        r["product"] = "%02x%02x" % x.product
+        r["firmware"] = "%d.%d" % x.version
+        r["description"] = x.description
+        r["flash_enabled"] = x.read_eeprom(FLASH_ENABLE_FLAG_ADDR, 1)[0] == ENABLE_FLASH
+        chain = x.querychain()
+        r["chain"] = " ".join("0x%08x" % idcode for idcode in chain)
+        if XC3S200A_IDCODE not in chain:
+            return r
+        x.select(XC3S200A_IDCODE)
+        r["idcode"] = "0x%08x" % x.idcode()
+        usercode = x.usercode()
+        r["usercode"] = "0x%08x" % usercode
+        r["done"] = bool(x.rdreg(STAT_REG) & STAT_DONE)
+        x.tlr()
+        if not r["done"] or fintf is None or usercode != fintf:
+            return r
+        if (cached is not None and not cached["error"] and cached["address"] == address and
+                cached["usercode"] == r["usercode"] and cached["flash_data_width"] is not None):
+            r.update((k, cached[k]) for k in FLASH_FIELDS)
+            return r
+        with FlashSession(x, doStart = False) as f:
+            r["flash_data_width"] = f.dataWidth
+            r["flash_addr_width"] = f.addrWidth
+            r["flash_block_size"] = f.blockSize
+        x.tlr()
+    except Exception as X:
+        r["error"] = str(X) or X.__class__.__name__
+    return r
+
+def load_cache(filename):
+    try:
+        with open(filename) as f:
+            return { r["port"]: r for r in json.load(f) }
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(filename, rows):
+    with open(filename, "w") as f:
+        json.dump(rows, f, indent = 1)
+
+def scan(devices, cache = None, fintf = None):
+    """
+    Inventory devices concurrently, one thread per board; cache is a dict
+    by port of rows from an earlier scan, passed on to inventory() along
+    with fintf. Returns the rows.
+    """
+    cache = cache or {}
+    if not devices:
+        return []
+    cached = [cache.get(device_location(device)[0]) for device in devices]
+    with ThreadPoolExecutor(max_workers = len(devices), thread_name_prefix = "inventory") as pool:
+        return list(pool.map(inventory, devices, cached, [fintf] * len(devices)))
+
+def main(fmt, cachefile, refresh):
+    devices = find_xulas()
+    if not devices:
+        print("No XuLA device found on USB bus", file = sys.stderr)
+        sys.exit(1)
+
+    t = time.time()
+    cache = load_cache(cachefile) if cachefile else {}
+    rows = scan(devices, {} if refresh else cache, flash_interface_usercode())
+    if cachefile:
+        cache.update((r["port"], r) for r in rows)
+        save_cache(cachefile, list(cache.values()))
+    if fmt == "csv":
+        w = csv.DictWriter(sys.stdout, INVENTORY_FIELDS)
+        w.writeheader()
+        w.writerows(rows)
+    else:
+        json.dump(rows, sys.stdout, indent = 1)
+        print()
+    print(f"{len(rows)} board(s), took {elapsed(time.time() - t)}", file = sys.stderr)
+
+if __name__ == "__main__":
+    print("XuLA fleet inventory", file = sys.stderr)
+    args = sys.argv[1:]
+    fmt = "json"
+    if "--csv" in args:
+        fmt = "csv"
+        args.remove("--csv")
+    refresh = "--refresh" in args
+    if refresh:
+        args.remove("--refresh")
+    cachefile = INVENTORY_CACHE
+    if "--cache" in args:
+        i = args.index("--cache")
+        cachefile = args[i + 1] if i + 1 < len(args) else None
+        del args[i:i + 2]
+    if "--no-cache" in args:
+        cachefile = None
+        args.remove("--no-cache")
+    if args:
+        print(f"usage: python {sys.argv[0]} [--csv] [--refresh] [--cache <file> | --no-cache]", file = sys.stderr)
+        sys.exit(1)
+
+    try:
+        main(fmt, cachefile, refresh)
+        sys.exit(0)
+    except Exception as X:
+        print(X, file = sys.stderr)
+        sys.exit(1)
@@ -1,6 +1,8 @@
 # JTAG class
 # File originally from http://excamera.com/sphinx/fpga-xess-python.html  
 
+from bitstream import Bitstream, padbits
+
 def islast(o):
     it = o.__iter__()
     e = it.__next__()
@@ -13,15 +15,34 @@ def islast(o):
             yield (True, e)
             break
 
+class ChainDevice(object):
+    """A device found on the JTAG chain"""
+    def __init__(self, idcode, irlen):
+        self.idcode = idcode    # 0 if the device has no IDCODE register
+        self.irlen = irlen
+
+    def __repr__(self):
+        return "<ChainDevice idcode=0x%08x irlen=%d>" % (self.idcode, self.irlen)
+
 class Jtag(object):
     """
     JTAG Class
-    Subclassers provide 'tick' and 'bulktdi' methods
+    Subclassers provide 'tick', 'bulktdi', 'bulktdo' and 'bulktditdo' methods,
+    and may override 'ticks' with a path that does not read TDO back
+
+    Devices on the chain are indexed from TDO, so device 0 is the one whose
+    TDO drives the cable. Instruction and data scans through LoadBSIRthenBSDR
+    target the selected device and pad the others with BYPASS bits within
+    the same shift. Streaming data registers (CFG_IN, USER1) only see an exact
+    bit stream when the selected device is the last one, nearest TDI.
     """
 
     verbose = False
     # verbose = True
 
+    chain = None    # list of ChainDevice, None until the chain is scanned
+    device = 0      # index of the selected device
+
     st = 0
     states = [
         ( "Test-Logic-Reset", 1,  0,  ), #  0
@@ -69,18 +90,20 @@ class Jtag(object):
         self.operate(tck = 1, tms = tms, tdi = tdi)
         return sample
 
-    def go_state(self, tms):
-        self.debug_tms(tms)
-        self.debug(tms = tms, tdi = 0)
-        return self.tick(tms, 0)
+    def ticks(self, seq):
+        """ Clock a sequence of (tms, tdi) pairs, discarding TDO """
+        for (tms, tdi) in seq:
+            self.tick(tms, tdi)
 
-        self.debug(tms = tms, tdi = 0)
-        self.operate(tck = 0, tms = tms, tdi = 0)
-        self.operate(tck = 1, tms = tms, tdi = 0)
+    def go_state(self, tms):
+        self.go_states(tms)
 
     def go_states(self, *ss):
+        """ Move through the TAP states with TMS values ss, without reading TDO """
         for s in ss:
-            self.go_state(s)
+            self.debug_tms(s)
+            self.debug(tms = s, tdi = 0)
+        self.ticks([(s, 0) for s in ss])
 
     def do_nbit(self, n, data):
         r = 0
@@ -94,6 +117,10 @@ class Jtag(object):
         assert(self.state().startswith("Exit1-"))
         return r
 
+    def send_nbit_cycle(self, n, data):
+        """ Shift n bits of data with TMS low, discarding TDO """
+        self.ticks([(0, (data >> i) & 1) for i in range(n)])
+
     def do_nbit_cycle(self, n, data):
         r = 0
         for i in range(n):
@@ -104,31 +131,26 @@ class Jtag(object):
         return r
 
     def goTLR(self):
-        for i in range(10):
-            self.go_state(1)
+        self.go_states(*[1] * 10)
 
     def goSelectDRScan(self):
-        for i in range(10):
-            self.go_state(1)
-        self.go_state(0)
-        self.go_state(1)
+        self.go_states(*[1] * 10 + [0, 1])
         self.assert_state("Select-DR-Scan")
         # assert(jt.state() == "Select-DR-Scan")
 
     def initTAP(self):
-        for i in range(10):
-            self.go_state(1)
-        self.go_state(0)
-
-        self.go_state(1)
-        self.go_state(1)
-        self.go_state(0)
-        self.go_state(0)
+        self.go_states(*[1] * 10 + [0] + [1, 1, 0, 0])
 
     def tlr(self):
         """Go to Test-Logic-Reset"""
-        while self.state() != "Test-Logic-Reset":
-            self.go_state(1)
+        # at most five TMS highs reach Test-Logic-Reset from any state
+        n = 0
+        st = self.st
+        while self.states[st][0] != "Test-Logic-Reset":
+            st = self.states[st][2]
+            n += 1
+        if n:
+            self.go_states(*[1] * n)
 
     def rti(self):
         """Go to Run-Test/Idle"""
@@ -139,9 +161,12 @@ class Jtag(object):
     def sendbs(self, bs):
         """ Send bitstream over TDI, raising TMS for last bit """
         assert(self.state().startswith("Shift-"))
-        if len(bs) < 256:
-            for (is_lastbit, d) in islast(bs):
-                self.do_bit(tms = is_lastbit, tdi = d)
+        if len(bs) < 256 and not hasattr(bs, "tobytes"):
+            seq = [(int(is_lastbit), d) for (is_lastbit, d) in islast(bs)]
+            for (tms, d) in seq:
+                self.debug_tms(tms)
+                self.debug(tms = tms, tdi = d)
+            self.ticks(seq)
         else:
             self.bulktdi(bs)
         assert(self.state().startswith("Exit1-"))
@@ -149,6 +174,9 @@ class Jtag(object):
     def sendrecvbs(self, bs):
         """ Send bitstream over TDI, raising TMS for last bit, return the accumulated TDO value """
         assert(self.state().startswith("Shift-"))
+        if len(bs) >= 32 and isinstance(bs, Bitstream):
+            # integer bitstreams go out in a single transfer
+            return self.recvbs(len(bs), bs.val)
         r = 0
         mask = 1
         for (is_lastbit, d) in islast(bs):
@@ -159,6 +187,101 @@ class Jtag(object):
         assert(self.state().startswith("Exit1-"))
         return r
 
+    def recvbs(self, n, val = 0):
+        """ Send n bits of val over TDI in one transfer, raising TMS for last bit, return TDO value """
+        assert(self.state().startswith("Shift-"))
+        if val == 0:
+            r = self.bulktdo(n)
+        else:
+            r = self.bulktditdo(val.to_bytes((n + 7) // 8, "little"), n)
+        r = int.from_bytes(r, "little") & ((1 << n) - 1)
+        assert(self.state().startswith("Exit1-"))
+        return r
+
+    def padding(self):
+        """ Return (irpre, irpost, drpre, drpost) BYPASS bits around the selected device """
+        if not self.chain:
+            return (0, 0, 0, 0)
+        k = self.device
+        irpre = sum(d.irlen for d in self.chain[:k])
+        irpost = sum(d.irlen for d in self.chain[k + 1:])
+        return (irpre, irpost, k, len(self.chain) - 1 - k)
+
+    def padir(self, instruction):
+        """ Pad an instruction for the selected device with BYPASS for the others """
+        (irpre, irpost, drpre, drpost) = self.padding()
+        return padbits(instruction, irpre, irpost, 1)
+
+    def sendir(self, instruction):
+        """ Shift an instruction for the selected device from Shift-IR """
+        self.sendbs(self.padir(instruction))
+
+    def scanchain(self, irlengths, maxbits = 1024):
+        """
+        Count the devices on the chain, read their IDCODEs and work out their
+        instruction register lengths. irlengths maps IDCODE (without the
+        version nibble) to IR length; one device of unknown IR length is
+        allowed. Leaves every device in BYPASS and returns the list of ChainDevice.
+        """
+        ones = ((1 << maxbits) - 1) << maxbits
+        # flush the IRs with zeros then ones; the ones come out after the total IR length.
+        # The state model of a new object is not the real TAP, which a previous
+        # run may have left anywhere: five TMS highs reset it from any state.
+        self.go_states(1,1,1,1,1)
+        self.go_states(0,1,1,0,0)
+        self.assert_state("Shift-IR")
+        r = self.sendrecvbs(Bitstream(2 * maxbits, ones)) >> maxbits
+        irtotal = (r & -r).bit_length() - 1
+        self.go_states(1,1,0,0)
+        self.assert_state("Shift-DR")
+        # every device is now in BYPASS, so the DR chain has one bit per device
+        r = self.sendrecvbs(Bitstream(2 * maxbits, ones)) >> maxbits
+        ndevices = (r & -r).bit_length() - 1
+        self.tlr()
+        if irtotal <= 0 or ndevices <= 0:
+            return []
+
+        # Test-Logic-Reset selects IDCODE, or BYPASS for devices without one
+        self.go_states(0,1,0,0)
+        self.assert_state("Shift-DR")
+        r = self.sendrecvbs(Bitstream(32 * ndevices, 0))
+        self.tlr()
+        idcodes = []
+        for i in range(ndevices):
+            if r & 1:
+                idcodes.append(r & 0xffffffff)
+                r >>= 32
+            else:
+                idcodes.append(0)
+                r >>= 1
+
+        irlens = [irlengths.get(i & 0x0fffffff) for i in idcodes]
+        unknown = irlens.count(None)
+        if unknown > 1:
+            raise ValueError("Cannot work out IR lengths for chain %s" % [hex(i) for i in idcodes])
+        if unknown == 1:
+            irlens[irlens.index(None)] = irtotal - sum(l for l in irlens if l is not None)
+        self.chain = [ChainDevice(i, l) for (i, l) in zip(idcodes, irlens)]
+        if self.device >= ndevices:
+            self.device = 0
+        return self.chain
+
+    def select(self, device):
+        """
+        Select the device targeted by scans, by chain index or by IDCODE
+        (the version nibble is ignored). Returns False if there is no such device.
+        """
+        if not self.chain:
+            return device == 0
+        if 0 <= device < len(self.chain):
+            self.device = device
+            return True
+        for (i, d) in enumerate(self.chain):
+            if d.idcode and ((d.idcode ^ device) & 0x0fffffff) == 0:
+                self.device = i
+                return True
+        return False
+
     def LoadBSIRthenBSDR(self, instruction, send, receive = False):
         """
         Load the BSIR with an instruction, execute the instruction, and then capture and reload the BSDR.
@@ -170,7 +293,7 @@ class Jtag(object):
         self.assert_state("Shift-IR")
         if self.verbose:
             print(f"IR {list(instruction)}")
-        self.sendbs(instruction)
+        self.sendir(instruction)
         self.go_state(1)
         self.assert_state("Update-IR")
         recv = None
@@ -179,10 +302,15 @@ class Jtag(object):
                 print(f"DR {list(send)}")
             self.go_states(1, 0, 0)
             self.assert_state("Shift-DR")
+            # The devices between the selected one and TDI delay its input by
+            # drpost bits and the ones between it and TDO delay its output by drpre bits.
+            # Pad only as much as needed so streaming registers like CFG_IN see no extra bits.
+            (irpre, irpost, drpre, drpost) = self.padding()
             if receive:
-                recv = self.sendrecvbs(send)
+                padded = padbits(send, max(0, drpre - drpost), drpost)
+                recv = (self.sendrecvbs(padded) >> drpre) & ((1 << len(send)) - 1)
             else:
-                self.sendbs(send)
+                self.sendbs(padbits(send, 0, drpost))
             self.go_state(1)
             self.assert_state("Update-DR")
         self.go_state(0)
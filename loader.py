@@ -5,34 +5,72 @@
 import sys
 import time
 
-from xula import XuLA, elapsed, UnknownDevice
+from xula import XuLA, elapsed, XC3S200A_IDCODE
 from bitstream import BitFile
+from watch import BitWatcher
 
-def main(bitfilename):
+def main(bitfilename, verify = False, maskfilename = None):
     x = XuLA()
-    chain = x.querychain()
-    if chain != [0x02218093]:
-       print(f"Expected single XC3S200A, but chain is {chain}")
-       raise UnknownDevice("Invalid device: " + hex(chain[0]))
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
 
     print("OK, found DEVICEID for XC3S200A")
     t = time.time()
-    x.progpin(1)
-    x.progpin(0)
-    x.progpin(1)
-    time.sleep(0.03)
-    x.load(BitFile(bitfilename))
+    x.progpulse()
+    mask = BitFile(maskfilename) if maskfilename else None
+    bs = BitFile(bitfilename)
+    print(f"bitfile {bitfilename} loaded, {bs.fieldLength} bytes")
+    r = x.load(bs, verify, mask)
     t = time.time() - t
     print(f"load complete, took {elapsed(t)} USERCODE = {hex(x.usercode())}")
+    for phase, pt in x.timings.items():
+        print(f"  {phase:10s} {elapsed(pt)}")
+    if verify:
+        print(f"verify: {r}, took {elapsed(r.elapsed)}")
+        if r.mismatches:
+            print(f"mismatching frames: {r.mismatches}")
+        if not r:
+            raise Exception("Configuration readback verify failed")
+
+def report(e):
+    if e.error:
+        print(f"{e.filename}: {e.error}")
+    elif e.loaded:
+        print(f"{e.filename} loaded, {elapsed(e.latency)} after the build, load took {elapsed(e.elapsed)}")
+    else:
+        print(f"{e.filename} already loaded, checked in {elapsed(e.elapsed)}")
+
+def watch(bitfilename, verify = False):
+    x = XuLA()
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
+
+    print("OK, found DEVICEID for XC3S200A")
+    print(f"watching {bitfilename}, Ctrl-C to stop")
+    try:
+        BitWatcher(x, bitfilename, verify = verify, callback = report).run()
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     print("XuLA FPGA loader")
-    if len(sys.argv) != 2:
-        print(f"usage: python {sys.argv[0]} <bitfile>")
+    args = sys.argv[1:]
+    verify = "--verify" in args
+    if verify:
+        args.remove("--verify")
+    watching = "--watch" in args
+    if watching:
+        args.remove("--watch")
+    if len(args) not in (1, 2) or (watching and len(args) != 1):
+        print(f"usage: python {sys.argv[0]} [--verify] <bitfile> [<mskfile>]")
+        print(f"       python {sys.argv[0]} --watch [--verify] <bitfile>")
         sys.exit(1)
 
     try:
-        main(sys.argv[1])
+        if watching:
+            watch(args[0], verify)
+        else:
+            main(args[0], verify or len(args) == 2, args[1] if len(args) == 2 else None)
         sys.exit(0)
     except Exception as X:
         print(X)
@@ -0,0 +1,91 @@
+# Python script to store several .BIT files in the XuLA Flash as MultiBoot
+# images, and to switch the FPGA between them without a JTAG download.
+
+import sys
+import time
+
+from xula import XuLA, FlashSession, FlashError, elapsed, XC3S200A_IDCODE, MULTIBOOT_SLOT
+from bitstream import BitFile
+from progress import TqdmProgress
+
+class MultiBootLayout:
+    """
+    Flash layout of MultiBoot images: image i starts at i * slot, the
+    address XuLA.reboot_to(i) hands to the FPGA. Image 0 is the one the
+    FPGA loads at power up. Each image is a complete bitstream with its own
+    sync word; the GENERAL1/GENERAL2 writes of the reboot sequence are what
+    select it, so nothing is added in front of it.
+    """
+    def __init__(self, bitfiles, slot = MULTIBOOT_SLOT):
+        self.bitfiles = list(bitfiles)
+        self.slot = slot
+        for bs in self.bitfiles:
+            if bs.fieldLength > slot:
+                raise ValueError(f"{bs.filename} is {bs.fieldLength} bytes, MultiBoot slots are {slot}")
+
+    def __len__(self):
+        return len(self.bitfiles)
+
+    def address(self, i):
+        return i * self.slot
+
+    def check(self, size, blockSize = 1):
+        """
+        Raise FlashError unless every image fits in a flash of size bytes
+        and the slots start on blockSize boundaries.
+        """
+        if self.slot % blockSize:
+            raise FlashError(f"MultiBoot slots of {self.slot} bytes do not start on {blockSize} byte flash blocks")
+        for (i, bs) in enumerate(self.bitfiles):
+            end = self.address(i) + bs.fieldLength
+            if end > size:
+                raise FlashError(f"image {i} ({bs.filename}) ends at 0x{end:06x}, the flash holds {size} bytes")
+
+    def write(self, x, progress = None):
+        """
+        Program every image into the flash of XuLA x. Each image is checked
+        for CCLK startup and the layout against the size and block size of
+        the flash before the flash is erased, once, in the same session.
+        Raises FlashError if the layout does not fit or programming fails.
+        """
+        for bs in self.bitfiles:
+            x.check_bitfile(bs, "flash")
+        with FlashSession(x, True, progress) as f:
+            self.check(f.size(), f.blockSize)
+            f.erase()
+            for (i, bs) in enumerate(self.bitfiles):
+                f.write(self.address(i), bs.chunks(), length = len(bs) // 8)
+            x.flashstats = f.stats
+
+def main(cmd, args):
+    x = XuLA()
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
+
+    print("OK, found DEVICEID for XC3S200A")
+    t = time.time()
+    if cmd == "write":
+        layout = MultiBootLayout(BitFile(f) for f in args)
+        for (i, bs) in enumerate(layout.bitfiles):
+            print(f"image {i} at 0x{layout.address(i):06x}: {bs.filename}, {bs.fieldLength} bytes")
+        layout.write(x, TqdmProgress(colour='yellow'))
+        print(f"download complete, took {elapsed(time.time() - t)}")
+    else:
+        index = int(args[0])
+        x.reboot_to(index)
+        print(f"image {index} running, took {elapsed(time.time() - t)} USERCODE = {hex(x.usercode())}")
+
+if __name__ == "__main__":
+    print("XuLA MultiBoot")
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("write", "boot") or (args[0] == "boot" and len(args) != 2):
+        print(f"usage: python {sys.argv[0]} write <bitfile0> [<bitfile1> ...]")
+        print(f"       python {sys.argv[0]} boot <index>")
+        sys.exit(1)
+
+    try:
+        main(args[0], args[1:])
+        sys.exit(0)
+    except Exception as X:
+        print(X)
+        sys.exit(1)
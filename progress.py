@@ -0,0 +1,79 @@
+# Progress reporting for long XuLA operations.
+# Operations take an optional progress callback that receives ProgressEvent
+# objects; with no callback nothing is printed and nothing is computed.
+
+import time
+
+class ProgressEvent:
+    """
+    Progress of one phase of an operation.
+    total is None when the amount of work is not known in advance (erase).
+    rate is in bytes per second (or units per second when total is None).
+    """
+    __slots__ = ("phase", "done", "total", "rate", "elapsed")
+
+    def __init__(self, phase, done, total, rate, elapsed):
+        self.phase = phase
+        self.done = done
+        self.total = total
+        self.rate = rate
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return "<ProgressEvent %s %d/%s %.0f/s>" % (self.phase, self.done, self.total, self.rate)
+
+class Phase:
+    """Tracks the work done in one phase and reports it to a callback."""
+    def __init__(self, callback, name, total = None):
+        self.callback = callback
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.t = time.time()
+        callback(ProgressEvent(name, 0, total, 0.0, 0.0))
+
+    def update(self, n):
+        self.done += n
+        t = time.time() - self.t
+        self.callback(ProgressEvent(self.name, self.done, self.total, self.done / t if t > 0 else 0.0, t))
+
+class NullPhase:
+    """Phase used when there is no callback; updates cost a single call."""
+    def update(self, n):
+        pass
+
+NULL_PHASE = NullPhase()
+
+def phase(callback, name, total = None):
+    """Start a phase reporting to callback, or a no-op phase if callback is None."""
+    if callback is None:
+        return NULL_PHASE
+    return Phase(callback, name, total)
+
+class TqdmProgress:
+    """
+    Progress callback that shows a tqdm bar per phase. tqdm is only
+    imported when this adapter is used.
+    """
+    def __init__(self, **kw):
+        from tqdm import tqdm
+        self.tqdm = tqdm
+        self.kw = kw
+        self.bar = None
+        self.name = None
+
+    def __call__(self, ev):
+        if ev.phase != self.name:
+            self.close()
+            self.name = ev.phase
+            unit = 'bytes' if ev.total is not None else 'polls'
+            self.bar = self.tqdm(total = ev.total, desc = ev.phase, unit = unit, **self.kw)
+        self.bar.update(ev.done - self.bar.n)
+        if ev.total is not None and ev.done >= ev.total:
+            self.close()
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+            self.name = None
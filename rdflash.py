@@ -3,19 +3,18 @@
 import sys
 import time
 
-from xula import XuLA, elapsed, UnknownDevice
-# from bitstream import Bitstream, BitstreamHex, BitFile
+from xula import XuLA, elapsed, XC3S200A_IDCODE
+from progress import TqdmProgress
 
 def main(bitfilename, loaddr, hiaddr):
     x = XuLA()
-    chain = x.querychain()
-    if chain != [0x02218093]:
-       print(f"Expected single XC3S200A, but chain is {chain}")
-       raise UnknownDevice("Invalid device: " + hex(chain[0]))
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
 
     print("OK, found DEVICEID for XC3S200A")
     t = time.time()
-    x.read_flash(bitfilename, loaddr, hiaddr, True)
+    print(f"Reading Flash contents into {bitfilename}")
+    x.read_flash(bitfilename, loaddr, hiaddr, True, TqdmProgress())
     t = time.time() - t
     print(f"read complete, took {elapsed(t)}")
 
@@ -40,6 +39,6 @@ if __name__ == "__main__":
         print('Invalid arguments for low or high address')
         sys.exit(1)
 
-    except UnknownDevice as X:
+    except Exception as X:
         print(X)
         sys.exit(1)
@@ -0,0 +1,52 @@
+# Python script to reconfigure the XuLA FPGA with a design that differs from
+# the loaded one in a few frames, writing only the frames that changed.
+
+import os
+import sys
+import time
+
+from xula import XuLA, elapsed, XC3S200A_IDCODE
+from bitstream import BitFile, FrameMap
+
+def main(oldfilename, newfilename, maskfilename = None, mapfilename = None):
+    x = XuLA()
+    x.querychain()
+    x.select(XC3S200A_IDCODE)
+
+    print("OK, found DEVICEID for XC3S200A")
+    old = BitFile(oldfilename)
+    new = BitFile(newfilename)
+    mask = BitFile(maskfilename) if maskfilename else None
+    fmap = None
+    if mapfilename and os.path.exists(mapfilename):
+        fmap = FrameMap.load(mapfilename)
+    elif mapfilename:
+        t = time.time()
+        fmap = x.discover_framemap(new.image())
+        fmap.save(mapfilename)
+        print(f"frame map saved into {mapfilename}, took {elapsed(time.time() - t)}")
+    r = x.reload(old, new, mask, fmap)
+    if r.full:
+        print(f"device did not hold {oldfilename}, loaded {newfilename} in full")
+    else:
+        print(f"{r.frames} frames in {len(r.runs)} runs written")
+    print(f"reload complete, took {elapsed(r.elapsed)} USERCODE = {hex(x.usercode())}")
+
+if __name__ == "__main__":
+    print("XuLA FPGA incremental reload")
+    args = sys.argv[1:]
+    mapfilename = None
+    if "--map" in args:
+        i = args.index("--map")
+        mapfilename = args[i + 1] if i + 1 < len(args) else None
+        del args[i:i + 2]
+    if len(args) not in (2, 3):
+        print(f"usage: python {sys.argv[0]} [--map <mapfile>] <oldbitfile> <newbitfile> [<mskfile>]")
+        sys.exit(1)
+
+    try:
+        main(args[0], args[1], args[2] if len(args) == 3 else None, mapfilename)
+        sys.exit(0)
+    except Exception as X:
+        print(X)
+        sys.exit(1)
@@ -0,0 +1,168 @@
+# Background scrubbing of the configuration memory of a running board.
+# A thread reads the configuration frames back a few at a time, compares
+# a hash of each against the golden .bit file and reports (and optionally
+# rewrites) the frames upset by SEUs.
+
+import threading
+import time
+import zlib
+
+from bitstream import STAT_REG
+from xula import STAT_SEU_ERR, STAT_CRC_ERROR
+
+class ScrubEvent:
+    """A corrupted frame found by the Scrubber."""
+    def __init__(self, frame, far, repaired, t):
+        self.frame = frame          # index of the frame in the FDRI data
+        self.far = far              # its frame address
+        self.repaired = repaired    # True if the golden frame was written back
+        self.time = t
+
+    def __repr__(self):
+        return "<ScrubEvent frame=%d far=0x%08x%s>" % (
+            self.frame, self.far, " repaired" if self.repaired else "")
+
+class Scrubber:
+    """
+    Watch the configuration of a board loaded with BitFile golden.
+
+        with Scrubber(x, BitFile("design.bit"), BitFile("design.msk"),
+                      budget = 20000, callback = print) as s:
+            run_tests()
+
+    Each step reads up to slice frames of one FDRI write of golden back
+    through CFG_OUT and compares their CRC-32, ignoring the bits set in
+    the mask BitFile (bitgen -m), with the golden frame. Corrupted frames are passed to callback as ScrubEvents
+    and kept in events; with repair set the golden frame is written back
+    without stopping the design, so frames holding block RAM or LUT RAM
+    contents should be covered by the mask. A pass over every frame ends
+    with a STAT read; status_errors counts the passes that found SEU_ERR
+    or CRC_ERROR set.
+
+    budget caps the readback at that many bytes per second, interval is
+    the idle time between passes. The lock is held only while a slice is
+    read, so other threads sharing the XuLA (HostIo for instance) get the
+    board in between if they hold it too.
+    """
+    def __init__(self, xula, golden, mask = None, framemap = None, slice = 16,
+                 budget = None, interval = 10.0, repair = False, callback = None, lock = None):
+        self.x = xula
+        self.img = golden.image()
+        self.nframes = len(self.img)
+        self.framemap = framemap
+        self.slice = slice
+        self.budget = budget
+        self.interval = interval
+        self.repair = repair
+        self.callback = callback
+        self.lock = threading.Lock() if lock is None else lock
+        mimg = mask.image() if mask is not None else None
+        self.masks = []     # inverted mask of each frame, None where nothing is masked
+        self.golden = []    # CRC-32 of each masked golden frame
+        for i in range(self.nframes):
+            m = int.from_bytes(mimg.frame(i), "big") if mimg is not None else 0
+            self.masks.append(~m if m else None)
+            self.golden.append(self.crc(self.img.frame(i), i))
+        self.events = []
+        self.passes = 0
+        self.frames = 0         # frames read back
+        self.bytes = 0          # bytes read back, pad frames included
+        self.status = None      # STAT at the end of the last pass
+        self.status_errors = 0
+        self.error = None       # exception that stopped the scrub thread
+        self.t = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    def crc(self, data, i):
+        m = self.masks[i]
+        if m is not None:
+            n = len(data)
+            data = (int.from_bytes(data, "big") & m).to_bytes(n, "big")
+        return zlib.crc32(data)
+
+    @property
+    def elapsed(self):
+        return time.time() - self.t if self.t is not None else 0.0
+
+    @property
+    def bandwidth(self):
+        """Bytes per second read back so far."""
+        t = self.elapsed
+        return self.bytes / t if t > 0 else 0.0
+
+    def start(self):
+        self.stopped.clear()
+        self.t = time.time()
+        self.thread = threading.Thread(target = self.run, name = "scrub", daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def step(self, first, count):
+        """Check frames first to first + count - 1; returns the number of bytes read."""
+        x = self.x
+        img = self.img
+        with self.lock:
+            data = x.readback(count, img.frameWords, self.framemap.far(first))
+            x.desync()
+            bad = [first + k for k in range(count)
+                   if self.crc(data[k * img.frameBytes():(k + 1) * img.frameBytes()], first + k) !=
+                      self.golden[first + k]]
+            if bad and self.repair:
+                x.write_frames(img, [(i, 1) for i in bad], self.framemap)
+            x.tlr()
+        self.frames += count
+        for i in bad:
+            e = ScrubEvent(i, self.framemap.far(i), self.repair, time.time())
+            self.events.append(e)
+            if self.callback is not None:
+                self.callback(e)
+        return len(data) + img.frameBytes()
+
+    def scrub(self):
+        """Run one pass over every frame."""
+        first = 0
+        while first < self.nframes and not self.stopped.is_set():
+            t = time.time()
+            # a slice ends with its FDRI write, FAR does not step into the next one
+            (start, nframes, far, offset) = self.img.block(first)
+            count = min(self.slice, start + nframes - first)
+            n = self.step(first, count)
+            self.bytes += n
+            first += count
+            if self.budget:
+                # stretch the step to keep within the readback budget
+                self.stopped.wait(max(0.0, n / self.budget - (time.time() - t)))
+        if first >= self.nframes:
+            with self.lock:
+                self.status = self.x.rdreg(STAT_REG)
+                self.x.tlr()
+            if self.status & (STAT_SEU_ERR | STAT_CRC_ERROR):
+                self.status_errors += 1
+            self.passes += 1
+
+    def run(self):
+        try:
+            if self.framemap is None:
+                with self.lock:
+                    self.framemap = self.x.discover_framemap(self.img)
+            while not self.stopped.is_set():
+                self.scrub()
+                self.stopped.wait(self.interval)
+        except Exception as X:
+            self.error = X
+        finally:
+            self.stopped.set()
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakexula
+from bitstream import BitFile
+
+FW = 130    # frame length of the emulated XC3S200A in 16-bit words
+
+def frames(*values):
+    """Whole frames, frame k filled with values[k]."""
+    return [v for v in values for i in range(FW)]
+
+# CLB frames at FAR 0, then block RAM frames at FAR 0x100 in a second FDRI write
+BLOCKS = [(0, frames(1, 2, 3)), (0x100, frames(4, 5))]
+
+@pytest.fixture
+def make_bitfile(tmp_path):
+    """Write a .bit file with fakexula.bitfile() and return its BitFile."""
+    def make(name, blocks):
+        path = str(tmp_path / name)
+        fakexula.bitfile(path, blocks, FW)
+        return BitFile(path)
+    return make
+
+@pytest.fixture
+def board():
+    """(XuLA, Handle) of an emulated board, the FPGA selected."""
+    pytest.importorskip("usb")
+    import transport
+    import xula
+    h = fakexula.make(fw = FW)
+    x = xula.XuLA(transport = transport.LegacyTransport(h))
+    x.querychain()
+    x.select(xula.XC3S200A_IDCODE)
+    return (x, h)
+
+@pytest.fixture
+def loaded(board, make_bitfile):
+    """(XuLA, Handle, BitFile) of an emulated board configured with BLOCKS."""
+    (x, h) = board
+    bs = make_bitfile("design.bit", BLOCKS)
+    x.load(bs)
+    return (x, h, bs)
+
+@pytest.fixture
+def flashboard():
+    """
+    Return a function making (XuLA, FlashInterface) of an emulated board
+    whose FPGA holds the flash interface, its arguments those of FlashInterface.
+    """
+    pytest.importorskip("usb")
+    import transport
+    import xula
+    def make(**kw):
+        fintf = fakexula.FlashInterface(**kw)
+        x = xula.XuLA(transport = transport.LegacyTransport(fakexula.make(fw = FW, user = fintf)))
+        x.querychain()
+        x.select(xula.XC3S200A_IDCODE)
+        return (x, fintf)
+    return make
@@ -0,0 +1,510 @@
+# In-process emulation of the XuLA firmware and of the JTAG TAP and
+# configuration logic of its XC3S200A, enough to run XuLA against.
+#
+#   h = fakexula.make()
+#   x = XuLA(transport = LegacyTransport(h))
+#
+# A FlashInterface passed to make() plays the USER1 flash interface circuit
+# of fintf_jtag.bit, a HostIoDut a HostIo DUT module. Handle has the pyusb
+# 0.x bulkWrite/bulkRead interface. Command replies come back as short
+# packets, so a bulk read ends at the end of a reply, and OUT packets are
+# refused while more than INCAP bytes of replies are waiting to be read, as
+# with the single-threaded firmware.
+
+import collections
+import struct
+
+INCAP = 64
+
+# TAP state transitions: STATES[state][tms]
+STATES = [(1, 0), (1, 2), (3, 9), (4, 5), (4, 5), (6, 8), (6, 7), (4, 8),
+          (1, 2), (10, 0), (11, 12), (11, 12), (13, 15), (13, 14), (11, 15), (1, 2)]
+TLR, RTI, SHIFT_DR, EXIT1_DR, UPDATE_DR, CAPTURE_IR, SHIFT_IR, UPDATE_IR = 0, 1, 4, 5, 8, 10, 11, 15
+
+IR_USERCODE = 0b001000
+IR_IDCODE   = 0b001001
+IR_CFG_OUT  = 0b000100
+IR_CFG_IN   = 0b000101
+IR_JPROGRAM = 0b001011
+IR_JSHUTDOWN = 0b001101
+IR_ISC_DNA  = 0b110001
+IR_USER1    = 0b000010
+
+STAT_INIT = 0x1000
+STAT_DONE = 0x2000
+
+OP_INPROGRESS = 0x01230123
+OP_PASSED     = 0x45674567
+OP_FAILED     = 0x89ab89ab
+
+class Config:
+    """Configuration logic: packet parser, registers and frame memory."""
+    def __init__(self, idcode = 0x02218093, fw = 130):
+        self.idcode = idcode
+        self.fw = fw
+        self.regs = collections.defaultdict(int)
+        self.frames = {}        # frame address -> list of words
+        self.out = collections.deque()
+        self.stat = STAT_INIT
+        self.eeprom = bytearray(256)
+        self.written = 0        # frames written through FDRI
+        self.reset()
+
+    def reset(self):
+        self.word = 0
+        self.nbits = 0
+        self.window = 0
+        self.synced = False
+        self.pending = None     # (register, words left, words)
+        self.type2 = None       # (op, register, count words)
+        self.reg = 0
+        self.obit = 0
+
+    def clear(self):
+        self.frames.clear()
+        self.out.clear()
+        self.stat = STAT_INIT
+        self.reset()
+
+    def bit_in(self, b):
+        if not self.synced:
+            self.window = ((self.window << 1) | b) & 0xffff
+            if self.window == 0xaa99:
+                self.synced = True
+                self.word = self.nbits = 0
+            return
+        self.word = (self.word << 1) | b
+        self.nbits += 1
+        if self.nbits == 16:
+            self.word_in(self.word)
+            self.word = self.nbits = 0
+
+    def bit_out(self):
+        if not self.out:
+            return 0
+        b = (self.out[0] >> (15 - self.obit)) & 1
+        self.obit += 1
+        if self.obit == 16:
+            self.out.popleft()
+            self.obit = 0
+        return b
+
+    def word_in(self, w):
+        if self.pending:
+            (reg, left, words) = self.pending
+            words.append(w)
+            self.pending = (reg, left - 1, words) if left > 1 else None
+            if left == 1:
+                self.write(reg, words)
+            return
+        if self.type2 is not None:
+            (op, words) = self.type2
+            words.append(w)
+            if len(words) == 2:
+                self.type2 = None
+                self.packet(op, self.reg, (words[0] << 16) | words[1])
+            return
+        (ty, op) = (w >> 13, (w >> 11) & 3)
+        if ty == 1:
+            self.reg = (w >> 5) & 0x3f
+            self.packet(op, self.reg, w & 0x1f)
+        elif ty == 2:
+            self.type2 = (op, [])
+
+    def far(self):
+        return (self.regs[1] << 16) | self.regs[2]
+
+    def packet(self, op, reg, cnt):
+        if not cnt:
+            return
+        if op == 2:
+            self.pending = (reg, cnt, [])
+        elif op == 1:
+            if reg == 4:        # FDRO: a pad frame, then the frames from FAR on
+                self.out.extend([0] * self.fw)
+                f = self.far()
+                k = cnt // self.fw - 1
+                for i in range(k):
+                    self.out.extend(self.frames.get(f + i, [0] * self.fw))
+                (self.regs[1], self.regs[2]) = ((f + k) >> 16, (f + k) & 0xffff)
+            elif reg == 8:
+                self.out.extend([self.stat] + [0] * (cnt - 1))
+            elif reg == 0x0e:
+                self.out.extend([self.idcode >> 16, self.idcode & 0xffff])
+            else:
+                self.out.extend([self.regs[reg]] + [0] * (cnt - 1))
+
+    def write(self, reg, words):
+        if reg == 3:            # FDRI: the last frame only flushes the pipeline
+            f = self.far()
+            for i in range(len(words) // self.fw - 1):
+                self.frames[f + i] = words[i * self.fw:(i + 1) * self.fw]
+                self.written += 1
+        elif reg == 1 and len(words) == 2:
+            (self.regs[1], self.regs[2]) = words
+        else:
+            self.regs[reg] = words[-1]
+            if reg == 5 and words[-1] == 0x0d:      # DESYNC
+                self.synced = False
+            if reg == 5 and words[-1] in (5, 0x0e): # START, REBOOT (the flash image starts up)
+                self.stat |= STAT_DONE
+
+class FlashInterface:
+    """
+    The USER1 flash interface circuit with a serial flash behind it. Every
+    visit to Shift-DR is one operand; the reply to an instruction shifts
+    out during the operand that follows it.
+    """
+    def __init__(self, size = 1 << 21, dataWidth = 8, addrWidth = 24, blockWidth = 8):
+        self.flash = bytearray(b"\xff" * size)
+        self.dataWidth = dataWidth
+        self.addrWidth = addrWidth
+        self.blockWidth = blockWidth
+        self.bits = []
+        self.reply = collections.deque()
+        self.program = None     # byte address the next operand is programmed at
+        self.busy = 0           # status polls left before an erase is done
+        self.ops = collections.Counter()
+        self.reads = []         # (byte address, bytes) of every read
+        self.fail = False       # report every block program as failed
+
+    def capture(self):
+        self.bits = []
+        self.reply.clear()
+
+    def shift(self, tdi):
+        self.bits.append(tdi)
+        return self.reply.popleft() if self.reply else 0
+
+    def send(self, value, nbits):
+        self.reply.clear()
+        self.reply.extend((value >> i) & 1 for i in range(nbits))
+
+    def value(self, first, nbits):
+        return sum(b << i for (i, b) in enumerate(self.bits[first:first + nbits]))
+
+    def end(self):
+        stride = max(1, self.dataWidth // 8)
+        if self.program is not None:
+            data = bytes(self.value(i, 8) for i in range(0, len(self.bits) - 7, 8))
+            self.flash[self.program:self.program + len(data)] = data
+            (self.program, self.bits) = (None, [])
+            self.send(OP_FAILED if self.fail else OP_PASSED, 32)
+            return
+        op = self.value(0, 8)
+        self.ops[op] += 1
+        aw = self.addrWidth
+        (address, count) = (self.value(8, aw) * stride, self.value(8 + aw, aw) * stride)
+        self.bits = []
+        if op == 0x00:          # status poll
+            if self.busy:
+                self.busy -= 1
+            self.send(OP_INPROGRESS if self.busy else OP_PASSED, 32)
+        elif op == 0xff:        # capabilities: flash read and write
+            self.send(0xa50018a5, 32)
+        elif op == 0x13:        # flash geometry
+            self.send(self.dataWidth | (aw << 8) | (self.blockWidth << 16), 24)
+        elif op == 0x0b:        # erase
+            self.flash[:] = b"\xff" * len(self.flash)
+            self.busy = 2
+            self.send(OP_INPROGRESS, 32)
+        elif op == 0x0d:        # program the block in the next operand
+            self.program = address
+        elif op == 0x11:        # read
+            self.reads.append((address, count))
+            self.reply.clear()
+            for b in self.flash[address:address + count]:
+                self.reply.extend((b >> i) & 1 for i in range(8))
+
+class HostIoDut:
+    """
+    A HostIo DUT module behind USER1 whose outputs count up by one for
+    every sample read. An operand is the module id (8 bits), the number of
+    bits that follow (32 bits) and a 2-bit query or a 34-bit read request.
+    """
+    def __init__(self, id = 255, inputs = 8, outputs = 12):
+        self.id = id
+        self.inputs = inputs
+        self.outputs = outputs
+        self.counter = 0
+        self.bits = []
+        self.reply = collections.deque()
+
+    def capture(self):
+        self.bits = []
+        self.reply.clear()
+
+    def end(self):
+        pass
+
+    def value(self, first, nbits):
+        return sum(b << i for (i, b) in enumerate(self.bits[first:first + nbits]))
+
+    def shift(self, tdi):
+        tdo = self.reply.popleft() if self.reply else 0
+        self.bits.append(tdi)
+        n = len(self.bits)
+        if self.value(0, 8) != self.id:
+            return tdo
+        if n == 42 and self.value(40, 2) == 1:          # query: inputs, outputs
+            v = self.inputs | (self.outputs << 8)
+            self.reply.extend((v >> i) & 1 for i in range(16))
+        elif n == 74 and self.value(72, 2) == 3:        # read the next samples
+            for k in range(self.value(40, 32)):
+                v = self.counter & ((1 << self.outputs) - 1)
+                self.reply.extend((v >> i) & 1 for i in range(self.outputs))
+                self.counter += 1
+        return tdo
+
+class TAP:
+    """The TAP controller of the FPGA, user the circuit behind USER1 if any."""
+    def __init__(self, cfg, user = None):
+        self.cfg = cfg
+        self.user = user
+        self.st = TLR
+        self.ir = IR_IDCODE
+        self.sh = 0
+        self.dr = 0
+        self.drn = 1
+        self.usercode = 0xffffffff
+        self.dna = 0x0123456789abcde
+        self.irs = []           # every instruction loaded
+
+    def clock(self, tms, tdi):
+        tdo = 0
+        if self.st == SHIFT_IR:
+            tdo = self.sh & 1
+            self.sh = (self.sh >> 1) | (tdi << 5)
+        elif self.st == SHIFT_DR:
+            tdo = self.shift_dr(tdi)
+        nxt = STATES[self.st][tms]
+        user = self.user if self.ir == IR_USER1 else None
+        if self.st == SHIFT_DR and nxt == EXIT1_DR and user is not None:
+            user.end()
+        if nxt == CAPTURE_IR:
+            self.sh = 0b010001
+        elif nxt == UPDATE_IR:
+            self.ir = self.sh
+            self.irs.append(self.ir)
+            if self.ir == IR_JPROGRAM:
+                self.cfg.clear()
+            elif self.ir == IR_JSHUTDOWN:
+                self.cfg.stat &= ~STAT_DONE
+        elif nxt == 3:          # Capture-DR
+            self.dr = {IR_IDCODE: self.cfg.idcode, IR_USERCODE: self.usercode, IR_ISC_DNA: self.dna}.get(self.ir, 0)
+            self.drn = {IR_IDCODE: 32, IR_USERCODE: 32, IR_ISC_DNA: 57}.get(self.ir, 1)
+            if user is not None:
+                user.capture()
+        elif nxt == TLR:
+            self.ir = IR_IDCODE
+        self.st = nxt
+        return tdo
+
+    def shift_dr(self, tdi):
+        if self.ir == IR_CFG_IN:
+            self.cfg.bit_in(tdi)
+            return 0
+        if self.ir == IR_CFG_OUT:
+            return self.cfg.bit_out()
+        if self.ir == IR_USER1 and self.user is not None:
+            return self.user.shift(tdi)
+        tdo = self.dr & 1
+        self.dr = (self.dr >> 1) | (tdi << (self.drn - 1))
+        return tdo
+
+class Handle:
+    """The firmware, behind a pyusb 0.x style device handle."""
+    def __init__(self, tap):
+        self.tap = tap
+        self.inbuf = bytearray()
+        self.outq = bytearray()
+        self.bounds = []        # ends of the short packets in outq
+        self.pend = None        # (nbits, bits done, reply) of a TDI/TDO stream
+        self.ret = True
+        self.flashpin = 0       # 1 while the FPGA has the flash
+        self.eepromwrites = []  # header and data of every EEPROM write command
+        self.vectors = []       # every test vector applied
+        self.writes = 0
+        self.reads = 0
+
+    def claimInterface(self, i):
+        pass
+
+    def detachKernelDriver(self, i):
+        pass
+
+    def resetEndpoint(self, ep):
+        pass
+
+    def bulkWrite(self, ep, data, timeout = 0):
+        self.writes += 1
+        data = bytes(data)
+        for i in range(0, len(data), 32):
+            if len(self.outq) > INCAP:
+                raise IOError("USB write timeout: firmware blocked with %d bytes unread" % len(self.outq))
+            self.inbuf += data[i:i + 32]
+            self.process()
+        return len(data)
+
+    def bulkRead(self, ep, n, timeout = 0):
+        self.reads += 1
+        if self.bounds and self.bounds[0] < n:
+            n = self.bounds[0]      # a bulk read ends at a short packet
+        if n == 0 or len(self.outq) < n:
+            raise IOError("USB read timeout: %d bytes wanted, %d waiting" % (n, len(self.outq)))
+        r = bytes(self.outq[:n])
+        del self.outq[:n]
+        self.bounds = [b - n for b in self.bounds if b > n]
+        return r
+
+    def reply(self, b):
+        if self.ret:
+            self.outq += bytes(b)
+            if len(b) % 32:
+                self.bounds.append(len(self.outq))
+
+    def process(self):
+        b = self.inbuf
+        while b:
+            if self.pend:
+                (nbits, done, get) = self.pend
+                take = min(len(b), (nbits + 7) // 8 - done // 8)
+                out = bytearray()
+                for i in range(take):
+                    ob = 0
+                    for j in range(8):
+                        k = done + 8 * i + j
+                        if k >= nbits:
+                            break
+                        ob |= self.tap.clock(k == nbits - 1, (b[i] >> j) & 1) << j
+                    out.append(ob)
+                del b[:take]
+                done += 8 * take
+                if get:
+                    self.outq += out
+                self.pend = None if done >= nbits else (nbits, done, get)
+                continue
+            c = b[0]
+            if c in (0x42, 0x43):           # TMS_TDI(_TDO)
+                if len(b) < 2:
+                    return
+                tdo = self.tap.clock(b[1] & 1, (b[1] >> 1) & 1)
+                self.reply([c, tdo << 2])
+                del b[:2]
+            elif c in (0x44, 0x46):         # TDI_TDO, TDI
+                if len(b) < 5:
+                    return
+                n = struct.unpack("<I", b[1:5])[0]
+                del b[:5]
+                self.pend = (n, 0, c == 0x44)
+            elif c == 0x45:                 # TDO
+                if len(b) < 5:
+                    return
+                n = struct.unpack("<I", b[1:5])[0]
+                del b[:5]
+                out = bytearray((n + 7) // 8)
+                for k in range(n):
+                    out[k // 8] |= self.tap.clock(k == n - 1, 0) << (k % 8)
+                self.outq += out
+            elif c == 0x47:                 # RUNTEST
+                if len(b) < 5:
+                    return
+                for k in range(struct.unpack("<I", b[1:5])[0]):
+                    self.tap.clock(0, 0)
+                self.reply(b[:5])
+                del b[:5]
+            elif c == 0x4f:                 # TAP_SEQ
+                if len(b) < 6:
+                    return
+                n = struct.unpack("<I", b[1:5])[0]
+                flags = b[5]
+                nb = (n + 7) // 8
+                need = 6 + (2 * nb if flags & 0x0a == 0x0a else nb if flags & 0x0a else 0)
+                if len(b) < need:
+                    return
+                tms = b[6:6 + nb] if flags & 2 else None
+                tdi = b[6 + nb:6 + 2 * nb] if flags & 0x0a == 0x0a else b[6:6 + nb] if flags & 8 else None
+                out = bytearray(nb)
+                for k in range(n):
+                    ms = (tms[k // 8] >> (k % 8)) & 1 if tms else (flags >> 2) & 1
+                    di = (tdi[k // 8] >> (k % 8)) & 1 if tdi else (flags >> 4) & 1
+                    out[k // 8] |= self.tap.clock(ms, di) << (k % 8)
+                if flags & 1:
+                    self.reply(out)
+                del b[:need]
+            elif c in (0x49, 0x50):         # PROG, FLASH_ONOFF
+                if len(b) < 2:
+                    return
+                if c == 0x50:
+                    self.flashpin = b[1]
+                    self.reply(b[:2])
+                del b[:2]
+            elif c == 0x4a:                 # SINGLE_TEST_VECTOR
+                if len(b) < 2:
+                    return
+                self.vectors.append(b[1])
+                self.reply(b[:2])
+                del b[:2]
+            elif c == 0x4b:                 # GET_TEST_VECTOR
+                self.reply([c, self.vectors[-1] if self.vectors else 0])
+                del b[:1]
+            elif c == 0x4d:                 # ENABLE_RETURN
+                self.ret = True
+                del b[:1]
+            elif c == 0x4e:                 # DISABLE_RETURN
+                self.ret = False
+                del b[:1]
+            elif c == 0x40:                 # INFO
+                info = bytearray([0x40, 0x12, 0x34, 1, 2]) + b"XuLA-200 emulated\0"
+                info += bytes(31 - len(info))
+                info.append(-sum(info) & 0xff)
+                self.outq += info
+                del b[:min(2, len(b))]
+            elif c == 0x04:                 # READ_EEPROM
+                if len(b) < 5:
+                    return
+                (n, addr) = (b[1], b[2] | (b[3] << 8))
+                self.reply(bytes(b[:5]) + bytes(self.tap.cfg.eeprom[addr:addr + n]))
+                del b[:5]
+            elif c == 0x05:                 # WRITE_EEPROM
+                if len(b) < 5 or len(b) < 5 + b[1]:
+                    return
+                (n, addr) = (b[1], b[2] | (b[3] << 8))
+                self.eepromwrites.append(bytes(b[:5 + n]))
+                self.tap.cfg.eeprom[addr:addr + n] = b[5:5 + n]
+                self.reply(b[:1])
+                del b[:5 + n]
+            else:
+                raise IOError("unknown command 0x%02x" % c)
+
+def make(idcode = 0x02218093, fw = 130, user = None):
+    """Return the Handle of a new emulated board, user the circuit behind USER1."""
+    return Handle(TAP(Config(idcode, fw), user))
+
+def bitfile(path, blocks, fw = 130, idcode = 0x02218093, cor1 = 0x0002, crc = True):
+    """
+    Write a .bit file with one FAR + FDRI write for each (far, words) in
+    blocks, words holding whole frames of fw words. cor1 defaults to the
+    JtagClk startup clock. With crc set the CRC write carries the CRC of
+    the data, otherwise a wrong one.
+    """
+    from bitstream import config_crcs
+    t1 = lambda op, reg, cnt: (1 << 13) | (op << 11) | (reg << 5) | cnt
+    w = [0xffff, 0xffff, 0xaa99, t1(2, 5, 1), 7, t1(2, 0x0d, 1), fw - 1,
+         t1(2, 0x0e, 2), idcode >> 16, idcode & 0xffff, t1(2, 0x0a, 1), cor1]
+    for (far, words) in blocks:
+        n = len(words) + fw     # the pad frame that flushes the pipeline
+        w += [t1(2, 1, 2), far >> 16, far & 0xffff, t1(2, 5, 1), 1, t1(2, 3, 0), 0x5000, n >> 16, n & 0xffff]
+        w += list(words) + [0] * fw
+    w += [t1(2, 0, 1), 0, t1(2, 5, 1), 5, 0x2000, 0x2000]
+    data = struct.pack(">%dH" % len(w), *w)
+    for (offset, stored, computed) in config_crcs(data, 5):
+        w[offset] = computed if crc else computed ^ 0x1234
+    data = struct.pack(">%dH" % len(w), *w)
+    hdr = struct.pack(">H", 9) + b"\x0f\xf0" * 4 + b"\x00" + struct.pack(">H", 1)
+    design = b"test.ncd;UserID=0x1234\0"
+    hdr += b"a" + struct.pack(">H", len(design)) + design
+    hdr += b"e" + struct.pack(">I", len(data))
+    with open(path, "wb") as f:
+        f.write(hdr + data)
+    return data
@@ -0,0 +1,29 @@
+import asyncio
+
+import fakexula
+
+def test_concurrent_register_reads_share_one_batch(board):
+    import xula
+    from asyncxula import AsyncXuLA
+    (x, h) = board
+    h.tap.cfg.regs[xula.COR1_REG] = 0x3d08
+    async def main():
+        async with AsyncXuLA(x) as ax:
+            values = await asyncio.gather(ax.status(), ax.rdreg(xula.COR1_REG), ax.rdreg(xula.IDCODE_REG))
+            return (values, ax.batches)
+    (values, batches) = asyncio.run(main())
+    assert values == [fakexula.STAT_INIT, 0x3d08, xula.XC3S200A_IDCODE]
+    assert batches == 1
+
+def test_failed_batch_raises_in_every_waiter(board, monkeypatch):
+    import xula
+    from asyncxula import AsyncXuLA
+    (x, h) = board
+    def fail(regs):
+        raise xula.DeviceError("USB read timeout")
+    monkeypatch.setattr(x, "rdregs", fail)
+    async def main():
+        async with AsyncXuLA(x) as ax:
+            return await asyncio.gather(ax.status(), ax.rdreg(xula.COR1_REG), return_exceptions = True)
+    errors = asyncio.run(main())
+    assert [type(e) for e in errors] == [xula.DeviceError, xula.DeviceError]
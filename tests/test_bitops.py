@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+import bitops
+from conftest import frames
+
+BACKENDS = ["stdlib", pytest.param("numpy", marks = pytest.mark.skipif(bitops.numpy is None, reason = "NumPy is not installed"))]
+
+@pytest.fixture(params = BACKENDS)
+def backend(request):
+    old = bitops.backend
+    yield bitops.set_backend(request.param)
+    bitops.set_backend(old)
+
+def reference_pack(bits, bitorder):
+    r = bytearray((len(bits) + 7) // 8)
+    for (i, b) in enumerate(bits):
+        r[i // 8] |= b << (i % 8 if bitorder == "little" else 7 - i % 8)
+    return bytes(r)
+
+@pytest.mark.parametrize("bitorder", ["little", "big"])
+@pytest.mark.parametrize("n", [0, 1, 7, 8, 9, 1000])
+def test_backends_pack_and_unpack_like_the_reference(backend, bitorder, n):
+    bits = bytes(random.Random(n).getrandbits(1) for i in range(n))
+    data = bitops.packbits(bits, bitorder)
+    assert data == reference_pack(bits, bitorder)
+    assert bitops.unpackbits(data, n, bitorder) == bits
+
+def test_reverse_flips_every_byte():
+    assert bitops.reverse(bytes([0x01, 0x80, 0x0f, 0xa5])) == bytes([0x80, 0x01, 0xf0, 0xa5])
+    assert bitops.int_to_bits(0b1101, 5) == bytes([1, 0, 1, 1, 0])
+
+def test_load_and_readback_agree_on_every_backend(backend, board, make_bitfile):
+    (x, h) = board
+    bs = make_bitfile("design.bit", [(0, frames(0x1234, 0x8001, 0xffff))])
+    x.load(bs)
+    assert h.tap.cfg.frames[1] == frames(0x8001)
+    assert x.verify(bs)
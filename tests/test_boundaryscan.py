@@ -0,0 +1,30 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+from boundaryscan import Bsdl, BoundaryScan
+
+def bsdl(length):
+    cells = ",\" &\n  \"".join("%d (BC_2, *, internal, 0)" % i for i in reversed(range(length)))
+    return Bsdl("""
+entity XC3S200A_VQ100 is
+attribute INSTRUCTION_LENGTH of XC3S200A_VQ100 : entity is 6;
+attribute INSTRUCTION_OPCODE of XC3S200A_VQ100 : entity is
+  "EXTEST  (001111)," &
+  "SAMPLE  (000001)," &
+  "BYPASS  (111111)";
+attribute BOUNDARY_LENGTH of XC3S200A_VQ100 : entity is %d;
+attribute BOUNDARY_REGISTER of XC3S200A_VQ100 : entity is
+  "%s";
+end XC3S200A_VQ100;
+""" % (length, cells))
+
+@pytest.mark.parametrize("length", [12, 600])
+def test_snapshots_do_not_overrun_the_in_endpoint(board, length):
+    (x, h) = board
+    bs = BoundaryScan(x, bsdl(length), asarray = False)
+    # the emulated firmware refuses OUT packets with more than INCAP bytes unread
+    (times, snaps) = bs.snapshots(40)
+    assert len(times) == len(snaps) == 40
+    assert all(len(s) == (length + 7) // 8 for s in snaps)
+    assert times == sorted(times)
@@ -0,0 +1,54 @@
+import gzip
+
+import pytest
+
+import fakexula
+from bitstream import BitFile, BramMap, bram_crc_bits, patch_bram
+from conftest import FW, frames
+
+FRAME_BITS = 16 * FW
+
+def bitfile(path, crc = True):
+    """CLB frames, then one block RAM frame in a second FDRI write; with crc set the CRC checks out."""
+    fakexula.bitfile(path, [(0, frames(1, 2)), (0x100, frames(0))], FW, crc = crc)
+    return path
+
+def brammap(first):
+    m = BramMap()
+    m.bits["RAMB16_X0Y0"] = { n: first + n for n in range(16) }
+    return m
+
+# bit offset of the block RAM frame: two CLB frames and their pad frame come first
+RAM = 3 * FRAME_BITS
+
+def test_patch_in_the_second_fdri_write(tmp_path):
+    path = bitfile(str(tmp_path / "design.bit"))
+    assert patch_bram(path, brammap(RAM), { "RAMB16_X0Y0": b"\x01\x80" }) == [2]
+    bs = BitFile(path)
+    img = bs.image()
+    assert bytes(img.frame(2)[:2]) == b"\x80\x01"
+    assert bytes(img.frame(1)) == bytes([0, 2]) * FW
+    assert bram_crc_bits(bs.tobytes()) == 5
+
+@pytest.mark.parametrize("offset", [RAM + FRAME_BITS - 8, 2 * FRAME_BITS, -1])
+def test_offsets_outside_the_frame_data_are_refused(tmp_path, offset):
+    path = bitfile(str(tmp_path / "design.bit"))
+    before = open(path, "rb").read()
+    with pytest.raises(ValueError):
+        patch_bram(path, brammap(offset), { "RAMB16_X0Y0": b"\xff\xff" })
+    assert open(path, "rb").read() == before
+
+def test_unreproducible_crc_is_refused(tmp_path):
+    path = bitfile(str(tmp_path / "design.bit"), crc = False)
+    before = open(path, "rb").read()
+    with pytest.raises(ValueError):
+        patch_bram(path, brammap(RAM), { "RAMB16_X0Y0": b"\xff\xff" })
+    assert open(path, "rb").read() == before
+
+def test_compressed_file_is_refused(tmp_path):
+    path = bitfile(str(tmp_path / "design.bit"))
+    gz = str(tmp_path / "design.bit.gz")
+    with gzip.open(gz, "wb") as f:
+        f.write(open(path, "rb").read())
+    with pytest.raises(ValueError):
+        patch_bram(gz, brammap(RAM), { "RAMB16_X0Y0": b"\xff\xff" })
@@ -0,0 +1,48 @@
+import gzip
+import lzma
+
+import pytest
+
+import fakexula
+from bitstream import BitFile, InvalidBitstream, read_chunks
+from conftest import FW, BLOCKS
+
+def compressed(path, method, cut = 0):
+    """Write a copy of .bit file path compressed with method, less its last cut bytes."""
+    raw = open(path, "rb").read()
+    out = path + "." + method
+    opener = gzip.open if method == "gz" else lzma.open
+    with opener(out, "wb") as f:
+        f.write(raw[:len(raw) - cut])
+    return out
+
+@pytest.mark.parametrize("method, name", [("gz", "gzip"), ("xz", "xz")])
+def test_compressed_file_loads_like_the_plain_one(board, tmp_path, method, name):
+    (x, h) = board
+    path = str(tmp_path / "design.bit")
+    data = fakexula.bitfile(path, BLOCKS, FW)
+    bs = BitFile(compressed(path, method))
+    assert bs.compression == name
+    assert b"".join(bs.chunks(chunksize = 1000, depth = 2)) == data
+    assert any("compressed" in w for w in bs.validate())
+    x.load(bs)
+    assert h.tap.cfg.frames[0x100 + 1] == [5] * FW
+    assert x.verify(bs)
+
+def test_truncated_compressed_file_fails_while_streaming(tmp_path):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW)
+    bs = BitFile(compressed(path, "gz", cut = 100))
+    got = []
+    with pytest.raises(InvalidBitstream, match = "ends after"):
+        for c in bs.chunks(chunksize = 512):
+            got.append(c)
+    assert sum(len(c) for c in got) == bs.fieldLength - 100
+
+def test_chunks_can_be_abandoned(tmp_path):
+    path = str(tmp_path / "data")
+    with open(path, "wb") as f:
+        f.write(bytes(10000))
+    chunks = read_chunks(open(path, "rb"), 10000, chunksize = 100, depth = 2)
+    assert len(next(chunks)) == 100
+    chunks.close()      # stops and joins the reader thread
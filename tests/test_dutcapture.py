@@ -0,0 +1,51 @@
+import struct
+import time
+
+import pytest
+
+import fakexula
+
+@pytest.fixture
+def dutboard():
+    """XuLA of an emulated board with a 12-output HostIo DUT module 255 behind USER1."""
+    pytest.importorskip("usb")
+    import transport
+    import xula
+    x = xula.XuLA(transport = transport.LegacyTransport(fakexula.make(user = fakexula.HostIoDut())))
+    x.querychain()
+    x.select(xula.XC3S200A_IDCODE)
+    return x
+
+def samples(chunk):
+    return list(struct.unpack("<%dH" % (len(chunk) // 2), chunk))
+
+def test_chunks_hold_consecutive_samples(dutboard):
+    from dutcapture import DutCapture
+    cap = DutCapture(dutboard, 255, batch = 64, ringsize = 256, asarray = False)
+    assert cap.width == 12
+    got = []
+    with cap:
+        while len(got) < 5 * 64:
+            got += samples(cap.get(timeout = 5))
+    assert got[:5 * 64] == list(range(5 * 64))
+    assert cap.error is None
+
+def test_full_ring_drops_new_batches_and_keeps_old_ones(dutboard):
+    from dutcapture import DutCapture
+    cap = DutCapture(dutboard, 255, width = 12, batch = 32, ringsize = 64, asarray = False)
+    cap.start()
+    t = time.time()
+    while not cap.dropped and time.time() - t < 5:
+        time.sleep(0.01)
+    cap.stop()
+    assert cap.dropped
+    chunks = list(cap)
+    assert [samples(c) for c in chunks] == [list(range(32)), list(range(32, 64))]
+    assert cap.samples == 64 + cap.dropped
+
+def test_numpy_chunks_have_one_element_per_sample(dutboard):
+    pytest.importorskip("numpy")
+    from dutcapture import DutCapture
+    with DutCapture(dutboard, 255, batch = 16, ringsize = 32, asarray = True) as cap:
+        chunk = cap.get(timeout = 5)
+    assert chunk.tolist() == list(range(16))
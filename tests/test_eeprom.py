@@ -0,0 +1,39 @@
+import pytest
+
+def test_writes_go_out_in_full_packets(board):
+    import xula
+    (x, h) = board
+    data = bytes(range(60))
+    x.write_eeprom(0x10, data)
+    # cmd, len, 24-bit address (the upper byte always 0), then the data
+    assert h.eepromwrites == [bytes([0x05, 27, 0x10, 0, 0]) + data[:27],
+                              bytes([0x05, 27, 0x2b, 0, 0]) + data[27:54],
+                              bytes([0x05, 6, 0x46, 0, 0]) + data[54:]]
+    assert h.tap.cfg.eeprom[0x10:0x10 + 60] == data
+    assert x.read_eeprom(0x10, 60) == data
+
+def test_backup_and_restore_round_trip(board, tmp_path):
+    (x, h) = board
+    h.tap.cfg.eeprom[:] = bytes(255 - i for i in range(256))
+    path = str(tmp_path / "xula.eep")
+    saved = x.backup_eeprom(path)
+    h.tap.cfg.eeprom[:] = bytes(256)
+    assert x.restore_eeprom(path)
+    assert bytes(h.tap.cfg.eeprom) == saved
+
+def test_out_of_range_access_raises_eeprom_error(board):
+    import xula
+    (x, h) = board
+    with pytest.raises(xula.EepromError):
+        x.write_eeprom(250, bytes(10))
+    with pytest.raises(xula.EepromError):
+        x.read_eeprom(-1, 2)
+    assert h.eepromwrites == []
+
+def test_settings_report_a_failed_verify(board, monkeypatch):
+    import eeprom
+    import xula
+    (x, h) = board
+    monkeypatch.setattr(x, "read_eeprom", lambda: bytes(256))
+    with pytest.raises(xula.EepromError):
+        eeprom.settings(x, [(0xfe, 0xac)])
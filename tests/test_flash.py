@@ -0,0 +1,19 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+import xula
+
+def test_open_without_the_interface_fails_and_returns_the_flash(board):
+    (x, h) = board
+    with pytest.raises(xula.FlashError):
+        with xula.FlashSession(x, doStart = False):
+            pass
+    assert h.flashpin == 0
+
+def test_open_returns_the_flash_when_loading_the_interface_fails(board, tmp_path, monkeypatch):
+    (x, h) = board
+    monkeypatch.chdir(tmp_path)                         # no fintf_jtag.bit here
+    with pytest.raises(OSError):
+        xula.FlashSession(x, doStart = True).open()
+    assert h.flashpin == 0
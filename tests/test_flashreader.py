@@ -0,0 +1,37 @@
+import pytest
+
+def open_reader(flashboard, dataWidth = 8, **kw):
+    import xula
+    # a 4 KB flash: 4096 bytes in words of dataWidth bits
+    (x, fintf) = flashboard(size = 4096, dataWidth = dataWidth, addrWidth = 12 - dataWidth // 16)
+    fintf.flash[:] = bytes(i * 7 & 0xff for i in range(4096))
+    f = xula.FlashSession(x, doStart = False)
+    f.open()
+    return (f.reader(**kw), fintf)
+
+def test_sequential_reads_fetch_readahead_blocks(flashboard):
+    (r, fintf) = open_reader(flashboard, blockSize = 256, readahead = 4)
+    assert r.read(256) == bytes(fintf.flash[:256])
+    assert r.read(300) == bytes(fintf.flash[256:556])
+    assert fintf.reads == [(0, 256), (256, 1024)]
+    assert r.tell() == 556
+    assert r[600:700] == bytes(fintf.flash[600:700])
+    assert r.transfers == 2
+
+@pytest.mark.parametrize("key", [slice(None, None, -1), slice(10, 0, -3), slice(5, 2000, 7),
+                                 slice(-10, None), slice(100, 50), slice(4000, 9000, 2)])
+def test_slices_match_bytes_slicing(flashboard, key):
+    (r, fintf) = open_reader(flashboard)
+    assert r[key] == bytes(fintf.flash)[key]
+
+def test_reads_stop_at_the_end_of_flash(flashboard):
+    (r, fintf) = open_reader(flashboard, size = 1001, blockSize = 512)
+    assert r.pread(990, 100) == bytes(fintf.flash[990:1001])
+    assert r[-1] == fintf.flash[1000]
+    with pytest.raises(IndexError):
+        r[1001]
+
+def test_reads_of_wide_flash_stay_word_aligned(flashboard):
+    (r, fintf) = open_reader(flashboard, dataWidth = 16, size = 1001, blockSize = 512)
+    assert r[990:] == bytes(fintf.flash[990:1001])
+    assert all(a % 2 == 0 and n % 2 == 0 for (a, n) in fintf.reads)
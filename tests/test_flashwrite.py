@@ -0,0 +1,38 @@
+import pytest
+
+import fakexula
+from conftest import FW, frames
+
+def test_each_block_costs_one_write_and_one_read(flashboard, tmp_path):
+    from bitstream import BitFile
+    (x, fintf) = flashboard(blockWidth = 8)
+    path = str(tmp_path / "design.bit")
+    data = fakexula.bitfile(path, [(0, frames(*range(8)))], FW, cor1 = 0x0000)   # CCLK startup
+    assert x.write_flash(BitFile(path), 0x1000, False)
+    assert bytes(fintf.flash[0x1000:0x1000 + len(data)]) == data
+    stats = x.flashstats
+    assert stats.bytes == len(data)
+    assert stats.blocks == (len(data) + 255) // 256
+    assert stats.polls == stats.blocks
+    assert stats.writes == stats.reads == stats.blocks
+
+def test_erase_polls_until_done(flashboard):
+    import xula
+    (x, fintf) = flashboard()
+    fintf.flash[:4] = b"\x00\x01\x02\x03"
+    with xula.FlashSession(x) as f:
+        events = []
+        f.erase(events.append)
+        f.write(0, b"\x55" * 600)
+        assert f.read(0, 601) == b"\x55" * 600 + b"\xff"
+    assert [e.phase for e in events] == ["erase"] * 3
+    assert fintf.ops[0x0b] == 1
+
+def test_failed_block_raises(flashboard):
+    import xula
+    (x, fintf) = flashboard()
+    fintf.fail = True
+    with xula.FlashSession(x) as f:
+        with pytest.raises(xula.FlashError):
+            f.write(0, bytes(300))
+    assert fintf.ops[0x0d] == 1
@@ -0,0 +1,71 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+import transport
+import xula
+import fakexula
+import inventory
+
+FINTF = 0x0f1a5400
+
+class Device:
+    """What find_devices() returns for a board, as far as inventory() looks."""
+    def __init__(self, port, address):
+        self.filename = port
+        self.devnum = address
+        self.handle = fakexula.make()
+        self.handle.tap.cfg.stat |= fakexula.STAT_DONE
+
+@pytest.fixture
+def boards(monkeypatch):
+    monkeypatch.setattr(inventory, "XuLA", lambda device: xula.XuLA(transport = transport.LegacyTransport(device.handle)))
+    return [Device("1-1", 5), Device("1-2", 6)]
+
+def test_user_designs_are_not_probed(boards):
+    boards[0].handle.tap.usercode = 0x12345678
+    rows = inventory.scan(boards, fintf = FINTF)
+    assert [r["error"] for r in rows] == [None, None]
+    assert rows[0]["usercode"] == "0x12345678" and rows[0]["done"]
+    assert rows[0]["flash_data_width"] is None
+    for b in boards:
+        assert fakexula.IR_USER1 not in b.handle.tap.irs
+        assert b.handle.flashpin == 0
+
+def test_cheap_fields_are_read_on_every_scan(boards):
+    cache = { r["port"]: r for r in inventory.scan(boards, fintf = FINTF) }
+    boards[0].handle.tap.usercode = 0x0badcafe         # a new design, same USB address
+    boards[1].handle.tap.cfg.stat = 0
+    rows = inventory.scan(boards, cache, FINTF)
+    assert rows[0]["usercode"] == "0x0badcafe"
+    assert rows[1]["done"] is False
+
+def test_flash_geometry_comes_from_the_cache(boards):
+    h = boards[0].handle
+    h.tap.usercode = FINTF
+    row = inventory.scan(boards[:1], fintf = FINTF)[0]
+    assert fakexula.IR_USER1 in h.tap.irs              # probed: the interface design is loaded
+    assert h.flashpin == 0
+    # the emulation has no USER1 circuit, so the probe fails
+    assert row["error"] == "The FPGA does not hold the Flash interface circuit"
+    row.update(flash_data_width = 8, flash_addr_width = 24, flash_block_size = 1024, error = None)
+    del h.tap.irs[:]
+    row = inventory.scan(boards[:1], { "1-1": row }, FINTF)[0]
+    assert (row["flash_data_width"], row["flash_block_size"]) == (8, 1024)
+    assert fakexula.IR_USER1 not in h.tap.irs
+    boards[0].devnum = 9                                # replugged: probed again
+    row = inventory.scan(boards[:1], { "1-1": row }, FINTF)[0]
+    assert fakexula.IR_USER1 in h.tap.irs
+
+class Garbled(fakexula.Handle):
+    """Firmware that answers INFO with a bad checksum."""
+    def bulkRead(self, ep, n, timeout = 0):
+        return bytes([1]) * n
+
+def test_a_board_that_does_not_answer_is_reported(boards, monkeypatch):
+    boards[1].handle = Garbled(boards[1].handle.tap)
+    rows = inventory.scan(boards)
+    assert rows[0]["error"] is None
+    assert rows[1]["error"] == "Device info checksum error"
+    with pytest.raises(xula.DeviceError):
+        xula.XuLA(transport = transport.LegacyTransport(boards[1].handle))
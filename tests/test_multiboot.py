@@ -0,0 +1,32 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+import xula
+from multiboot import MultiBootLayout
+from conftest import FW
+
+def layout(make_bitfile, n, slot = xula.MULTIBOOT_SLOT):
+    return MultiBootLayout([make_bitfile("image%d.bit" % i, [(0, [i] * FW)]) for i in range(n)], slot)
+
+def test_layout_must_fit_the_flash(make_bitfile):
+    m = layout(make_bitfile, 3)
+    m.check(4 * xula.MULTIBOOT_SLOT, 256)
+    with pytest.raises(xula.FlashError):
+        m.check(2 * xula.MULTIBOOT_SLOT + 16, 256)
+    with pytest.raises(xula.FlashError):
+        layout(make_bitfile, 2, slot = 0x10100).check(1 << 22, 1024)
+
+def test_reboot_hands_the_flash_back(board, monkeypatch):
+    (x, h) = board
+    status = x.reboot_to(1)
+    assert status & xula.STAT_DONE
+    address = xula.MULTIBOOT_SLOT
+    assert h.tap.cfg.regs[0x13] == address & 0xffff
+    assert h.tap.cfg.regs[0x14] & 0xff == address >> 16
+    assert h.flashpin == 0
+    monkeypatch.setattr(xula, "REBOOT_TIMEOUT", 0.01)
+    monkeypatch.setattr(x, "rdreg", lambda reg: 0)
+    with pytest.raises(xula.StatusTimeout):
+        x.reboot(0)
+    assert h.flashpin == 0
@@ -0,0 +1,27 @@
+import fakexula
+from conftest import frames
+
+def test_load_reports_progress_and_prints_nothing(board, make_bitfile, capsys):
+    (x, h) = board
+    bs = make_bitfile("design.bit", [(0, frames(7, 7, 7, 7))])
+    events = []
+    x.load(bs, progress = events.append)
+    configure = [e for e in events if e.phase == "configure"]
+    assert configure[0].done == 0
+    assert configure[-1].done == configure[-1].total == len(bs) // 8
+    assert [e.done for e in configure] == sorted(e.done for e in configure)
+    assert capsys.readouterr().out == ""
+
+def test_register_helpers_return_values_quietly(board, capsys):
+    (x, h) = board
+    assert x.status() == fakexula.STAT_INIT
+    assert x.resetcrc() == (0, 0)
+    assert x.DNA() == h.tap.dna
+    assert capsys.readouterr().out == ""
+
+def test_verbose_status_prints_the_fields(board, capsys):
+    (x, h) = board
+    x.verbose = True
+    x.status()
+    out = capsys.readouterr().out
+    assert "status = 1000" in out
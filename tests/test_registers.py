@@ -0,0 +1,26 @@
+import struct
+
+import fakexula
+
+def test_dump_reads_every_register_in_one_round_trip(loaded):
+    import xula
+    (x, h, bs) = loaded
+    h.tap.cfg.regs[xula.MASK_REG] = 0x00c0
+    (cfgin, cfgout) = (h.tap.irs.count(fakexula.IR_CFG_IN), h.tap.irs.count(fakexula.IR_CFG_OUT))
+    regs = x.dump_config_registers()
+    assert h.tap.irs.count(fakexula.IR_CFG_IN) - cfgin == 2       # the reads, then the DESYNC
+    assert h.tap.irs.count(fakexula.IR_CFG_OUT) - cfgout == 1
+    assert regs["IDCODE"] == xula.XC3S200A_IDCODE
+    assert regs[xula.COR1_REG] == 0x0002
+    assert regs[xula.MASK_REG] == 0x00c0
+    assert regs.stat["DONE"] == 1 and regs.stat["INIT"] == 1
+    assert regs.far == h.tap.cfg.far()
+    assert set(regs.asdict()) >= {"STAT", "CTL", "COR1", "IDCODE", "CRC", "FAR_MAJ", "FAR_MIN"}
+
+def test_packets_pick_the_header_type_by_count():
+    import xula
+    p = xula.ConfigPackets().sync().read(xula.STAT_REG).noop().write(xula.COR1_REG, 0x3d08)
+    p.read(xula.FDRO_REG, 0x1234)
+    words = struct.unpack(">%dH" % (len(p) // 2), p.tobytes())
+    assert words == (0xaa99, 0x2000, 0x2901, 0x2000, 0x3141, 0x3d08,
+                     0x2880, 0x4800, 0x0000, 0x1234)
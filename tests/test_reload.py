@@ -0,0 +1,43 @@
+import pytest
+
+from bitstream import diff_frames, frame_runs
+from conftest import FW, frames
+
+# CLB frames at FAR 0, then block RAM frames at FAR 0x100 in a second FDRI write
+OLD = [(0, frames(1, 2, 3, 4)), (0x100, frames(5, 6, 7))]
+NEW = [(0, frames(1, 2, 3, 9)), (0x100, frames(8, 6, 7))]
+
+def test_every_fdri_write_is_decoded(make_bitfile):
+    img = make_bitfile("old.bit", OLD).image()
+    assert img.layout() == [(0, 4), (0x100, 3)]
+    assert len(img) == 7
+    assert img.starts == [0, 4]
+    assert bytes(img.frame(4)) == bytes([0, 5]) * FW
+    with pytest.raises(AssertionError):
+        img.frames(3, 2)
+
+def test_changes_in_the_second_fdri_write_are_found(make_bitfile):
+    a = make_bitfile("old.bit", OLD).image()
+    b = make_bitfile("new.bit", NEW).image()
+    changed = diff_frames(a, b)
+    assert changed == [3, 4]
+    assert frame_runs(changed) == [(3, 2)]
+    assert frame_runs(changed, starts = b.starts) == [(3, 1), (4, 1)]
+
+def test_framemap_walks_each_fdri_write(board, make_bitfile):
+    (x, h) = board
+    img = make_bitfile("old.bit", OLD).image()
+    assert x.discover_framemap(img).fars == [0, 1, 2, 3, 0x100, 0x101, 0x102]
+
+def test_reload_writes_frames_of_both_fdri_writes(board, make_bitfile):
+    (x, h) = board
+    old = make_bitfile("old.bit", OLD)
+    new = make_bitfile("new.bit", NEW)
+    x.load(old)
+    h.tap.cfg.written = 0
+    r = x.reload(old, new)
+    assert not r.full
+    assert r.runs == [(3, 1), (4, 1)]
+    assert h.tap.cfg.written == 2
+    mem = h.tap.cfg.frames
+    assert (mem[3][0], mem[0x100][0], mem[0x101][0]) == (9, 8, 6)
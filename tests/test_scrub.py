@@ -0,0 +1,18 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+from conftest import FW
+from scrub import Scrubber
+
+def test_scrub_covers_every_fdri_write(loaded):
+    (x, h, bs) = loaded
+    s = Scrubber(x, bs, slice = 2, repair = True)
+    s.framemap = x.discover_framemap(bs.image())
+    h.tap.cfg.frames[0x100][3] ^= 0x0040
+    s.scrub()
+    assert s.passes == 1 and s.frames == 5
+    assert [(e.frame, e.far) for e in s.events] == [(3, 0x100)]
+    assert h.tap.cfg.frames[0x100] == [4] * FW
+    s.scrub()
+    assert len(s.events) == 1
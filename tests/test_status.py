@@ -0,0 +1,31 @@
+import pytest
+
+import fakexula
+
+def test_load_records_phase_timings(loaded):
+    (x, h, bs) = loaded
+    assert {"jprogram", "cfg_in", "startup"} <= set(x.timings)
+    assert h.tap.cfg.stat & fakexula.STAT_DONE
+
+def test_wait_status_times_out_after_stepping(board):
+    import xula
+    (x, h) = board
+    steps = []
+    with pytest.raises(xula.StatusTimeout) as e:
+        x.wait_status(xula.STAT_DONE, xula.STAT_DONE, 0.05, "startup", lambda: steps.append(1))
+    assert "startup" in str(e.value)
+    assert steps
+    assert "startup" not in x.timings
+
+def test_wait_status_returns_once_the_condition_holds(board):
+    import xula
+    (x, h) = board
+    polls = []
+    def step():
+        polls.append(1)
+        if len(polls) == 3:
+            h.tap.cfg.stat |= fakexula.STAT_DONE
+    status = x.wait_status(xula.STAT_DONE, xula.STAT_DONE, 5, "startup", step)
+    assert status & xula.STAT_DONE
+    assert len(polls) == 3
+    assert "startup" in x.timings
@@ -0,0 +1,24 @@
+import fakexula
+
+def test_navigation_is_one_write_and_no_read(board):
+    (x, h) = board
+    x.tlr()
+    (writes, reads) = (h.writes, h.reads)
+    x.initTAP()
+    assert x.state() == "Shift-IR" and h.tap.st == fakexula.SHIFT_IR
+    x.sendir(x.USERCODE)
+    x.go_states(1, 1, 0, 0)
+    assert x.state() == "Shift-DR" and h.tap.st == fakexula.SHIFT_DR
+    assert h.tap.ir == fakexula.IR_USERCODE
+    assert h.writes - writes == 3
+    assert h.reads == reads
+    x.tlr()
+    assert h.tap.st == fakexula.TLR
+
+def test_reads_turn_the_replies_back_on(board):
+    import xula
+    (x, h) = board
+    x.initTAP()
+    assert x.quiet and not h.ret
+    assert x.idcode() == xula.XC3S200A_IDCODE
+    assert x.usercode() == h.tap.usercode
@@ -0,0 +1,105 @@
+import array
+import struct
+
+import pytest
+
+usb = pytest.importorskip("usb")
+pytest.importorskip("usb.core")
+
+import transport
+import xula
+import fakexula
+from conftest import FW
+
+class Device:
+    """A pyusb 1.x device whose endpoints reach the emulated firmware."""
+    def __init__(self, handle):
+        self.handle = handle
+        self.reads = []     # buffers handed to read()
+        self.writes = []    # data handed to write()
+
+    def is_kernel_driver_active(self, i):
+        return False
+
+    def set_configuration(self):
+        pass
+
+    def clear_halt(self, ep):
+        pass
+
+    def write(self, ep, data, timeout = None):
+        self.writes.append(data)
+        return self.handle.bulkWrite(ep, data, timeout)
+
+    def read(self, ep, buf, timeout = None):
+        # pyusb reads into array('B') buffers only and allocates anything else
+        assert isinstance(buf, array.array)
+        self.reads.append(buf)
+        r = self.handle.bulkRead(ep, len(buf), timeout)
+        buf[:len(r)] = array.array('B', r)
+        return len(r)
+
+@pytest.fixture
+def coreboard(monkeypatch):
+    monkeypatch.setattr(usb.util, "claim_interface", lambda device, i: None)
+    device = Device(fakexula.make())
+    t = transport.CoreTransport(device)
+    x = xula.XuLA(transport = t)
+    x.querychain()
+    x.select(xula.XC3S200A_IDCODE)
+    return (x, t, device)
+
+def test_bulk_reads_go_into_the_callers_array(coreboard):
+    (x, t, device) = coreboard
+    t.rx.clear()
+    del device.reads[:]
+    assert x.idcode() == xula.XC3S200A_IDCODE          # bulktdo
+    assert device.reads
+    assert t.rx == {}                                   # the copy path was never taken
+
+def test_bulktditdo_reads_through_reused_spares(coreboard):
+    (x, t, device) = coreboard
+    x.LoadBSIRthenBSDR(x.IDCODE, None)
+    x.go_states(1, 0, 0)
+    assert x.recvbs(32, 0xa5a5a5a5) == xula.XC3S200A_IDCODE  # bulktditdo
+    x.LoadBSIRthenBSDR(x.IDCODE, None)
+    x.go_states(1, 0, 0)
+    spares = { id(a) for a in t.rx.values() }
+    del device.reads[:]
+    x.recvbs(32 * 24, 1 << 700)                         # several USB packets
+    assert len(device.reads) >= 3
+    assert { id(a) for a in device.reads } <= spares    # no array allocated per packet
+
+def test_bulktditdo_sends_slices_of_the_source(coreboard, monkeypatch):
+    (x, t, device) = coreboard
+    x.LoadBSIRthenBSDR(x.IDCODE, None)
+    x.go_states(1, 0, 0)
+    sent = []
+    write = t.write
+    monkeypatch.setattr(t, "write", lambda data, timeout = 1000: (sent.append(data), write(data, timeout))[1])
+    data = bytes(range(96))
+    x.bulktditdo(data, 8 * len(data))
+    packets = [d for d in sent if len(d) == xula.USB_PACKET_SIZE]
+    assert len(packets) == 3
+    assert all(isinstance(d, memoryview) and d.obj is data for d in packets)
+
+def test_batched_writes_pass_through_as_arrays(coreboard):
+    (x, t, device) = coreboard
+    del device.writes[:]
+    t.tx.clear()
+    with x.batched():
+        x.go_states(1, 0, 0)
+        x.bulktdibytes(bytes(100), 800)
+    assert len(device.writes) == 1
+    assert isinstance(device.writes[0], array.array)
+    x.ticks([(0, 0), (1, 1)])
+    assert isinstance(device.writes[-1], array.array)
+    assert t.tx == {}                                   # nothing was copied into a spare
+
+def test_readback_uses_arrays(coreboard, make_bitfile):
+    (x, t, device) = coreboard
+    x.load(make_bitfile("design.bit", [(0, list(range(FW * 8)))]))
+    t.rx.clear()
+    data = x.readback(8, FW, 0)
+    assert data == struct.pack(">%dH" % (FW * 8), *range(FW * 8))
+    assert t.rx == {}
@@ -0,0 +1,44 @@
+import pytest
+
+import fakexula
+from conftest import FW, BLOCKS
+
+def session(x, bs):
+    """The host side of a session: find the FPGA, load bs, read STAT and USERCODE."""
+    import xula
+    x.querychain()
+    x.select(xula.XC3S200A_IDCODE)
+    x.load(bs)
+    return (x.status(), x.usercode())
+
+@pytest.fixture
+def recorded(tmp_path, make_bitfile):
+    """(trace file, BitFile, session result) of a session recorded on the emulator."""
+    pytest.importorskip("usb")
+    import transport
+    import xula
+    from usbtrace import RecordingTransport
+    bs = make_bitfile("design.bit", BLOCKS)
+    trace = str(tmp_path / "job.trc.gz")
+    h = fakexula.make(fw = FW)
+    t = RecordingTransport(transport.LegacyTransport(h), trace)
+    result = session(xula.XuLA(transport = t), bs)
+    t.finish()
+    return (trace, bs, result, h)
+
+def test_replay_answers_like_the_board(recorded):
+    import xula
+    from usbtrace import ReplayTransport, TraceStats
+    (trace, bs, result, h) = recorded
+    assert result[0] & fakexula.STAT_DONE
+    assert session(xula.XuLA(transport = ReplayTransport(trace)), bs) == result
+    stats = TraceStats(trace)
+    assert (stats.writes, stats.reads) == (h.writes, h.reads)
+
+def test_replay_names_the_record_where_the_host_diverges(recorded, make_bitfile):
+    import xula
+    from usbtrace import ReplayTransport, TraceMismatch
+    (trace, bs, result, h) = recorded
+    other = make_bitfile("other.bit", [(0, BLOCKS[0][1][::-1])])
+    with pytest.raises(TraceMismatch, match = "write [0-9]+ differs"):
+        session(xula.XuLA(transport = ReplayTransport(trace)), other)
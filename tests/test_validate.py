@@ -0,0 +1,50 @@
+import pytest
+
+import fakexula
+from bitstream import InvalidBitstream, validate_bitfile
+from conftest import FW, frames
+
+BLOCKS = [(0, frames(1, 2))]
+
+def test_good_file_validates_for_jtag(tmp_path):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW)
+    assert validate_bitfile(path, 0x02218093, "jtag") == []
+
+def test_corrupt_crc_is_rejected(tmp_path):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW, crc = False)
+    with pytest.raises(InvalidBitstream, match = "CRC"):
+        validate_bitfile(path)
+
+def test_wrong_idcode_is_rejected(tmp_path):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW, idcode = 0x02210093)
+    with pytest.raises(InvalidBitstream, match = "IDCODE"):
+        validate_bitfile(path, 0x02218093)
+    # the version nibble is ignored
+    assert validate_bitfile(path, 0x12210093) == []
+
+@pytest.mark.parametrize("cor1, target", [(0x0002, "flash"), (0x0000, "jtag")])
+def test_startup_clock_of_the_other_target_is_rejected(tmp_path, cor1, target):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW, cor1 = cor1)
+    with pytest.raises(InvalidBitstream, match = "startup clock"):
+        validate_bitfile(path, target = target)
+
+@pytest.mark.parametrize("target", ["jtag", "flash"])
+def test_userclk_is_a_warning_for_both_targets(tmp_path, target):
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW, cor1 = 0x0001)
+    assert [w for w in validate_bitfile(path, target = target) if "UserClk" in w]
+
+def test_load_fails_before_touching_the_board(board, tmp_path):
+    from bitstream import BitFile
+    (x, h) = board
+    path = str(tmp_path / "design.bit")
+    fakexula.bitfile(path, BLOCKS, FW, crc = False)
+    writes = h.writes
+    with pytest.raises(InvalidBitstream):
+        x.load(BitFile(path))
+    assert h.writes == writes
+    assert fakexula.IR_JPROGRAM not in h.tap.irs
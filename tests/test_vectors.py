@@ -0,0 +1,32 @@
+def test_readback_reads_the_echoes_packet_by_packet(board):
+    (x, h) = board
+    data = bytes(i * 37 & 0xff for i in range(40))
+    x.sync()
+    (writes, reads) = (h.writes, h.reads)
+    run = x.send_vectors(data, readback = True)
+    assert h.vectors == list(data)
+    assert run.count == 40 and run.responses == data
+    assert h.writes - writes == 3       # 16 vectors to a USB packet
+    assert h.reads - reads == 40
+    assert "vectors" in x.timings
+
+def test_without_readback_nothing_is_read(board):
+    import xula
+    (x, h) = board
+    data = bytes(range(256)) * 40
+    (writes, reads) = (h.writes, h.reads)
+    run = x.send_vectors(data)
+    assert run.responses is None
+    assert h.vectors == list(data)
+    assert not h.ret
+    assert h.reads == reads
+    assert h.writes - writes == 1 + 2 * len(data) // xula.XFER_CHUNK
+    # the replies come back on for the next command
+    assert x.get_vector() == data[-1]
+    assert h.ret
+
+def test_progress_counts_vectors(board):
+    (x, h) = board
+    events = []
+    x.send_vectors(bytes(100), readback = True, progress = events.append)
+    assert [e.done for e in events] == [0, 16, 32, 48, 64, 80, 96, 100]
@@ -0,0 +1,22 @@
+import pytest
+
+usb = pytest.importorskip("usb")
+
+def test_verify_reads_every_fdri_write(loaded):
+    (x, h, bs) = loaded
+    r = x.verify(bs)
+    assert r and r.frames == 5 and r.mismatches == []
+
+def test_verify_finds_upsets_after_the_first_fdri_write(loaded):
+    (x, h, bs) = loaded
+    h.tap.cfg.frames[0x101][7] ^= 0x0100
+    h.tap.cfg.frames[0x001][0] ^= 0x0001
+    r = x.verify(bs)
+    assert not r
+    assert r.mismatches == [1, 4]
+
+def test_readback_of_the_second_fdri_write(loaded):
+    (x, h, bs) = loaded
+    img = bs.image()
+    (first, count, far, offset) = img.blocks[1]
+    assert x.readback(count, img.frameWords, far) == bytes(img.frames(first, count))
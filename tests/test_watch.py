@@ -0,0 +1,39 @@
+import os
+
+import fakexula
+from bitstream import InvalidBitstream
+from conftest import FW, BLOCKS, frames
+
+def build(path, blocks, crc = True):
+    """Write a new build of path, with a modification time that differs from the last one."""
+    fakexula.bitfile(path, blocks, FW, crc = crc)
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 1))
+
+def test_unchanged_design_is_not_loaded_again(board, tmp_path):
+    from watch import BitWatcher
+    (x, h) = board
+    path = str(tmp_path / "design.bit")
+    build(path, BLOCKS)
+    w = BitWatcher(x, path, interval = 0.01)
+    assert w.poll().loaded
+    # the emulator does not take the UserID from the bitstream
+    h.tap.usercode = 0x1234
+    jprograms = h.tap.irs.count(fakexula.IR_JPROGRAM)
+    assert w.poll() is None             # nothing changed
+    assert not w.check().loaded
+    assert h.tap.irs.count(fakexula.IR_JPROGRAM) == jprograms
+    build(path, [(0, frames(9, 9, 9))])
+    assert w.poll().loaded
+    assert h.tap.cfg.frames[0] == frames(9)
+
+def test_bad_build_is_reported_not_raised(board, tmp_path):
+    from watch import BitWatcher
+    (x, h) = board
+    path = str(tmp_path / "design.bit")
+    build(path, BLOCKS, crc = False)
+    events = []
+    e = BitWatcher(x, path, interval = 0.01, callback = events.append).poll()
+    assert isinstance(e.error, InvalidBitstream)
+    assert not e.loaded
+    assert events == [e]
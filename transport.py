@@ -0,0 +1,181 @@
+# USB transports for the XuLA class.
+# A transport moves bytes to and from bulk endpoint 1 of the XuLA firmware.
+# XuLA only talks to the Transport interface, so the pyusb 0.x handle API,
+# pyusb 1.x (libusb1) and in-process fakes are interchangeable.
+
+import array
+import sys
+
+import usb
+try:
+    import usb.core
+    import usb.util
+except ImportError:
+    # pyusb 0.x only has the legacy API
+    pass
+
+XULA_VID = 0x04d8
+XULA_PID = 0xff8c
+
+EP_OUT = 0x01   # bulk OUT endpoint 1
+EP_IN  = 0x81   # bulk IN endpoint 1
+
+# CoreTransport keeps spare arrays for transfers up to this size; a larger
+# one, such as a whole bitstream in one write, gets an array of its own
+SPARE_LIMIT = 65536
+
+def has_core():
+    """True when pyusb 1.x (usb.core) is available."""
+    return hasattr(usb, "core")
+
+class Transport:
+    """
+    Interface XuLA uses to reach the firmware.
+
+    write(data) sends a bytes-like object (bytes, bytearray, array or
+    memoryview) to the OUT endpoint. readinto(buf) fills a writable
+    bytes-like buffer from the IN endpoint and returns the byte count.
+    Subclassers provide write and readinto; read(n) is the allocating
+    convenience built on readinto.
+    """
+    def write(self, data, timeout = 1000):
+        raise NotImplementedError
+
+    def readinto(self, buf, timeout = 1000):
+        raise NotImplementedError
+
+    def read(self, n, timeout = 1000):
+        buf = array.array('B', bytes(n))
+        k = self.readinto(buf, timeout)
+        return buf[:k].tobytes()
+
+    def reset(self):
+        """Clear the endpoints before the first command."""
+        pass
+
+    def close(self):
+        pass
+
+class LegacyTransport(Transport):
+    """
+    Transport over a pyusb 0.x device handle, or any object with the same
+    bulkWrite/bulkRead methods (such as an in-process fake of the firmware).
+    """
+    def __init__(self, handle):
+        self.handle = handle
+
+    @classmethod
+    def open(cls, device):
+        handle = device.open()
+        if sys.platform != "win32":
+            # Don't detach under Windows because it will fail when using libusb-win32.
+            try:
+                handle.detachKernelDriver(0)
+            except usb.USBError:
+                pass
+        handle.claimInterface(0)
+        return cls(handle)
+
+    def write(self, data, timeout = 1000):
+        return self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, data, timeout)
+
+    def readinto(self, buf, timeout = 1000):
+        # the 0.x API always returns a new sequence, so this costs one copy
+        r = self.handle.bulkRead(usb.ENDPOINT_IN + 1, len(buf), timeout)
+        n = len(r)
+        if not isinstance(r, (bytes, bytearray, array.array)):
+            r = bytes(r)    # a tuple of ints from pyusb 0.x
+        memoryview(buf)[:n] = memoryview(r).cast('B')
+        return n
+
+    def reset(self):
+        self.handle.resetEndpoint(usb.ENDPOINT_OUT + 1)
+        self.handle.resetEndpoint(usb.ENDPOINT_IN + 1)
+
+class CoreTransport(Transport):
+    """
+    Transport over a pyusb 1.x device (libusb1 backend). pyusb only hands
+    array('B') buffers to libusb as they are, so reads into arrays go
+    straight from libusb into the caller's buffer and writes from arrays
+    are passed through; XuLA's bulk transfer paths use arrays for that.
+    Other buffers, such as memoryview slices of a result array, are
+    filled through a spare array kept for each transfer size, and other
+    bytes-like objects are copied into one before they are written, so
+    no transfer allocates (see SPARE_LIMIT).
+    """
+    def __init__(self, device):
+        self.device = device
+        if sys.platform != "win32":
+            try:
+                if device.is_kernel_driver_active(0):
+                    device.detach_kernel_driver(0)
+            except (NotImplementedError, usb.core.USBError):
+                pass
+        try:
+            device.set_configuration()
+        except usb.core.USBError:
+            pass
+        usb.util.claim_interface(device, 0)
+        self.rx = {}    # spare read arrays by size; a read must not ask for more than wanted
+        self.tx = {}    # spare write arrays by size
+
+    def spare(self, cache, n):
+        a = cache.get(n)
+        if a is None:
+            a = array.array('B', bytes(n))
+            if n <= SPARE_LIMIT:
+                cache[n] = a
+        return a
+
+    def write(self, data, timeout = 1000):
+        if not (isinstance(data, array.array) and data.typecode == 'B'):
+            view = memoryview(data).cast('B')
+            tx = self.spare(self.tx, len(view))
+            memoryview(tx)[:] = view
+            data = tx
+        return self.device.write(EP_OUT, data, timeout)
+
+    def readinto(self, buf, timeout = 1000):
+        if isinstance(buf, array.array) and buf.typecode == 'B':
+            return self.device.read(EP_IN, buf, timeout)
+        rx = self.spare(self.rx, len(buf))
+        k = self.device.read(EP_IN, rx, timeout)
+        memoryview(buf)[:k] = memoryview(rx)[:k]
+        return k
+
+    def reset(self):
+        self.device.clear_halt(EP_OUT)
+        self.device.clear_halt(EP_IN)
+
+    def close(self):
+        usb.util.release_interface(self.device, 0)
+        usb.util.dispose_resources(self.device)
+
+def find_devices():
+    """Return the USB devices of every XuLA board, as pyusb 1.x devices when available."""
+    if has_core():
+        return list(usb.core.find(find_all = True, idVendor = XULA_VID, idProduct = XULA_PID))
+    r = []
+    for bus in usb.busses():
+        for device in bus.devices:
+            if device.idVendor == XULA_VID and device.idProduct == XULA_PID:
+                r.append(device)
+    return r
+
+def device_location(device):
+    """
+    Return (port, address) of a device from find_devices(). port names the
+    USB port the board is plugged into; address is assigned by the host
+    each time the board enumerates, so it changes when the board is
+    replugged, reset or its firmware updated.
+    """
+    if has_core() and isinstance(device, usb.core.Device):
+        ports = ".".join(str(p) for p in device.port_numbers or ())
+        return ("%d-%s" % (device.bus, ports), device.address)
+    return (getattr(device, "filename", ""), getattr(device, "devnum", None))
+
+def open_transport(device):
+    """Open the transport that matches the kind of device found by find_devices()."""
+    if has_core() and isinstance(device, usb.core.Device):
+        return CoreTransport(device)
+    return LegacyTransport.open(device)
@@ -0,0 +1,232 @@
+# Recording and replay of the USB traffic between the host and a XuLA.
+# RecordingTransport wraps the transport of a live board and writes every
+# bulk transfer, with its time, into a binary trace; ReplayTransport plays
+# a trace back so the same host code runs without the board.
+#
+#   XULA_TRACE=job.trc python loader.py design.bit     # record
+#   XULA_REPLAY=job.trc python loader.py design.bit    # replay at full speed
+#   python usbtrace.py job.trc [baseline.trc]          # transfer counts
+#
+# Setting XULA_REPLAY_TIMING=1 as well replays at the recorded timing.
+
+import atexit
+import gzip
+import struct
+import sys
+import time
+
+import usb
+
+from transport import Transport
+
+TRACE_MAGIC = b"XuLATRC1"
+
+# record header: kind, start (seconds from the first transfer), duration, length
+RECORD = struct.Struct("<BddI")
+
+TRACE_WRITE = 1   # data sent to the OUT endpoint
+TRACE_READ  = 2   # data returned by the IN endpoint
+TRACE_RESET = 3   # endpoint reset, no data
+TRACE_ERROR = 4   # a read that raised usb.USBError, data is the message
+
+TRACE_KINDS = { TRACE_WRITE: "write", TRACE_READ: "read", TRACE_RESET: "reset", TRACE_ERROR: "error" }
+
+class TraceMismatch(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+    def __str__(self):
+        return self.message
+
+def open_trace(filename, mode):
+    """Open a trace file, gzip compressed when the name ends in .gz."""
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode)
+    return open(filename, mode)
+
+def read_trace(f):
+    """Yield (kind, start, duration, data) for each record of an open trace file."""
+    if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+        raise TraceMismatch("not a XuLA USB trace")
+    while True:
+        h = f.read(RECORD.size)
+        if len(h) < RECORD.size:
+            return
+        (kind, start, duration, n) = RECORD.unpack(h)
+        yield (kind, start, duration, f.read(n))
+
+class RecordingTransport(Transport):
+    """
+    Pass every transfer through to transport and append it to the trace
+    file filename. The trace is closed with the transport, or when the
+    interpreter exits.
+    """
+    def __init__(self, transport, filename):
+        self.transport = transport
+        self.filename = filename
+        self.f = open_trace(filename, "wb")
+        self.f.write(TRACE_MAGIC)
+        self.t0 = None
+        self.records = 0
+        atexit.register(self.finish)
+
+    def record(self, kind, start, data = b""):
+        end = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = start
+        self.f.write(RECORD.pack(kind, start - self.t0, end - start, len(data)))
+        self.f.write(data)
+        self.records += 1
+
+    def write(self, data, timeout = 1000):
+        t = time.perf_counter()
+        n = self.transport.write(data, timeout)
+        self.record(TRACE_WRITE, t, bytes(data))
+        return n
+
+    def readinto(self, buf, timeout = 1000):
+        t = time.perf_counter()
+        try:
+            k = self.transport.readinto(buf, timeout)
+        except usb.USBError as X:
+            self.record(TRACE_ERROR, t, str(X).encode())
+            raise
+        self.record(TRACE_READ, t, bytes(memoryview(buf)[:k]))
+        return k
+
+    def reset(self):
+        t = time.perf_counter()
+        self.transport.reset()
+        self.record(TRACE_RESET, t)
+
+    def finish(self):
+        """Close the trace file; the transport stays open."""
+        if not self.f.closed:
+            self.f.close()
+
+    def close(self):
+        self.finish()
+        self.transport.close()
+
+class ReplayTransport(Transport):
+    """
+    Answer the host from the trace file filename instead of a board. The
+    host must send exactly the recorded writes, in order; anything else
+    raises TraceMismatch naming the record where the run diverged. Reads
+    return the recorded data and recorded USB errors are raised again.
+    With timing set each transfer waits for its recorded start time and
+    lasts as long as it did, otherwise the trace runs at full speed.
+    """
+    def __init__(self, filename, timing = False):
+        self.filename = filename
+        self.timing = timing
+        self.f = open_trace(filename, "rb")
+        self.trace = read_trace(self.f)
+        self.index = -1     # number of the record being replayed
+        self.t0 = None
+
+    def next(self, kind):
+        self.index += 1
+        try:
+            (k, start, duration, data) = next(self.trace)
+        except StopIteration:
+            raise TraceMismatch("%s: host did a %s after the end of the trace" % (self.filename, TRACE_KINDS[kind]))
+        if k != kind and not (kind == TRACE_READ and k == TRACE_ERROR):
+            raise TraceMismatch("%s: record %d is a %s, host did a %s" % (
+                self.filename, self.index, TRACE_KINDS.get(k, k), TRACE_KINDS[kind]))
+        if self.timing:
+            if self.t0 is None:
+                self.t0 = time.perf_counter() - start
+            self.wait(start)
+        return (k, start + duration, data)
+
+    def wait(self, t):
+        if self.timing:
+            dt = self.t0 + t - time.perf_counter()
+            if dt > 0:
+                time.sleep(dt)
+
+    def write(self, data, timeout = 1000):
+        (k, end, recorded) = self.next(TRACE_WRITE)
+        data = bytes(data)
+        if data != recorded:
+            i = next((i for i in range(min(len(data), len(recorded))) if data[i] != recorded[i]),
+                     min(len(data), len(recorded)))
+            raise TraceMismatch("%s: write %d differs at byte %d (%d bytes sent, %d recorded)" % (
+                self.filename, self.index, i, len(data), len(recorded)))
+        self.wait(end)
+        return len(data)
+
+    def readinto(self, buf, timeout = 1000):
+        (k, end, data) = self.next(TRACE_READ)
+        self.wait(end)
+        if k == TRACE_ERROR:
+            raise usb.USBError(data.decode())
+        if len(data) > len(buf):
+            raise TraceMismatch("%s: read %d asks for %d bytes, %d recorded" % (
+                self.filename, self.index, len(buf), len(data)))
+        memoryview(buf)[:len(data)] = data
+        return len(data)
+
+    def reset(self):
+        (k, end, data) = self.next(TRACE_RESET)
+        self.wait(end)
+
+    def close(self):
+        self.f.close()
+
+class TraceStats:
+    """Transfer counts and sizes of a trace, for comparing runs."""
+    def __init__(self, filename):
+        self.writes = 0
+        self.reads = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.busy = 0.0         # seconds spent inside transfers
+        self.elapsed = 0.0      # first transfer start to last transfer end
+        with open_trace(filename, "rb") as f:
+            for (kind, start, duration, data) in read_trace(f):
+                if kind == TRACE_WRITE:
+                    self.writes += 1
+                    self.bytes_out += len(data)
+                elif kind == TRACE_READ:
+                    self.reads += 1
+                    self.bytes_in += len(data)
+                elif kind == TRACE_ERROR:
+                    self.errors += 1
+                self.busy += duration
+                self.elapsed = max(self.elapsed, start + duration)
+
+    @property
+    def transfers(self):
+        return self.writes + self.reads
+
+    def __repr__(self):
+        return "<TraceStats writes=%d reads=%d errors=%d out=%d in=%d busy=%.3fs elapsed=%.3fs>" % (
+            self.writes, self.reads, self.errors, self.bytes_out, self.bytes_in, self.busy, self.elapsed)
+
+def main(filename, baseline = None):
+    s = TraceStats(filename)
+    print(f"{filename}: {s.writes} writes, {s.reads} reads, {s.errors} errors, "
+          f"{s.bytes_out} bytes out, {s.bytes_in} bytes in, {s.busy:.3f}s of {s.elapsed:.3f}s in transfers")
+    if baseline is None:
+        return True
+    b = TraceStats(baseline)
+    print(f"{baseline}: {b.writes} writes, {b.reads} reads")
+    if s.transfers > b.transfers:
+        print(f"{s.transfers - b.transfers} more USB transfers than the baseline")
+        return False
+    return True
+
+if __name__ == "__main__":
+    print("XuLA USB trace")
+    if len(sys.argv) not in (2, 3):
+        print(f"usage: python {sys.argv[0]} <tracefile> [<baselinetracefile>]")
+        sys.exit(1)
+
+    try:
+        sys.exit(0 if main(*sys.argv[1:]) else 1)
+    except Exception as X:
+        print(X)
+        sys.exit(1)
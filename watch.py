@@ -0,0 +1,97 @@
+# Development mode: keep one XuLA session open, watch a .bit file and load
+# each new build into the FPGA as soon as it has been written.
+
+import os
+import time
+
+from bitstream import BitFile
+
+class WatchEvent:
+    """Outcome of one build noticed by BitWatcher."""
+    def __init__(self, filename, loaded, latency, elapsed, error = None):
+        self.filename = filename
+        self.loaded = loaded        # False when the FPGA already held the design
+        self.latency = latency      # seconds from the file being written to DONE (or the skip)
+        self.elapsed = elapsed      # seconds spent reading, checking and loading
+        self.error = error          # exception raised by the load, if any
+
+    def __repr__(self):
+        what = "error" if self.error else ("loaded" if self.loaded else "skipped")
+        return "<WatchEvent %s %s latency=%.3fs>" % (self.filename, what, self.latency)
+
+class BitWatcher:
+    """
+    Load bitfilename into the FPGA of XuLA x whenever the file changes.
+
+        w = BitWatcher(x, "top.bit", callback = print)
+        w.run()
+
+    The file is polled every interval seconds. A change is acted on once
+    its size and modification time have stayed the same for one interval,
+    so a file still being written by bitgen is not read. A load is skipped
+    when it would change nothing: the data section has the digest of the
+    last design this watcher loaded (or it has not loaded one yet) and
+    XuLA.is_loaded() finds DONE set and the UserID in USERCODE. Builds
+    should therefore set a UserID (bitgen -g UserID:...). latency of each
+    WatchEvent runs from the modification time of the file.
+    """
+    def __init__(self, x, bitfilename, interval = 0.05, verify = False, callback = None):
+        self.x = x
+        self.filename = bitfilename
+        self.interval = interval
+        self.verify = verify
+        self.callback = callback
+        self.digest = None      # digest of the data section last loaded
+        self.seen = None        # (size, mtime) of the file last acted on
+        self.events = []
+
+    def stamp(self):
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return (st.st_size, st.st_mtime)
+
+    def check(self):
+        """Load the file now unless the FPGA already holds it; returns the WatchEvent."""
+        t = time.time()
+        stamp = self.stamp()
+        loaded = False
+        error = None
+        try:
+            bs = BitFile(self.filename)
+            digest = bs.digest()
+            if self.digest not in (None, digest) or not self.x.is_loaded(bs):
+                r = self.x.load(bs, self.verify)
+                if self.verify and not r:
+                    raise Exception(f"Configuration readback verify failed: {r}")
+                loaded = True
+            self.digest = digest
+        except Exception as X:
+            error = X
+        now = time.time()
+        e = WatchEvent(self.filename, loaded, now - stamp[1] if stamp else 0.0, now - t, error)
+        self.events.append(e)
+        if self.callback is not None:
+            self.callback(e)
+        return e
+
+    def poll(self):
+        """Act on the file if it changed and has settled; returns the WatchEvent or None."""
+        stamp = self.stamp()
+        if stamp is None or stamp == self.seen:
+            return None
+        time.sleep(self.interval)
+        if self.stamp() != stamp:
+            return None     # still being written, look again on the next poll
+        self.seen = stamp
+        return self.check()
+
+    def run(self, count = None):
+        """Poll until count builds have been handled (forever if None)."""
+        n = 0
+        while count is None or n < count:
+            if self.poll() is not None:
+                n += 1
+            else:
+                time.sleep(self.interval)
@@ -7,13 +7,17 @@ os.environ['PYUSB_DEBUG'] = 'info'
 
 import time
 import usb
-import sys
 import struct
 import array
+import collections
+import contextlib
 
-from tqdm import tqdm
-from jtag import Jtag, islast
+from jtag import Jtag
+from progress import phase
+from bitops import REVERSE_TABLE, reverse, packbits
 from bitstream import *
+from transport import find_devices, open_transport
+from usbtrace import RecordingTransport, ReplayTransport
 
 # Definitions of commands sent in USB packets.
 
@@ -49,6 +53,34 @@ RESET_CMD              = 0xff  # Cause a power-on reset.
 FLASH_ENABLE_FLAG_ADDR = 0xFE  # EEPROM Address for Flash Enable Flag
 ENABLE_FLASH           = 0xAC  # Flash Enable flag
 
+# PIC18F14K50 memories reachable through the READ/WRITE_*_CMD commands.
+
+USB_PACKET_SIZE    = 32                     # max payload of the bulk endpoints (USBGEN_EP_SIZE)
+MEM_HEADER_SIZE    = 5                      # cmd, len, 24-bit address
+MEM_DATA_SIZE      = USB_PACKET_SIZE - MEM_HEADER_SIZE
+EEPROM_SIZE        = 256
+PIC_FLASH_SIZE     = 0x4000
+PIC_CONFIG_ADDR    = 0x300000
+PIC_CONFIG_SIZE    = 14
+
+# Test vectors: each SINGLE_TEST_VECTOR_CMD is 2 bytes, so a USB packet holds 16.
+
+VECTORS_PER_PACKET = USB_PACKET_SIZE // 2
+
+# IDCODE of the FPGA on the XuLA board.
+
+XC3S200A_IDCODE = 0x02218093
+
+# Instruction register lengths by IDCODE, version nibble removed.
+
+IR_LENGTHS = {
+    0x02210093: 6,  # XC3S50A
+    0x02218093: 6,  # XC3S200A
+    0x02220093: 6,  # XC3S400A
+    0x02228093: 6,  # XC3S700A
+    0x02230093: 6,  # XC3S1400A
+}
+
 # Definitions of commands sent after a USER JTAG instruction.
 
 INSTR_NOP           = Bitstream(8, int( "00000000", 2)) # no operation
@@ -96,15 +128,95 @@ OP_INPROGRESS = 0x01230123
 OP_PASSED     = 0x45674567
 OP_FAILED     = 0x89AB89AB
 
+# Bulk transfers are split into chunks of this many bytes when progress is reported.
+
+XFER_CHUNK = 16384
+
+# Bits of the configuration STAT register, see ug332 page 340.
+
+STAT_CRC_ERROR    = 1 << 0
+STAT_ID_ERROR     = 1 << 1
+STAT_DCM_LOCK     = 1 << 2
+STAT_GTS_CFG_B    = 1 << 3
+STAT_GWE          = 1 << 4
+STAT_GHIGH_B      = 1 << 5
+STAT_INIT         = 1 << 12
+STAT_DONE         = 1 << 13
+STAT_SEU_ERR      = 1 << 14
+STAT_SYNC_TIMEOUT = 1 << 15
+
+# Fields of the STAT register: name, lowest bit and width.
+
+STAT_FIELDS = [
+    ('SYNC_TIMEOUT', 15, 1),
+    ('SEU_ERR',      14, 1),
+    ('DONE',         13, 1),
+    ('INIT',         12, 1),
+    ('MODE',          9, 3),
+    ('VSEL',          6, 3),
+    ('GHIGH_B',       5, 1),
+    ('GWE',           4, 1),
+    ('GTS_CFG_B',     3, 1),
+    ('DCM_LOCK',      2, 1),
+    ('ID_ERROR',      1, 1),
+    ('CRC_ERROR',     0, 1),
+]
+
+# Registers read by dump_config_registers() by default.
+
+DUMP_REGISTERS = [CRC_REG, FAR_MAJ_REG, FAR_MIN_REG, CTL_REG, MASK_REG, STAT_REG,
+                  COR1_REG, COR2_REG, PWRDN_REG, FLR_REG, IDCODE_REG, MODE_REG]
+
+# Readback starts with one pad frame before the first real frame.
+
+RDBK_PAD_FRAMES = 1
+
+# Limits for the STAT register polls that replace fixed configuration delays.
+
+INIT_TIMEOUT    = 1.0    # seconds for the configuration memory to clear
+DONE_TIMEOUT    = 1.0    # seconds for the startup sequence to raise DONE
+STARTUP_CYCLES  = 12     # TCK cycles per startup step while waiting for DONE
+REBOOT_TIMEOUT  = 3.0    # seconds for a MultiBoot reconfiguration from flash
+
+# MultiBoot images sit in fixed size slots of the flash, so an image index
+# gives its start address. The FPGA reads the image with SPI_READ_OPCODE.
+
+MULTIBOOT_SLOT  = 0x40000
+SPI_READ_OPCODE = 0x0b   # fast read
+
 class UnknownDevice(Exception):
     def __init__(self, msg):
         self.message = msg
     def __str__(self):
         return self.message
 
+class StatusTimeout(Exception):
+    def __init__(self, msg):
+        self.message = msg
+    def __str__(self):
+        return self.message
+
+class DeviceError(Exception):
+    """The XuLA firmware did not answer, or answered something unexpected."""
+    def __init__(self, msg):
+        self.message = msg
+    def __str__(self):
+        return self.message
+
+class EepromError(Exception):
+    """A PIC EEPROM access was out of range, or its contents did not verify."""
+    def __init__(self, msg):
+        self.message = msg
+    def __str__(self):
+        return self.message
+
 def mkbytes(*b):
     return array.array('B', b).tobytes()
 
+def find_xulas():
+    """Return the USB devices of every XuLA board on the bus."""
+    return find_devices()
+
 def elapsed(t):
     seconds = t % 60
     minutes = int(t / 60) % 60
@@ -117,11 +229,97 @@ def elapsed(t):
     r += "%.3f seconds" % seconds
     return r
 
-lookup = [ 0x00, 0x08, 0x04, 0x0c, 0x02, 0x0a, 0x06, 0x0e,
-           0x01, 0x09, 0x05, 0x0d, 0x03, 0x0b, 0x07, 0x0f ]
-
-def reverse_bits(x):
-    return (lookup[x % 16] << 4) | lookup[x // 16]
+class VerifyResult:
+    """
+    Outcome of a configuration readback verify.
+    Evaluates as True when DONE is set, there is no CRC error
+    and every compared frame matched.
+    """
+    def __init__(self, status, frames, mismatches, t):
+        self.status = status
+        self.done = (status & STAT_DONE) != 0
+        self.crc_error = (status & STAT_CRC_ERROR) != 0
+        self.frames = frames            # number of frames compared
+        self.mismatches = mismatches    # indexes of the frames that differ
+        self.elapsed = t
+
+    def __bool__(self):
+        return self.done and not self.crc_error and not self.mismatches
+
+    def __repr__(self):
+        return "<VerifyResult DONE=%d CRC_ERROR=%d frames=%d mismatches=%d>" % (
+            self.done, self.crc_error, self.frames, len(self.mismatches))
+
+class VectorRun:
+    """
+    Outcome of send_vectors(): the number of vectors applied, the
+    vectors read back (None unless requested) and the time taken.
+    """
+    def __init__(self, count, responses, t):
+        self.count = count
+        self.responses = responses
+        self.elapsed = t
+
+    @property
+    def rate(self):
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return "<VectorRun vectors=%d elapsed=%.3fs rate=%.0f vectors/s>" % (
+            self.count, self.elapsed, self.rate)
+
+class ReloadResult:
+    """
+    Outcome of reload(): the frames and runs written, or full set when the
+    whole bitstream had to be loaded instead.
+    """
+    def __init__(self, frames, runs, full, t):
+        self.frames = frames    # number of frames written
+        self.runs = runs        # (start, count) runs written
+        self.full = full        # True if a full load was done instead
+        self.elapsed = t
+
+    def __repr__(self):
+        return "<ReloadResult %s frames=%d runs=%d elapsed=%.3fs>" % (
+            "full" if self.full else "partial", self.frames, len(self.runs), self.elapsed)
+
+class ConfigRegisters:
+    """
+    Configuration register values read by dump_config_registers(), indexed
+    by register number (regs[STAT_REG]) or name (regs["STAT"]). stat holds
+    the decoded STAT fields and far the frame address.
+    """
+    def __init__(self, values):
+        self.values = values    # register number -> value
+
+    def __getitem__(self, reg):
+        if isinstance(reg, str):
+            reg = self.number(reg)
+        return self.values[reg]
+
+    @staticmethod
+    def number(name):
+        for (reg, n) in REGISTER_NAMES.items():
+            if n == name:
+                return reg
+        raise KeyError(name)
+
+    @property
+    def stat(self):
+        status = self.values[STAT_REG]
+        return { name: (status >> lsb) & ((1 << width) - 1) for (name, lsb, width) in STAT_FIELDS }
+
+    @property
+    def far(self):
+        return (self.values[FAR_MAJ_REG] << 16) | self.values[FAR_MIN_REG]
+
+    def asdict(self):
+        """Values by register name."""
+        return { REGISTER_NAMES.get(reg, hex(reg)): v for (reg, v) in self.values.items() }
+
+    def __repr__(self):
+        return "<ConfigRegisters %s>" % " ".join(
+            "%s=0x%x" % (name, v) for (name, v) in self.asdict().items())
 
 class XuLA(Jtag):
 
@@ -148,67 +346,139 @@ class XuLA(Jtag):
     ISC_DNA      = Bitstream(6, int("110001", 2))
     BYPASS       = Bitstream(6, int("111111", 2))
 
-    def __init__(self):
-        buses = usb.busses()
-        xula = None
-        for bus in buses:
-            for device in bus.devices:
-                if device.idVendor == 0x04d8 and device.idProduct == 0xff8c:
-                    xula = device
-        if xula is None:
-            print("No XuLA device found on USB bus")
-            sys.exit(1)
+    xferphase = None    # progress phase updated by bulk transfers, None when not reporting
+    quiet = False       # True while the firmware replies are disabled
+    pending = None      # writes queued by batched(), None when not batching
+    usbwrites = 0       # USB transfers to and from the firmware
+    usbreads = 0
+    flashstats = None   # ProgramStats of the last write_flash()
 
-        print("Found XuLA on USB bus")
+    def __init__(self, device = None, transport = None):
+        """
+        Open device (from find_xulas()), or the last XuLA found on the bus.
+        A ready Transport, such as an in-process fake, can be given instead.
+        With XULA_REPLAY set in the environment the board is replaced by
+        that USB trace; with XULA_TRACE set the traffic is recorded there.
+        Raises DeviceError if no board is found or it does not answer INFO.
+        """
+        if transport is None and os.environ.get("XULA_REPLAY"):
+            transport = ReplayTransport(os.environ["XULA_REPLAY"], os.environ.get("XULA_REPLAY_TIMING") == "1")
+        if transport is None:
+            xula = device
+            if xula is None:
+                devices = find_xulas()
+                if devices:
+                    xula = devices[-1]
+            if xula is None:
+                raise DeviceError("No XuLA device found on USB bus")
 
-        self.handle = xula.open()
+            if self.verbose:
+                print("Found XuLA on USB bus")
 
-        if sys.platform != "win32":
-		    # Don't detach under Windows because it will fail when using libusb-win32.
-            try:
-                self.handle.detachKernelDriver(0)
-            except usb.USBError as error:
-                # print(f"detachKernelDriver exception {error}")
-                pass
-        self.handle.claimInterface(0)
+            transport = open_transport(xula)
+            if os.environ.get("XULA_TRACE"):
+                transport = RecordingTransport(transport, os.environ["XULA_TRACE"])
+        self.transport = transport
+        self.timings = {}  # seconds taken by the last run of each configuration phase
+        self.framemaps = {}  # FrameMap found by discover_framemap(), by (IDCODE, layout)
+        self.buffers()
 
         def powercycle():
             # m = bytes(RESET_CMD) + (chr(0) * 31)
             m = mkbytes(RESET_CMD) + (chr(0) * 31).encode()
-            self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
+            self.send(m, 1000)
             time.sleep(4)
 
-        self.handle.resetEndpoint(usb.ENDPOINT_OUT + 1)
-        self.handle.resetEndpoint(usb.ENDPOINT_IN + 1)
-        #self.handle.reset()
+        self.transport.reset()
+        # a previous run may have left the replies disabled (see sync())
+        self.send(mkbytes(ENABLE_RETURN_CMD), 1000)
         m = mkbytes(INFO_CMD, 0)
         # print(f'Send Info Command... [{m}]')
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
+        self.send(m, 1000)
         device_info = None
-        print('Get device info...', flush=True)
+        if self.verbose:
+            print('Get device info...', flush=True)
         try:
-            device_info = self.handle.bulkRead(usb.ENDPOINT_IN + 1, 32, 1000)
-        except usb.USBError:
-            print('USBError: powercycle device')
+            device_info = self.recv(32, 1000)
+        except usb.USBError as X:
             powercycle()
-            sys.exit(1)
+            raise DeviceError(f"USB error reading the device info ({X}), device power cycled")
         if device_info is None:
             try:
-                device_info = self.handle.bulkRead(usb.ENDPOINT_IN + 1, 32, 1000)
-            except usb.USBError:
-                print('USB I/O error')
-                sys.exit(1)
+                device_info = self.recv(32, 1000)
+            except usb.USBError as X:
+                raise DeviceError(f"USB I/O error reading the device info ({X})")
 
         if (sum(device_info)) & 0xff != 0:
-            print('Device info Checksum error')
-            sys.exit(1)
+            raise DeviceError("Device info checksum error")
 
-        print('  Product ID:  %02x %02x' % (device_info[1], device_info[2]))
-        print('  Version:     %d.%d' % (device_info[3], device_info[4]))
+        self.product = (device_info[1], device_info[2])
+        self.version = (device_info[3], device_info[4])
         # Desc is 0-terminated string
         desc = device_info[5:-1]
         desclen = desc.index(0)
-        print(f"  Description: '{mkbytes(*desc[:desclen]).decode()}'")
+        self.description = mkbytes(*desc[:desclen]).decode()
+        if self.verbose:
+            print('  Product ID:  %02x %02x' % self.product)
+            print('  Version:     %d.%d' % self.version)
+            print(f"  Description: '{self.description}'")
+
+    def buffers(self):
+        """Preallocate the command and reply buffers reused by the transfer paths."""
+        self.tickcmd = array.array('B', [TMS_TDI_TDO_CMD, 0])
+        self.tickrx = array.array('B', bytes(2))
+        self.header = array.array('B', bytes(5))   # cmd and 32-bit bit count
+        self.packet = array.array('B', bytes(USB_PACKET_SIZE))
+
+    def send(self, data, timeout = 1000):
+        """Write to the firmware, or queue the data while batching."""
+        if self.pending is not None:
+            self.pending.frombytes(data)
+            return len(data)
+        self.usbwrites += 1
+        return self.transport.write(data, timeout)
+
+    def flush(self):
+        """Send the writes queued by batched() in one USB transfer."""
+        if self.pending:
+            data = self.pending
+            self.pending = array.array('B')
+            self.usbwrites += 1
+            self.transport.write(data, 1000 + len(data) // 32)
+
+    def recvinto(self, buf, timeout = 1000):
+        self.flush()
+        self.usbreads += 1
+        return self.transport.readinto(buf, timeout)
+
+    def recv(self, n, timeout = 1000):
+        self.flush()
+        self.usbreads += 1
+        return self.transport.read(n, timeout)
+
+    @contextlib.contextmanager
+    def batched(self):
+        """
+        Queue the writes made inside the with block and send them as one
+        USB transfer, when a reply is read or at the end of the block:
+
+            with x.batched():
+                x.go_states(0, 1, 0)
+                x.bulktdibytes(data, 8 * len(data))
+        """
+        if self.pending is not None:
+            yield
+            return
+        self.pending = array.array('B')
+        try:
+            yield
+            self.flush()
+        finally:
+            self.pending = None
+
+    def sendheader(self, cmd, n):
+        struct.pack_into("<BI", self.header, 0, cmd, n)
+        self.send(self.header, 1000)
 
     # Sample TDO, output TMS and TDI values, pulse TCK, and return TDO value.
     def tick(self, tms, tdi):
@@ -217,41 +487,114 @@ class XuLA(Jtag):
             mask |= 0x01
         if tdi:
             mask |= 0x02
-        m = mkbytes(TMS_TDI_TDO_CMD, mask) # + (chr(0) * 30)
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        r = self.handle.bulkRead(usb.ENDPOINT_IN + 1, 2, 1000)
-        return (r[1] & 0x04) != 0
+        self.sync()
+        self.tickcmd[1] = mask
+        self.send(self.tickcmd, 1000)
+        self.recvinto(self.tickrx, 1000)
+        return (self.tickrx[1] & 0x04) != 0
+
+    # Output a sequence of TMS and TDI values in a single USB write, with no TDO readback.
+    def ticks(self, seq):
+        m = array.array('B')
+        if not self.quiet:
+            m.append(DISABLE_RETURN_CMD)
+            self.quiet = True
+        for (tms, tdi) in seq:
+            m.extend((TMS_TDI_CMD, (0x01 if tms else 0) | (0x02 if tdi else 0)))
+        self.send(m, 1000 + len(m) // 32)
+
+    def sync(self):
+        """Turn the firmware replies back on before a command whose reply is read."""
+        if self.quiet:
+            self.send(mkbytes(ENABLE_RETURN_CMD), 1000)
+            self.quiet = False
 
     def bulktdi(self, bs):
-        m = struct.pack("<BI", TDI_CMD, len(bs))
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
         t = time.time()
-        if 0:
-            b256 = bs # ([0] * (ps*8 - len(bs))) + list(bs)
-            w256 = [(b << (i & 7)) for (i, b) in enumerate(b256)]
-            m = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)]).tobytes()
+        if hasattr(bs, "chunks"):
+            # BitFiles are read and decompressed by a background thread while they go out
+            self.bulktdichunks(bs.chunks(), len(bs))
         else:
-            m = array.array('B', bs.tobytes())
-            m = array.array('B', [reverse_bits(c) for c in m.tolist()]).tobytes()
-        # print "(Bulk %d)" % len(m), ["%02x" % ord(c) for c in m[:50]]
-        # print ["%02x" % ord(x) for x in m]
+            m = reverse(bs.tobytes())
+            # print "(Bulk %d)" % len(m), ["%02x" % ord(c) for c in m[:50]]
+            # print ["%02x" % ord(x) for x in m]
 
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        self.debug_tms(1)
+            self.bulktdibytes(m, len(bs))
         if self.verbose:
             print(f"took {elapsed(time.time() - t)}")
 
+    def bulktdibytes(self, data, n):
+        """Send n TDI bits from data (LSB first) in one transfer, raising TMS on the last bit."""
+        self.sendheader(TDI_CMD, n)
+        if self.xferphase is None:
+            self.send(data, 1000)
+        else:
+            view = memoryview(data)
+            for i in range(0, len(data), XFER_CHUNK):
+                chunk = view[i:i + XFER_CHUNK]
+                self.send(chunk, 1000)
+                self.xferphase.update(len(chunk))
+        self.debug_tms(1)
+
+    def bulktdichunks(self, chunks, n):
+        """
+        Send n TDI bits in one transfer, raising TMS on the last bit, taking
+        the configuration bytes (MSB first) from the iterable chunks.
+        """
+        self.sendheader(TDI_CMD, n)
+        for c in chunks:
+            self.send(reverse(c), 1000 + len(c) // 32)
+            if self.xferphase is not None:
+                self.xferphase.update(len(c))
+        self.debug_tms(1)
+
+    def bulktdo(self, n):
+        """Clock out n TDO bits in one transfer, raising TMS on the last bit. Returns the bits LSB first."""
+        self.sync()
+        self.sendheader(TDO_CMD, n)
+        nbytes = (n + 7) // 8
+        # one array('B') result buffer, which CoreTransport fills in place
+        buf = array.array('B', bytes(nbytes))
+        if self.xferphase is None:
+            # allow roughly 1 ms per USB packet on top of the usual timeout
+            self.recvinto(buf, 2000 + nbytes // 32)
+        else:
+            view = memoryview(buf)
+            for i in range(0, nbytes, XFER_CHUNK):
+                k = min(XFER_CHUNK, nbytes - i)
+                self.recvinto(view[i:i + k], 2000 + k // 32)
+                self.xferphase.update(k)
+        self.debug_tms(1)
+        return buf.tobytes()
+
+    def bulktditdo(self, data, n):
+        """
+        Send n TDI bits from data (LSB first) while receiving TDO, raising TMS on the last bit.
+        The data goes out one USB packet at a time and the TDO bits for each
+        packet are collected before the next one is sent. Returns the TDO bits LSB first.
+        """
+        self.sync()
+        self.sendheader(TDI_TDO_CMD, n)
+        nbytes = (n + 7) // 8
+        src = memoryview(data)
+        buf = array.array('B', bytes(nbytes))
+        view = memoryview(buf)
+        for i in range(0, nbytes, USB_PACKET_SIZE):
+            k = min(USB_PACKET_SIZE, nbytes - i)
+            self.send(src[i:i + k], 1000)
+            self.recvinto(view[i:i + k], 1000)
+        self.debug_tms(1)
+        return buf.tobytes()
+
     def word(self, bs):
-        m = struct.pack("<BI", TDI_TDO_CMD, len(bs))
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        b256 = bs # ([0] * (ps*8 - len(bs))) + list(bs)
-        w256 = [(b << (i & 7)) for (i, b) in enumerate(b256)]
-        m = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)]).tobytes()
+        self.sync()
+        self.sendheader(TDI_TDO_CMD, len(bs))
+        m = packbits(list(bs))
 
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
+        self.send(m, 1000)
         self.debug_tms(1)
-        recv = self.handle.bulkRead(usb.ENDPOINT_IN + 1, 32, 1000)
-        return recv[0]
+        self.recvinto(self.packet, 1000)
+        return self.packet[0]
 
     def bulktms(self, bs):
         GET_TDO_MASK = 0x01                       # Set if gathering TDO bits.
@@ -261,46 +604,49 @@ class XuLA(Jtag):
         TDI_VAL_MASK = 0x10                       # Static value for TDI if PUT_TDI_MASK is cleared.
         DO_MULTIPLE_PACKETS_MASK = 0x80           # Set if command extends over multiple USB packets.
         m = struct.pack("<BIB", TAP_SEQ_CMD, len(bs) * 2, PUT_TDI_MASK | PUT_TMS_MASK)
-        b256 = bs # ([0] * (ps*8 - len(bs))) + list(bs)
-        w256 = [(b << (i & 7)) for (i, b) in enumerate(b256)]
-        d = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)]).tobytes()
+        d = packbits(list(bs))
 
         # cmd, len, flags, tms, tdi
-        m += d[0] + chr(0)
-        print(repr(m))
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
+        m += d[:1] + b"\0"
+        self.send(m, 1000)
         for g in bs:
             self.debug_tms(g)
 
-    def querychain(self):
-        if 0:
-            # do not need to count devices, because there is only one
-            self.go_states(1,1,1,1,1)
-            self.go_states(0,1,1,0,0)
-            self.assert_state("Shift-IR")
-            self.send_str("1" * 1000, 1)
-            self.assert_state("Exit1-IR")
-            self.go_states(1,1,0,0)
-            self.send_str("0" * 1000, 0)
-            ndevices = 0
-            while self.do_bit(0, 1) == 0:
-                ndevices += 1
-        else:
-            ndevices = 1
-
-        self.go_states(1,1,1,1,1)
-        self.go_states(0,1,0,0)
+    def querychain(self, irlengths = None):
+        """
+        Scan the JTAG chain and return the IDCODE of every device, nearest TDO first.
+        irlengths adds IR lengths, by IDCODE, for devices not in IR_LENGTHS.
+        """
+        lengths = dict(IR_LENGTHS)
+        lengths.update(irlengths or {})
+        try:
+            chain = self.scanchain(lengths)
+        except ValueError as X:
+            raise UnknownDevice(str(X))
+        return [d.idcode for d in chain]
 
-        return [self.do_nbit_cycle(32, 0) for i in range(ndevices)]
+    def select(self, device):
+        """Select the device to talk to, by chain index or IDCODE."""
+        if not Jtag.select(self, device):
+            chain = [hex(d.idcode) for d in self.chain or []]
+            raise UnknownDevice(f"Device {hex(device)} not found, chain is {chain}")
 
     def progpin(self, v):
         m = mkbytes(PROG_CMD, v) # + (chr(0) * 30)
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
+        self.send(m, 1000)
+
+    def progpulse(self):
+        """Pulse PROGRAM# and wait for the configuration memory to clear."""
+        self.progpin(1)
+        self.progpin(0)
+        self.progpin(1)
+        return self.wait_status(STAT_INIT, STAT_INIT, INIT_TIMEOUT, "prog")
 
     def flashpin(self, v):
+        self.sync()
         m = mkbytes(FLASH_ONOFF_CMD, v) # + (chr(0) * 30)
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        self.handle.bulkRead(usb.ENDPOINT_IN + 1, 2, 2000)
+        self.send(m, 1000)
+        self.recv(2, 2000)
         return
 
 #define FLASH_ENABLE_FLAG_ADDR 0xFE
@@ -324,11 +670,74 @@ class XuLA(Jtag):
 
     def enableflash(self, v):
         val = ENABLE_FLASH if v else 0
-        m = mkbytes(WRITE_EEDATA_CMD, 1, FLASH_ENABLE_FLAG_ADDR, val) # + (chr(0) * 30)
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        self.handle.bulkRead(usb.ENDPOINT_IN + 1, 1, 2000)
+        self.write_eeprom(FLASH_ENABLE_FLAG_ADDR, mkbytes(val))
         return
 
+    def readmem(self, cmd, addr, n):
+        """Read n bytes of PIC memory with cmd, using full USB packets."""
+        self.sync()
+        r = bytearray()
+        while len(r) < n:
+            k = min(MEM_DATA_SIZE, n - len(r))
+            a = addr + len(r)
+            m = mkbytes(cmd, k, a & 0xff, (a >> 8) & 0xff, (a >> 16) & 0xff)
+            self.send(m, 1000)
+            p = self.recv(MEM_HEADER_SIZE + k, 2000)
+            r += bytes(p[MEM_HEADER_SIZE:MEM_HEADER_SIZE + k])
+        return bytes(r)
+
+    def check_eeprom(self, addr, n):
+        if addr < 0 or addr + n > EEPROM_SIZE:
+            raise EepromError(f"EEPROM range {hex(addr)}+{n} is outside the {EEPROM_SIZE} byte EEPROM")
+
+    def read_eeprom(self, addr = 0, n = EEPROM_SIZE):
+        """Read n bytes of the PIC EEPROM starting at addr."""
+        self.check_eeprom(addr, n)
+        return self.readmem(READ_EEDATA_CMD, addr, n)
+
+    def write_eeprom(self, addr, data):
+        """Write data to the PIC EEPROM starting at addr, a full packet at a time."""
+        self.check_eeprom(addr, len(data))
+        self.sync()
+        for i in range(0, len(data), MEM_DATA_SIZE):
+            chunk = bytes(data[i:i + MEM_DATA_SIZE])
+            a = addr + i
+            m = mkbytes(WRITE_EEDATA_CMD, len(chunk), a & 0xff, (a >> 8) & 0xff, 0) + chunk
+            self.send(m, 1000)
+            if self.recv(1, 2000)[0] != WRITE_EEDATA_CMD:
+                raise EepromError(f"EEPROM write at {hex(a)} not acknowledged")
+
+    def read_pic_flash(self, addr = 0, n = PIC_FLASH_SIZE):
+        """Read the PIC program flash (the USB firmware)."""
+        return self.readmem(READ_FLASH_CMD, addr, n)
+
+    def read_pic_config(self):
+        """Read the PIC configuration bytes CONFIG1L..CONFIG7H."""
+        return self.readmem(READ_CONFIG_CMD, PIC_CONFIG_ADDR, PIC_CONFIG_SIZE)
+
+    def read_pic_version(self):
+        """Return the (major, minor) version reported by READ_VERSION_CMD."""
+        self.sync()
+        self.send(mkbytes(READ_VERSION_CMD), 1000)
+        r = self.recv(4, 1000)
+        return (r[3], r[2])
+
+    def backup_eeprom(self, filename):
+        """Save the whole PIC EEPROM into a file."""
+        data = self.read_eeprom()
+        with open(filename, "wb") as f:
+            f.write(data)
+        return data
+
+    def restore_eeprom(self, filename, verify = True):
+        """Write a file saved by backup_eeprom() back into the PIC EEPROM; return True if it verifies."""
+        with open(filename, "rb") as f:
+            data = f.read(EEPROM_SIZE)
+        self.write_eeprom(0, data)
+        if verify:
+            return self.read_eeprom(0, len(data)) == data
+        return True
+
     def idcode(self):
         return self.LoadBSIRthenBSDR(self.IDCODE, Bitstream(32, 0), receive = True)
 
@@ -340,20 +749,23 @@ class XuLA(Jtag):
         #for i in range(c):
         #    self.do_bit(0, 0)
         #return
-        self.do_bit(0,0)
+        self.go_state(0)
         c = c - 1
+        self.sync()
         m = mkbytes(RUNTEST_CMD, c & 0xff, (c >> 8) & 0xff, (c >> 16) & 0xff, (c >> 24) & 0xff)
-        self.handle.bulkWrite(usb.ENDPOINT_OUT + 1, m, 1000)
-        self.handle.bulkRead(usb.ENDPOINT_IN + 1, 5, 2000)
+        self.send(m, 1000)
+        self.recv(5, 2000)
         return
 
     def DNA(self):
         self.tlr()
         self.LoadBSIRthenBSDR(self.JPROGRAM, None)
-        time.sleep(.5)
-        print(f"ISC_ENABLE {self.LoadBSIRthenBSDR(self.ISC_ENABLE, Bitstream(5, 0), receive = True)}")
+        self.wait_status(STAT_INIT, STAT_INIT, INIT_TIMEOUT, "jprogram")
+        isc = self.LoadBSIRthenBSDR(self.ISC_ENABLE, Bitstream(5, 0), receive = True)
         dna = self.LoadBSIRthenBSDR(self.ISC_DNA, Bitstream(57, 0), receive = True)
-        print(f"ISC_DNA {hex(dna)}")
+        if self.verbose:
+            print(f"ISC_ENABLE {isc}")
+            print(f"ISC_DNA {hex(dna)}")
         return dna
 
     def ccl(self, rw, reg, cnt):
@@ -362,98 +774,358 @@ class XuLA(Jtag):
         Control Logic operation, (ug332 page 323).
         """
         assert rw in "rw"
-        assert (0 <= reg < 64)
-        assert (0 <= cnt < 32)
-        m = 1 << 13     # Type 1 packet
-        if rw == "r":
-            m |= (1 << 11)
-        else:
-            m |= (2 << 11)
-        m |= reg << 5
-        m |= cnt
-        return "%04x" % m
+        return "%04x" % packet_header(OP_READ if rw == "r" else OP_WRITE, reg, cnt)
 
     def rdccl(self, reg):
-        read_status = [
-            "aa99",
-            "2000",
-            self.ccl('r', reg, 1),
-            "2000",
-            "2000",
-        ]
-        commands = "".join(read_status)
-        self.LoadBSIRthenBSDR(self.CFG_IN, BitstreamHex(commands))
-        return self.LoadBSIRthenBSDR(self.CFG_OUT, Bitstream(32, 0), receive = True)
+        return self.dump_config_registers([reg])[reg]
 
     def resetcrc(self):
-        print(f'CRC={hex(self.rdccl(0))}')
-
-        write_crc = [
-            "aa99",
-            "2000",
-            self.ccl('w', 5, 1),
-            "0007",
-            "2000",
-        ]
-        commands = "".join(write_crc)
-        print(commands)
-        self.LoadBSIRthenBSDR(self.CFG_IN, BitstreamHex(commands))
-        print(self.LoadBSIRthenBSDR(self.CFG_OUT, Bitstream(32, 0), receive = True))
-        print(f'CRC={hex(self.rdccl(0))}')
+        """Reset the CRC register; returns its (old, new) values."""
+        old = self.rdccl(CRC_REG)
+        self.cfgin(ConfigPackets().sync().command(CMD_RCRC).noop().command(CMD_DESYNC).noop(2))
+        new = self.rdccl(CRC_REG)
+        if self.verbose:
+            print(f'CRC={hex(old)}')
+            print(f'CRC={hex(new)}')
+        return (old, new)
+
+    def cfgin(self, packets):
+        """
+        Shift configuration packets into CFG_IN in one transfer. packets is a
+        ConfigPackets, bytes, or a list of 16-bit words.
+        """
+        if isinstance(packets, ConfigPackets):
+            data = packets.buf
+        elif isinstance(packets, (bytes, bytearray, memoryview)):
+            data = packets
+        else:
+            data = struct.pack(">%dH" % len(packets), *packets)
+        self.LoadBSIRthenBSDR(self.CFG_IN, BitstreamString(data))
+
+    def cfgout(self, nwords):
+        """Shift nwords 16-bit words out of CFG_OUT in one transfer, returned as big-endian bytes."""
+        recv = self.LoadBSIRthenBSDR(self.CFG_OUT, Bitstream(16 * nwords, 0), receive = True)
+        # readback data comes out MSB first
+        return recv.to_bytes(2 * nwords, "little").translate(REVERSE_TABLE)
+
+    def rdreg(self, reg):
+        """Read a configuration register without printing anything."""
+        return self.rdregs([reg])[0]
+
+    def rdregs(self, regs):
+        """
+        Read several configuration registers with one CFG_IN and one CFG_OUT shift.
+        IDCODE is read as a 32-bit value, every other register as 16 bits.
+        """
+        p = ConfigPackets().sync()
+        sizes = []
+        for reg in regs:
+            n = 2 if reg == IDCODE_REG else 1
+            p.read(reg, n).noop(2)
+            sizes.append(n)
+        self.cfgin(p)
+        data = self.cfgout(sum(sizes))
+        self.desync()
+        r = []
+        i = 0
+        for n in sizes:
+            r.append(int.from_bytes(data[i:i + 2 * n], "big"))
+            i += 2 * n
+        return r
+
+    def dump_config_registers(self, regs = DUMP_REGISTERS):
+        """
+        Read the configuration registers regs (STAT, CTL, COR1, IDCODE, CRC,
+        FAR, ... by default) with one CFG_IN sequence and one CFG_OUT readback.
+        Returns a ConfigRegisters.
+        """
+        return ConfigRegisters(dict(zip(regs, self.rdregs(regs))))
+
+    def desync(self):
+        """Desynchronize the configuration logic so a following bitstream finds its own sync word."""
+        self.cfgin(ConfigPackets().command(CMD_DESYNC).noop(2))
+
+    def frameaddr(self):
+        """Return the frame address register as FAR_MAJ << 16 | FAR_MIN."""
+        (major, minor) = self.rdregs([FAR_MAJ_REG, FAR_MIN_REG])
+        return (major << 16) | minor
+
+    def discover_framemap(self, img, progress = None):
+        """
+        Work out the frame address of each frame of ConfigImage img by
+        letting the device walk them: a readback advances FAR the same way
+        an FDRI write does. Each FDRI write of img is walked from its own
+        FAR. Reading back only the pad frame shows whether FAR has already
+        moved past the first frame; after that each step reads the fewest
+        frames that move FAR by exactly one.
+        The result is cached per IDCODE and layout and returned as a FrameMap.
+        """
+        key = (self.idcode(), tuple(img.layout()))
+        if key in self.framemaps:
+            return self.framemaps[key]
+        p = phase(progress, "framemap", len(img))
+        fars = []
+        for (far, nframes) in img.layout():
+            block = [far]
+            self.readback(0, img.frameWords, far)
+            nxt = self.frameaddr()
+            if nxt == far:
+                step = 1
+            else:
+                step = 0
+                block.append(nxt)
+            p.update(len(block))
+            while len(block) < nframes:
+                self.readback(step, img.frameWords, block[-1])
+                block.append(self.frameaddr())
+                p.update(1)
+            fars += block[:nframes]
+        fmap = FrameMap(fars)
+        self.framemaps[key] = fmap
+        self.tlr()
+        return fmap
+
+    def readback(self, nframes, frameWords, far = 0, progress = None):
+        """
+        Read nframes configuration frames starting at frame address far,
+        see ug332 chapter 11. Returns the frame data as bytes.
+        """
+        nwords = (nframes + RDBK_PAD_FRAMES) * frameWords
+        self.cfgin(ConfigPackets().sync().command(CMD_RCRC).noop()
+                   .far(far).command(CMD_RCFG).header(OP_READ, FDRO_REG, nwords).noop(2))
+        self.xferphase = phase(progress, "readback", 2 * nwords) if progress else None
+        try:
+            data = self.cfgout(nwords)
+        finally:
+            self.xferphase = None
+        return data[RDBK_PAD_FRAMES * frameWords * 2:]
+
+    def verify(self, bitfile, mask = None, progress = None):
+        """
+        Read the configuration frames back and compare them against bitfile.
+        mask is an optional BitFile for the .msk file written by bitgen -m;
+        bits set in the mask are not compared.
+        Returns a VerifyResult.
+        """
+        t = time.time()
+        img = bitfile.image()
+        mimg = mask.image() if mask is not None else None
+        n = img.frameBytes()
+        mismatches = []
+        # each FDRI write of the bitfile is read back from its own FAR
+        for (first, count, far, offset) in img.blocks:
+            data = self.readback(count, img.frameWords, far, progress)
+            for i in range(first, first + count):
+                got = data[(i - first) * n:(i - first + 1) * n]
+                exp = img.frame(i)
+                if got == exp:
+                    continue
+                if mimg is not None:
+                    diff = int.from_bytes(got, "big") ^ int.from_bytes(exp, "big")
+                    if diff & ~int.from_bytes(mimg.frame(i), "big") == 0:
+                        continue
+                mismatches.append(i)
+        status = self.rdreg(STAT_REG)
+        self.tlr()
+        return VerifyResult(status, len(img), mismatches, time.time() - t)
+
+    def wait_status(self, mask, value, timeout, phase = None, step = None):
+        """
+        Poll the STAT register until (STAT & mask) == value and return STAT.
+        step, if given, is called before every poll after the first one.
+        The time taken is recorded in self.timings[phase].
+        Raises StatusTimeout if the condition does not hold within timeout seconds.
+        """
+        t = time.time()
+        status = self.rdreg(STAT_REG)
+        while (status & mask) != value:
+            if time.time() - t > timeout:
+                raise StatusTimeout("Timeout waiting for %s, STAT = 0x%04x" % (phase or "status", status))
+            if step is not None:
+                step()
+            status = self.rdreg(STAT_REG)
+        if phase is not None:
+            self.timings[phase] = time.time() - t
+        return status
 
     # see ug332, page 340
     def status(self):
-        # packet format see ug332, page 323
-        read_status = [
-            "aa99",
-            "2000",
-            self.ccl('r', 8, 1),
-            "2000",
-            "2000",
-        ]
-        commands = "".join(read_status)
-        self.LoadBSIRthenBSDR(self.CFG_IN, BitstreamHex(commands))
-        status = self.LoadBSIRthenBSDR(self.CFG_OUT, Bitstream(32, 0), receive = True)
-
-        print("status = %04x" % status)
-        vv = [
-            ('SYNC_TIMEOUT',    1 & (status >> 15)),
-            ('SEU_ERR',         1 & (status >> 14)),
-            ('DONE',            1 & (status >> 13)),
-            ('INIT',            1 & (status >> 12)),
-            ('MODE',            7 & (status >> 9)),
-            ('VSEL',            7 & (status >> 6)),
-            ('GHIGH_B',         1 & (status >> 5)),
-            ('GWE',             1 & (status >> 4)),
-            ('GTS_CFG_B',       1 & (status >> 3)),
-            ('DCM_LOCK',        1 & (status >> 2)),
-            ('ID_ERROR',        1 & (status >> 1)),
-            ('CRC_ERROR',       1 & (status >> 0))]
-        for nm,v in vv:
-            print("%16s %d" % (nm, v))
+        regs = self.dump_config_registers([STAT_REG])
+        status = regs[STAT_REG]
+
+        if self.verbose:
+            print("status = %04x" % status)
+            for nm, v in regs.stat.items():
+                print("%16s %d" % (nm, v))
 
         return status
 
     # xapp139 - 
     # http://www.xilinx.com/support/documentation/application_notes/xapp452.pdf
-    def load(self, bs):
+    def load(self, bs, verify = False, mask = None, progress = None):
+        """
+        Load bitstream bs through JTAG. With verify set, bs must be a BitFile and
+        the configuration is read back after startup; the VerifyResult is returned.
+        progress is an optional callback receiving ProgressEvents.
+        A BitFile is validated first and InvalidBitstream raised before the
+        device is touched.
+        """
+        self.check_bitfile(bs, "jtag")
         # Must follow JPROGRAM with CFG_IN to keep device locked to JTAG.
         # See AR 16829.
         self.LoadBSIRthenBSDR(self.JPROGRAM, None)
         self.LoadBSIRthenBSDR(self.CFG_IN, None)
         # print list(bs)[256:512]
-        time.sleep(0.001)
-        self.LoadBSIRthenBSDR(self.CFG_IN, bs)
+        self.wait_status(STAT_INIT, STAT_INIT, INIT_TIMEOUT, "jprogram")
+        t = time.time()
+        self.xferphase = phase(progress, "configure", len(bs) // 8) if progress else None
+        try:
+            self.LoadBSIRthenBSDR(self.CFG_IN, bs)
+        finally:
+            self.xferphase = None
+        self.timings["cfg_in"] = time.time() - t
         # BEFORE: (wants CCLK as startup clock)
         #self.tlr()
         #self.LoadBSIRthenBSDR(self.JSTART, None)
         # NOW: (works OK with JTAG Clock as startup clock)
-        self.LoadBSIRthenBSDR(self.JSTART, None)
-        self.pulseTCK(12)
+        self.startup()
+        if verify:
+            return self.verify(bs, mask, progress)
+        return True
+
+    def is_loaded(self, bs):
+        """
+        True if the FPGA is configured (DONE set) and USERCODE reads back the
+        UserID of BitFile bs. A file without a UserID, or with the default
+        0xFFFFFFFF, never matches.
+        """
+        userid = bs.usercode
+        if userid is None or userid == 0xffffffff:
+            return False
+        done = self.rdreg(STAT_REG) & STAT_DONE
+        self.tlr()
+        return bool(done) and self.usercode() == userid
+
+    def startup(self):
+        """Clock the startup sequence through JSTART until DONE is set."""
+        def jstart():
+            self.LoadBSIRthenBSDR(self.JSTART, None)
+            self.pulseTCK(STARTUP_CYCLES)
+        jstart()
+        self.wait_status(STAT_DONE, STAT_DONE, DONE_TIMEOUT, "startup", jstart)
         self.LoadBSIRthenBSDR(self.JSTART, Bitstream(22, 0))
         self.tlr()
-        return True
-        
+
+    def reload(self, old, new, mask = None, framemap = None, progress = None):
+        """
+        Reconfigure the device, currently loaded with BitFile old, with
+        BitFile new by writing only the frames that differ. The device is
+        shut down, every run of changed frames is written with its own FAR
+        and FDRI packets, and the same JSTART startup as load() follows.
+
+        framemap gives the frame addresses (see discover_framemap(), which is
+        used when it is None). Before anything is written, the first frame
+        of each run is read back and compared against old (ignoring the bits
+        set in the mask BitFile); if the device does not hold old, or the
+        images are for different devices, new is loaded in full instead.
+        Returns a ReloadResult.
+        """
+        t = time.time()
+        a = old.image()
+        b = new.image()
+        mimg = mask.image() if mask is not None else None
+
+        def full():
+            self.load(new, progress = progress)
+            return ReloadResult(len(b), [], True, time.time() - t)
+
+        if (a.frameWords != b.frameWords or a.layout() != b.layout() or
+                a.regs.get(IDCODE_REG) != b.regs.get(IDCODE_REG)):
+            return full()
+        runs = frame_runs(diff_frames(a, b, mimg), starts = b.starts)
+        if not runs:
+            return ReloadResult(0, [], False, time.time() - t)
+        if framemap is None:
+            framemap = self.discover_framemap(b)
+        if len(framemap) != len(b):
+            return full()
+
+        for (start, count) in runs:
+            got = self.readback(1, b.frameWords, framemap.far(start))
+            exp = a.frame(start)
+            if got != exp:
+                diff = int.from_bytes(got, "big") ^ int.from_bytes(exp, "big")
+                if mimg is None or diff & ~int.from_bytes(mimg.frame(start), "big"):
+                    self.desync()
+                    return full()
+        self.desync()
+
+        # stop the design while its frames change
+        self.LoadBSIRthenBSDR(self.JSHUTDOWN, None)
+        self.pulseTCK(STARTUP_CYCLES)
+
+        written = self.write_frames(b, runs, framemap, True, progress)
+        self.startup()
+        return ReloadResult(written, runs, False, time.time() - t)
+
+    def write_frames(self, img, runs, framemap, start = False, progress = None):
+        """
+        Write the (start, count) runs of frames of ConfigImage img, each with
+        its own FAR and FDRI packets, in one CFG_IN transfer. A run must not
+        cross from one FDRI write of img to the next (see frame_runs()). With start set
+        the START command follows for a startup sequence. Returns the number
+        of frames written.
+        """
+        n = img.frameBytes()
+        p = ConfigPackets().sync().command(CMD_RCRC).noop()
+        for (first, count) in runs:
+            p.far(framemap.far(first)).command(CMD_WCFG)
+            # the pad frame only flushes the frame buffer
+            p.frames(img.frames(first, count), bytes(n))
+        if start:
+            p.command(CMD_START).noop()
+        p.command(CMD_DESYNC).noop(3)
+
+        t = time.time()
+        self.xferphase = phase(progress, "reload", len(p)) if progress else None
+        try:
+            self.cfgin(p)
+        finally:
+            self.xferphase = None
+        self.timings["cfg_in"] = time.time() - t
+        return sum(count for (first, count) in runs)
+
+    def reboot(self, address, opcode = SPI_READ_OPCODE, wait = True):
+        """
+        Make the FPGA configure itself from the flash image at byte address
+        (MultiBoot, see ug332 chapter 14): GENERAL1 and GENERAL2 get the
+        start address and the SPI read opcode, then CMD REBOOT (IPROG)
+        starts the configuration. The uC hold on the flash is released
+        first. With wait set, returns STAT once DONE is set again, and the
+        flash is handed back to the uC (also when DONE never comes);
+        otherwise the caller does that with flashpin(0) after startup.
+        """
+        p = ConfigPackets().words(0xffff).sync()
+        p.write(GENERAL1_REG, address & 0xffff)
+        p.write(GENERAL2_REG, ((opcode & 0xff) << 8) | ((address >> 16) & 0xff))
+        p.command(CMD_REBOOT).noop(4)
+        t = time.time()
+        self.flashpin(1)  # release uC hold on Flash chip
+        self.cfgin(p)
+        self.tlr()
+        if not wait:
+            return None
+        try:
+            status = self.wait_status(STAT_DONE, STAT_DONE, REBOOT_TIMEOUT, "reboot")
+        finally:
+            self.flashpin(0)
+        self.timings["reboot"] = time.time() - t
+        return status
+
+    def reboot_to(self, index, slot = MULTIBOOT_SLOT, opcode = SPI_READ_OPCODE, wait = True):
+        """Reconfigure from MultiBoot image index of a flash written by multiboot.py."""
+        return self.reboot(index * slot, opcode, wait)
+
     def load2(self, bs):
         self.LoadBSIRthenBSDR(self.JPROGRAM, None)
         self.pulseTCK(10000)
@@ -487,342 +1159,69 @@ class XuLA(Jtag):
         return False
 
     # load FPGA with flash programmer
-    def configure(self, filename):
+    def configure(self, filename, progress = None):
         # Download the configuration bitstream to the FPGA.
-        self.progpin(1)
-        self.progpin(0)
-        self.progpin(1)
-        time.sleep(0.03)
+        self.progpulse()
         t = time.time()
-        status = self.load(BitFile(filename))
+        status = self.load(BitFile(filename), progress = progress)
         t = time.time() - t
         if self.verbose:
             print(f"Time to download bitstream = {elapsed(t)}")
         return status
 
-    # write bitstream to flash
-    def write_flash(self, bs, loAddr, doStart):
-    
-        self.flashpin(1)  # release uC hold on Flash chip
-
-        # download the USER instruction to the FPGA to enable the JTAG circuitry
-        self.initTAP()
-        self.assert_state("Shift-IR")
-        self.sendbs(self.USER1)
-        # go to the SHIFT-DR state where the Flash interface circuitry can be controlled
-        self.go_states(1,1,0,0)  # -> UpdateIR -> SelectDRScan -> CaptureDR -> ShiftDR
-        self.assert_state("Shift-DR")
-        # download the instruction that gets the interface capabilities from the FPGA
-        self.sendbs(INSTR_CAPABILITIES)
-        # readback the capabilities of the interface
-        self.go_states(0,1,0)    # -> PauseDR -> Exit2DR -> ShiftDR
-        self.assert_state("Shift-DR")
-        data = self.sendrecvbs(Bitstream(TDO_LENGTH, 0))
-        # check the capabilities to see if Flash writes are supported
-        flashIntfcAlreadyLoaded = self.has_capability(data, CAPABLE_FLASH_WRITE_BIT)
-
-        # only download the Flash interface if this is the first download of data to the Flash.
-        # otherwise the interface should already be in place.
-        if doStart and not flashIntfcAlreadyLoaded:
-            # configure the FPGA with the Flash interface circuit.
-            print("Loading the FPGA with the Flash interface circuit")
-            if not self.configure("fintf_jtag.bit"):
-                print("Error downloading Flash interface circuit!!")
-                return False
-        print()
-
-        # download the USER instruction to the FPGA to enable the JTAG circuitry
-        # that will be used to access the Flash
-        self.initTAP()
-        self.assert_state("Shift-IR")
-        self.sendbs(self.USER1)
-
-        # go to the SHIFT-DR state where the Flash interface circuitry can be controlled
-        self.go_states(1,1,0,0)
-        self.assert_state("Shift-DR")
-
-        # download the instruction that gets the Flash organization from the FPGA
-        self.sendbs(INSTR_FLASH_SIZE)
-
-        # readback the widths of the Flash address and data buses
-        self.go_states(0,1,0)    # -> PauseDR -> Exit2DR -> ShiftDR
-        self.assert_state("Shift-DR")
-        data = self.sendrecvbs(Bitstream(24, 0))
-        data = Bitstream(24, data)
-        w256 = [(b << (i & 7)) for (i, b) in enumerate(data)]
-        sizes = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)]) # convert to byte array
-        dataWidth = sizes[0]
-        addrWidth = sizes[1]
-        blockAddrWidth = sizes[2] # address width of the block RAM that holds data to be written to Flash
-        blockSize = 1 << blockAddrWidth
-        # blockAddrMask = ~(blockSize - 1)
-
-        # stride is the number of byte addresses that are contained in each Flash word address
-        stride = int(dataWidth / 8)  # stride is 1,2,4 for data bus width of 8, 16 or 32
-        # address mask zeroes the lower bits of the byte address for alignment to the Flash word size
-        addrMask = ~(stride - 1)
-
-        if self.verbose:
-            print(f"dataWidth = {dataWidth}")
-            print(f"addrWidth = {addrWidth}")
-            print(f"stride    = {stride}")
-            print(f"addrMask  = {addrMask}")
-            print(f"blockSize = {blockSize}")
-
-        if doStart:
-            # erase the flash chip
-            print("Erasing Flash", flush=True)
-            self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-            self.assert_state("Shift-DR")
-            self.sendbs(INSTR_FLASH_ERASE)
-            while True:
-                self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-                self.assert_state("Shift-DR")
-                data = self.sendrecvbs(Bitstream(TDO_LENGTH, 0))
-                if self.verbose:
-                    print("erase result = 0x%08x" % data)
-                time.sleep(0.5)
-                # simple progress indicator
-                print('.', end='', flush=True)
-                if data == OP_INPROGRESS:
-                    continue
-                if data == OP_FAILED:
-                    print("Flash erase failed!!")
-                    return False
-                break
-            print()
-
-        # download to Flash
-        print("Downloading data", flush=True)
-
-        address = loAddr  # start byte address
-        count   = 0       # count of bytes written
-
-        # load the whole file into a byte string for easier access
-        #bits = bs.tobytes()
-        m = array.array('B', bs.tobytes())
-        bits = array.array('B', [reverse_bits(c) for c in m.tolist()]).tobytes()
-
-        pbar = tqdm(total=len(bits),unit='bytes',colour='yellow')
-
-        while count < len(bits):
-
-            # fill buffer with next block from file
-            buf = bits[count:count+blockSize]
-
-            numBytes = len(buf)
-
-            if numBytes % stride:
-                # better pad the buffer with a few 0xFF bytes and proceed anyway...
-                print("Cannot download an odd number of bytes to multibyte-wide Flash!")
-                return False
+    def check_bitfile(self, bs, target):
+        """Validate BitFile bs against the selected device (see validate_bitfile())."""
+        if not isinstance(bs, BitFile):
+            return []
+        t = time.time()
+        idcode = self.chain[self.device].idcode if self.chain else None
+        warnings = bs.validate(idcode or None, target)
+        self.timings["validate"] = time.time() - t
+        return warnings
 
-            if address & ~addrMask:
-                print("Cannot download to multibyte-wide Flash using an odd byte-starting address!")
-                return False
+    # write bitstream to flash
+    def write_flash(self, bs, loAddr, doStart, progress = None):
+        """
+        Program BitFile (or Bitstream) bs into the flash from byte address
+        loAddr, erasing the chip first if doStart is set. Raises FlashError
+        if the flash cannot be programmed; returns True.
+        """
+        self.check_bitfile(bs, "flash")
+        with FlashSession(self, doStart, progress) as f:
+            if doStart:
+                # erase the flash chip
+                f.erase()
+            # download to Flash
+            if hasattr(bs, "chunks"):
+                f.write(loAddr, bs.chunks(), length = len(bs) // 8)
+            else:
+                f.write(loAddr, bs.tobytes())
+            self.flashstats = f.stats
+        return True
 
-            # download the buffer
+    def read_flash(self, filename, loAddr, hiAddr, doStart, progress = None):
+        """
+        Save flash bytes loAddr to hiAddr (inclusive) into filename. Raises
+        FlashError if the flash cannot be read; returns True.
+        """
+        with FlashSession(self, doStart, progress) as f:
+            numBytes = hiAddr - loAddr + 1      # number of bytes to upload to the file
             if self.verbose:
-                print("address  = 0x%08x" % address)
+                print(f"Reading Flash contents into {filename}")
+                print("wordAddr = 0x%08x" % (loAddr // f.stride))
                 print("numBytes =", numBytes)
+                print("numWords =", numBytes // f.stride)
 
-            # store the number of words that will be downloaded to Flash into the download instruction operands
-            numWords = int(numBytes / stride)
-            cnt = Bitstream(addrWidth, numWords)
-
-            # adjust the byte starting address for the Flash word size
-            wordAddr = int(address / stride)
-            # partition the word address into bytes and store in the operand storage area
-            addr = Bitstream(addrWidth, wordAddr)
-
-            # send the Flash download instruction and the Flash address and download length
-            ##payload = cnt + addr + INSTR_FLASH_PGM
-            self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-            self.assert_state("Shift-DR")
-            ##self.sendrecvbs(payload)
-            #self.sendbs(INSTR_FLASH_PGM)
-            #self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-            #self.assert_state("Shift-DR")
-            #self.sendbs(addr)
-            #self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-            #self.assert_state("Shift-DR")
-            #self.sendbs(cnt)
-            for d in INSTR_FLASH_PGM:
-                self.do_bit(tms = 0, tdi = d)
-            for d in addr:
-                self.do_bit(tms = 0, tdi = d)
-            for (is_lastbit, d) in islast(cnt):
-                self.do_bit(tms = is_lastbit, tdi = d)
-
-            # now download the data words to block RAM
-            data = BitstreamString(buf)  # len = 8 * numBytes
-            self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-            self.assert_state("Shift-DR")
             t = time.time()
-            self.sendbs(data)
+            databytes = f.read(loAddr, numBytes)
             t = time.time() - t
             if self.verbose:
-                print("Time to download", 8 * numBytes, "bits =", elapsed(t))
+                print(f"Time to upload {8 * numBytes} bits = {elapsed(t)}")
                 if t > 0:
-                    print("Transfer rate =", 8 * numBytes / t, "bps")
-
-            # wait until the block RAM contents are programmed into the Flash
-            while True:
-                self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-                self.assert_state("Shift-DR")
-                data = self.sendrecvbs(Bitstream(TDO_LENGTH, 0))
-                if self.verbose:
-                    print("block write result = 0x%08x" % data)
-                if data == OP_INPROGRESS:
-                    continue
-                if data == OP_FAILED:
-                    print("Download failed!!")
-                    return False
-                break
-
-            # simple progress bar
-            # print('.', end='', flush=True)
-            pbar.update(numBytes)
-
-            # compute the address for the next block
-            address += numBytes
-            count   += numBytes
-
-        self.flashpin(0)
-        pbar.close()
-
-        return True
-
-    def read_flash(self, filename, loAddr, hiAddr, doStart):
-
-        self.flashpin(1)  # release uC hold on flash chip
-
-        # create the output file
-        outf = open(filename, "wb")
-
-        # download the USER instruction to the FPGA to enable the JTAG circuitry
-        self.initTAP()
-        self.assert_state("Shift-IR")
-        self.sendbs(self.USER1)
-        # go to the SHIFT-DR state where the Flash interface circuitry can be controlled
-        self.go_states(1,1,0,0) # -> UpdateIR -> SelectDRScan -> CaptureDR -> ShiftDR
-        self.assert_state("Shift-DR")
-        # download the instruction that gets the interface capabilities from the FPGA
-        self.sendbs(INSTR_CAPABILITIES)
-        # readback the capabilities of the interface
-        self.go_states(0,1,0) # -> PauseDR -> Exit2DR -> ShiftDR
-        data = self.sendrecvbs(Bitstream(TDO_LENGTH, 0))
-        # check the capabilities to see if Flash reads are supported
-        flashIntfcAlreadyLoaded = self.has_capability(data, CAPABLE_FLASH_READ_BIT)
-
-        if self.verbose:
-            print("CAPABILITIES = 0x%08x" % data)
-
-        # only download the Flash interface if this is the first upload of data from the Flash.
-        # Otherwise the interface should already be in place.
-        if doStart and not flashIntfcAlreadyLoaded:
-            # configure the FPGA with the Flash interface circuit.
-            print("Loading the FPGA with the Flash interface circuit")
-            if not self.configure("fintf_jtag.bit"):
-                print("Error configuring FPGA with Flash programming circuit!")
-                return False
-
-        # download the USER instruction to the FPGA to enable the JTAG circuitry
-        # that will be used to access the Flash
-        self.initTAP()
-        self.assert_state("Shift-IR")
-        self.sendbs(self.USER1)
-
-        # go to the SHIFT-DR state where the Flash interface circuitry can be controlled
-        self.go_states(1,1,0,0) # -> UpdateIR -> SelectDRScan -> CaptureDR -> ShiftDR
-        self.assert_state("Shift-DR")
-
-        # download the instruction that gets the Flash organization from the FPGA
-        self.sendbs(INSTR_FLASH_SIZE)
-
-        # readback the widths of the Flash address and data buses
-        self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-        self.assert_state("Shift-DR")
-        data = self.sendrecvbs(Bitstream(24, 0))
-        data = Bitstream(24, data)
-        w256 = [(b << (i & 7)) for (i, b) in enumerate(data)]
-        sizes = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)])
-        dataWidth = sizes[0]
-        addrWidth = sizes[1]
-        blockAddrWidth = sizes[2] # address width of the block RAM that holds data to be written to Flash
-
-        # stride is the number of byte addresses that are contained in each Flash word address
-        stride = int(dataWidth / 8)    # stride is 1,2,4 for data bus width of 8, 16 or 32
-        # address mask zeroes the lower bits of the byte address for alignment to the Flash word size
-        addrMask = ~(stride - 1)
-
-        if self.verbose:
-            print(f"dataWidth      = {dataWidth}")
-            print(f"addrWidth      = {addrWidth}")
-            print(f"stride         = {stride}")
-            print(f"addrMask       = {addrMask}")
-            print(f"blockAddrWidth = {blockAddrWidth}")
-
-        # check address and length of the upload byte address range to make sure it aligns with Flash word size
-        if (hiAddr-loAddr+1) % stride:
-            print("Cannot upload an odd number of bytes from multibyte-wide Flash!")
-            return False
-        if loAddr & ~addrMask:
-            print("Cannot upload from multibyte-wide Flash using an odd byte-starting address!")
-            return False
-
-        print(f"Reading Flash contents into {filename}")
-
-        # read blocks Flash and save them into the output file
-        wordAddr = int(loAddr / stride)     # address of word in Flash
-        numBytes = hiAddr - loAddr + 1      # number of bytes to upload to the hex file
-        numWords = int(numBytes / stride)   # number of Flash words to upload
-
-        # if self.verbose:
-        if True:
-            print("wordAddr = 0x%08x" % wordAddr)
-            print("numBytes =", numBytes)
-            print("numWords =", numWords)
-
-        # partition the word address into bytes and store in the operand storage area
-        addr = Bitstream(addrWidth, wordAddr)
-        # store the number of words that will be uploaded from Flash into the upload instruction operands
-        cnt = Bitstream(addrWidth, numWords)
-
-        # send the Flash upload instruction and the Flash address and upload length
-        ##payload = cnt + addr + INSTR_FLASH_READ
-        self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-        self.assert_state("Shift-DR")
-        ##self.sendrecvbs(payload)
-        for d in INSTR_FLASH_READ:
-            self.do_bit(tms = 0, tdi = d)
-        for d in addr:
-            self.do_bit(tms = 0, tdi = d)
-        for (is_lastbit, d) in islast(cnt):
-            self.do_bit(tms = is_lastbit, tdi = d)
-
-        # now upload the data words from Flash
-        self.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
-        self.assert_state("Shift-DR")
-        t = time.time()
-        data = self.sendrecvbs(Bitstream(8 * numBytes, 0))
-        t = time.time() - t
-        # if self.verbose:
-        if True:
-            print(f"Time to upload {8 * numBytes} bits = {elapsed(t)}")
-            print(f"Transfer rate = {8 * numBytes / t} bps")
-            # print(f"Data : {data}")
-
-        # convert uploaded data from bitstream into a byte string
-        data = Bitstream(8 * numBytes, data)
-        w256 = [(b << (i & 7)) for (i, b) in enumerate(data)]
-        databytes = array.array('B', [sum(w256[i:i+8]) for i in range(0, len(w256), 8)]) #.tobytes()
-
-        outf.write(databytes)
-        outf.close()  # close-up the output file
-        
-        self.flashpin(0)
+                    print(f"Transfer rate = {8 * numBytes / t} bps")
 
+        with open(filename, "wb") as outf:
+            outf.write(databytes)
         return True
 
     # Added -- HP
@@ -831,13 +1230,12 @@ class XuLA(Jtag):
             self.rti()
             self.go_states(1,1,0,0)
         self.assert_state("Shift-IR")
-        self.sendbs(self.USER1)
+        self.sendir(self.USER1)
         self.go_states(1,1,0,0)
         self.assert_state("Shift-DR")
-        self.do_nbit_cycle(8, id)
-        self.do_nbit_cycle(32, len(payload) + resplen) # number of payload bits
-        for d in payload:
-            self.do_bit(tms = 0, tdi = d)
+        self.send_nbit_cycle(8, id)
+        self.send_nbit_cycle(32, len(payload) + resplen) # number of payload bits
+        self.ticks([(0, d) for d in payload])
         r = None
         if recv:
             r = self.sendrecvbs(Bitstream(16, 0))
@@ -863,6 +1261,456 @@ class XuLA(Jtag):
     def dutread(self, id, nvalues):
         return self.hostio(id, Bitstream(34, 0x300000000 + nvalues), nvalues, recv = True)
 
+    def dutreadbytes(self, id, nvalues, width):
+        """
+        Read nvalues DUT output samples of width bits each in one TDO transfer.
+        Returns the raw bits packed LSB first, first sample in the lowest bits.
+        """
+        nbits = nvalues * width
+        if self.state() != "Shift-IR":
+            self.rti()
+            self.go_states(1,1,0,0)
+        self.assert_state("Shift-IR")
+        self.sendir(self.USER1)
+        self.go_states(1,1,0,0)
+        self.assert_state("Shift-DR")
+        self.send_nbit_cycle(8, id)
+        self.send_nbit_cycle(32, 34 + nbits)
+        self.ticks([(0, d) for d in Bitstream(34, 0x300000000 + nvalues)])
+        r = self.bulktdo(nbits)
+        self.go_states(1, 0)
+        self.assert_state("Run-Test/Idle")
+        return r
+
     def dutwrite(self, id, values):
         # TODO
         return
+
+    # Byte-wide test vectors driven by the uC.
+
+    def send_vector(self, v):
+        """Apply a single test vector and return the vector echoed by the firmware."""
+        self.sync()
+        self.send(mkbytes(SINGLE_TEST_VECTOR_CMD, v & 0xff), 1000)
+        r = self.recv(2, 1000)
+        return r[1]
+
+    def get_vector(self):
+        """Return the test vector currently being output."""
+        self.sync()
+        self.send(mkbytes(GET_TEST_VECTOR_CMD), 1000)
+        r = self.recv(2, 1000)
+        return r[1]
+
+    def send_vectors(self, vectors, readback = False, progress = None):
+        """
+        Apply a sequence of byte-wide test vectors (any iterable of ints,
+        bytes or array). The commands are packed VECTORS_PER_PACKET to a
+        USB packet. Without readback the firmware replies are disabled (see
+        sync()), so the vectors go out XFER_CHUNK bytes at a time at link
+        speed with no reads at all. With readback every command is answered
+        by its own 2-byte packet, so the echoes of each USB packet of
+        commands are read before the next one is sent. Returns a VectorRun.
+        """
+        data = bytes(vectors) if not isinstance(vectors, (bytes, bytearray)) else vectors
+        n = len(data)
+        cmds = bytearray(2 * n)
+        cmds[0::2] = bytes([SINGLE_TEST_VECTOR_CMD]) * n
+        cmds[1::2] = data
+        ph = phase(progress, "vectors", n)
+        responses = bytearray(n) if readback else None
+        t = time.time()
+        view = memoryview(cmds)
+        if readback:
+            self.sync()
+            rx = array.array('B', bytes(2))
+            for i in range(0, n, VECTORS_PER_PACKET):
+                k = min(VECTORS_PER_PACKET, n - i)
+                self.send(view[2 * i:2 * (i + k)], 1000)
+                for j in range(i, i + k):
+                    if self.recvinto(rx, 1000) != 2 or rx[0] != SINGLE_TEST_VECTOR_CMD:
+                        raise DeviceError(f"Bad reply {bytes(rx).hex()} to test vector {j}")
+                    responses[j] = rx[1]
+                ph.update(k)
+        else:
+            if not self.quiet:
+                self.send(mkbytes(DISABLE_RETURN_CMD), 1000)
+                self.quiet = True
+            for i in range(0, len(cmds), XFER_CHUNK):
+                chunk = view[i:i + XFER_CHUNK]
+                k = len(chunk)
+                self.send(chunk, 1000 + k // 32)
+                ph.update(k // 2)
+        t = time.time() - t
+        self.timings["vectors"] = t
+        return VectorRun(n, bytes(responses) if readback else None, t)
+
+
+class FlashError(Exception):
+    def __init__(self, msg):
+        self.message = msg
+    def __str__(self):
+        return self.message
+
+def reblock(chunks, size):
+    """Regroup an iterable of byte chunks into blocks of size bytes; the last one may be shorter."""
+    buf = bytearray()
+    for c in chunks:
+        buf += c
+        while len(buf) >= size:
+            yield bytes(buf[:size])
+            del buf[:size]
+    if buf:
+        yield bytes(buf)
+
+class ProgramStats:
+    """
+    Cost of a FlashSession.write(): blocks programmed, status polls and USB
+    transfers (writes and reads) issued, and the time taken.
+    """
+    def __init__(self, nbytes, blocks, polls, writes, reads, t):
+        self.bytes = nbytes
+        self.blocks = blocks
+        self.polls = polls
+        self.writes = writes
+        self.reads = reads
+        self.elapsed = t
+
+    @property
+    def transfers_per_block(self):
+        return (self.writes + self.reads) / self.blocks if self.blocks else 0.0
+
+    @property
+    def block_time(self):
+        """Seconds per block, header, data and status polls included."""
+        return self.elapsed / self.blocks if self.blocks else 0.0
+
+    def __repr__(self):
+        return "<ProgramStats bytes=%d blocks=%d polls=%d transfers/block=%.1f block=%.2fms>" % (
+            self.bytes, self.blocks, self.polls, self.transfers_per_block, 1000 * self.block_time)
+
+class FlashSession:
+    """
+    Access to the configuration flash through the USER1 flash interface
+    circuit. The interface is probed (and loaded from fintf_jtag.bit if
+    doStart is set) and its geometry read once when the session opens;
+    afterwards the TAP stays in the DR scan of USER1 until the session is
+    closed and the flash released to the uC. progress is the default
+    ProgressEvent callback for the operations of the session.
+
+        with FlashSession(xula) as f:
+            hdr = f.read(0, 64)
+    """
+    def __init__(self, xula, doStart = True, progress = None):
+        self.x = xula
+        self.doStart = doStart
+        self.progress = progress
+        self.dataWidth = None
+        self.addrWidth = None
+        self.blockSize = None
+        self.stride = None
+        self.addrMask = None
+        self.polls = 0          # status polls issued by wait()
+        self.stats = None       # ProgramStats of the last write()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    def user1(self):
+        """Load USER1 and go to Shift-DR where the Flash interface circuitry can be controlled."""
+        x = self.x
+        x.initTAP()
+        x.assert_state("Shift-IR")
+        x.sendir(x.USER1)
+        x.go_states(1,1,0,0)  # -> UpdateIR -> SelectDRScan -> CaptureDR -> ShiftDR
+        x.assert_state("Shift-DR")
+
+    def next(self):
+        """Go back to Shift-DR for the next operand."""
+        self.x.go_states(0,1,0)  # -> PauseDR -> Exit2DR -> ShiftDR
+        self.x.assert_state("Shift-DR")
+
+    def capabilities(self):
+        """Ask the USER1 interface circuit in the FPGA for its capabilities word."""
+        x = self.x
+        self.user1()
+        x.sendbs(INSTR_CAPABILITIES)
+        self.next()
+        caps = x.sendrecvbs(Bitstream(TDO_LENGTH, 0))
+        if x.verbose:
+            print("CAPABILITIES = 0x%08x" % caps)
+        return caps
+
+    def capable(self, caps):
+        """True if caps is from an interface circuit that can read and write the Flash."""
+        return (self.x.has_capability(caps, CAPABLE_FLASH_WRITE_BIT) and
+                self.x.has_capability(caps, CAPABLE_FLASH_READ_BIT))
+
+    def open(self):
+        """
+        Release the flash from the uC and read the interface geometry. Raises
+        FlashError if the FPGA holds no flash interface and doStart is not
+        set; the flash goes back to the uC whenever open() fails.
+        """
+        x = self.x
+        x.flashpin(1)  # release uC hold on Flash chip
+        try:
+            self.probe()
+        except BaseException:
+            x.flashpin(0)
+            raise
+
+    def probe(self):
+        x = self.x
+        # get the interface capabilities from the FPGA
+        caps = self.capabilities()
+
+        # only download the Flash interface if it is not already in place
+        if not self.capable(caps):
+            if not self.doStart:
+                raise FlashError("The FPGA does not hold the Flash interface circuit")
+            if x.verbose:
+                print("Loading the FPGA with the Flash interface circuit")
+            x.configure("fintf_jtag.bit", self.progress)
+
+        # readback the widths of the Flash address and data buses
+        self.user1()
+        x.sendbs(INSTR_FLASH_SIZE)
+        self.next()
+        sizes = x.sendrecvbs(Bitstream(24, 0)).to_bytes(3, "little")
+        self.dataWidth = sizes[0]
+        self.addrWidth = sizes[1]
+        # address width of the block RAM that holds data to be written to Flash
+        self.blockSize = 1 << sizes[2]
+        # stride is the number of byte addresses that are contained in each Flash word address
+        self.stride = max(1, self.dataWidth // 8)  # stride is 1,2,4 for data bus width of 8, 16 or 32
+        # address mask zeroes the lower bits of the byte address for alignment to the Flash word size
+        self.addrMask = ~(self.stride - 1)
+
+        if x.verbose:
+            print(f"dataWidth = {self.dataWidth}")
+            print(f"addrWidth = {self.addrWidth}")
+            print(f"stride    = {self.stride}")
+            print(f"addrMask  = {self.addrMask}")
+            print(f"blockSize = {self.blockSize}")
+
+    def close(self):
+        self.x.flashpin(0)
+
+    def command(self, instr, address, numBytes):
+        """Send a Flash instruction with its word address and word count operands."""
+        aw = self.addrWidth
+        cmd = Bitstream(len(instr) + 2 * aw,
+                        instr.val | ((address // self.stride) << len(instr)) |
+                        ((numBytes // self.stride) << (len(instr) + aw)))
+        self.next()
+        self.x.sendbs(cmd)
+
+    def wait(self, interval = 0, tick = None):
+        """Poll the interface until the current operation is finished, return True if it passed."""
+        while True:
+            self.next()
+            self.polls += 1
+            data = self.x.sendrecvbs(Bitstream(TDO_LENGTH, 0))
+            if self.x.verbose:
+                print("result = 0x%08x" % data)
+            if data != OP_INPROGRESS:
+                return data != OP_FAILED
+            if tick is not None:
+                tick()
+            if interval:
+                time.sleep(interval)
+
+    def check(self, address, numBytes):
+        if numBytes % self.stride:
+            raise FlashError("Cannot access an odd number of bytes in multibyte-wide Flash!")
+        if address & ~self.addrMask:
+            raise FlashError("Cannot access multibyte-wide Flash using an odd byte-starting address!")
+
+    def erase(self, progress = None):
+        """Erase the entire Flash chip."""
+        p = phase(progress or self.progress, "erase")
+        self.next()
+        self.x.sendbs(INSTR_FLASH_ERASE)
+        if not self.wait(0.5, lambda: p.update(1)):
+            raise FlashError("Flash erase failed!!")
+
+    def write(self, address, data, progress = None, length = None):
+        """
+        Program data into the Flash starting at byte address, one block RAM
+        load at a time. data is a bytes-like object, or an iterable of
+        chunks (such as BitFile.chunks()) holding length bytes in all.
+        The command, the block data and the first status poll of each block
+        go out in one USB transfer; the cost is left in self.stats as a
+        ProgramStats.
+        """
+        if length is None:
+            length = len(data)
+            view = memoryview(data)
+            data = (view[i:i + self.blockSize] for i in range(0, length, self.blockSize))
+        else:
+            data = reblock(data, self.blockSize)
+        self.check(address, length)
+        x = self.x
+        p = phase(progress or self.progress, "program", length)
+        t = time.time()
+        (writes, reads, polls) = (x.usbwrites, x.usbreads, self.polls)
+        blocks = 0
+        count = 0
+        for buf in data:
+            numBytes = len(buf)
+            if x.verbose:
+                print("address  = 0x%08x" % (address + count))
+                print("numBytes =", numBytes)
+            with x.batched():
+                self.command(INSTR_FLASH_PGM, address + count, numBytes)
+                # now download the data words to block RAM
+                self.next()
+                x.bulktdibytes(buf, 8 * numBytes)
+                # wait until the block RAM contents are programmed into the Flash
+                ok = self.wait()
+            if not ok:
+                raise FlashError("Download failed!!")
+            blocks += 1
+            count += numBytes
+            p.update(numBytes)
+        self.stats = ProgramStats(length, blocks, self.polls - polls,
+                                  x.usbwrites - writes, x.usbreads - reads, time.time() - t)
+        x.timings["program"] = self.stats.elapsed
+
+    def read(self, address, numBytes, progress = None):
+        """Read numBytes bytes from the Flash starting at byte address."""
+        self.check(address, numBytes)
+        if numBytes == 0:
+            return b""
+        self.command(INSTR_FLASH_READ, address, numBytes)
+        self.next()
+        progress = progress or self.progress
+        self.x.xferphase = phase(progress, "read", numBytes) if progress else None
+        try:
+            return self.x.bulktdo(8 * numBytes)
+        finally:
+            self.x.xferphase = None
+
+    def verify(self, address, data):
+        """Return True if the Flash contents at address match data."""
+        return self.read(address, len(data)) == bytes(data)
+
+    def size(self):
+        """Size of the Flash address space in bytes."""
+        return self.stride << self.addrWidth
+
+    def reader(self, **kw):
+        """Return a FlashReader over this session."""
+        return FlashReader(self, **kw)
+
+class FlashReader:
+    """
+    Read-only, seekable file-like view of the Flash over an open FlashSession.
+    Data is fetched in aligned blocks through INSTR_FLASH_READ and kept in a
+    bounded LRU cache; sequential reads fetch readahead blocks per transfer.
+    Supports read(), seek(), tell() and slicing: reader[0x1000:0x1100].
+    """
+    def __init__(self, session, size = None, blockSize = 1024, cacheBlocks = 64, readahead = 8):
+        assert blockSize % session.stride == 0
+        self.session = session
+        self.length = size if size is not None else session.size()
+        self.blockSize = blockSize
+        self.cacheBlocks = max(cacheBlocks, readahead)
+        self.readahead = max(1, readahead)
+        self.cache = collections.OrderedDict()  # block number -> bytes
+        self.pos = 0
+        self.last = None        # last block fetched, to detect sequential access
+        self.transfers = 0      # number of Flash reads issued
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence = os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.length
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        self.pos = offset
+        return self.pos
+
+    def block(self, n):
+        """Return block n, fetching it (and readahead blocks when sequential) if needed."""
+        data = self.cache.get(n)
+        if data is not None:
+            self.cache.move_to_end(n)
+            return data
+        count = self.readahead if self.last is not None and n == self.last + 1 else 1
+        start = n * self.blockSize
+        end = min(start + count * self.blockSize, self.length)
+        # a read ending at the end of a multibyte-wide Flash still covers whole words
+        end += -end % self.session.stride
+        buf = self.session.read(start, end - start)
+        self.transfers += 1
+        for i in range(0, len(buf), self.blockSize):
+            self.cache[n + i // self.blockSize] = buf[i:i + self.blockSize]
+            self.last = n + i // self.blockSize
+        while len(self.cache) > self.cacheBlocks:
+            self.cache.popitem(last = False)
+        return self.cache.get(n, buf[:self.blockSize])
+
+    def pread(self, offset, n):
+        """Read n bytes at offset without moving the file position."""
+        end = min(offset + n, self.length)
+        r = bytearray()
+        while offset < end:
+            (b, o) = divmod(offset, self.blockSize)
+            chunk = self.block(b)[o:o + end - offset]
+            r += chunk
+            offset += len(chunk)
+        return bytes(r)
+
+    def read(self, n = -1):
+        if n is None or n < 0:
+            n = self.length - self.pos
+        r = self.pread(self.pos, n)
+        self.pos += len(r)
+        return r
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            r = range(*key.indices(self.length))
+            if not r:
+                return b""
+            if r.step == 1:
+                return self.pread(r.start, len(r))
+            # read the span covered by the slice once and pick the bytes out of it
+            (lo, hi) = (min(r[0], r[-1]), max(r[0], r[-1]))
+            data = self.pread(lo, hi + 1 - lo)
+            return bytes(data[i - lo] for i in r)
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError("flash index out of range")
+        return self.pread(key, 1)[0]